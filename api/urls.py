@@ -8,4 +8,8 @@ urlpatterns = [
     path('produtos-padrao/', views.create_produto_padrao, name='api_create_produto'),
     path('moldes/<int:pk>/', views.get_molde, name='api_get_molde'),
     path('produtos-padrao/<int:pk>/', views.get_produto_padrao, name='api_get_produto'),
+    path('encaixe/', views.nest, name='api_nest'),
+    path('pedido-itens/<int:item_id>/encaixe/', views.nest_item, name='api_nest_item'),
+    path('consumo-larguras/', views.fabric_width_sweep, name='api_fabric_width_sweep'),
+    path('entradas-estoque/', views.import_stock_receipts, name='api_import_stock_receipts'),
 ]
@@ -1,10 +1,17 @@
 from django.http import JsonResponse, HttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
+import io
 import json
 from inventory.models import Material
+from inventory.services.receipts import FORMAT_CSV, FORMAT_JSON, FORMATS as RECEIPT_FORMATS, ReceiptImportError, guess_format, import_receipts
 from molds.models import Molde, MoldeDetalhe
 from products.models import Produto, ProdutoInsumo, ItensMaterial
+from sales.models import Pedido, PedidoItem
+from sales.services.marker import get_item_fabric_width, nest_order_item
+from sales.services.width_sweep import parse_widths, width_sweep
+from encaixe.services import geometry_kernel as gk
+from encaixe.services.nesting import check_placements, nest_pieces
 from django.db import transaction
 
 def get_token(request):
@@ -164,3 +171,133 @@ def get_produto_padrao(request, pk):
         })
     except Produto.DoesNotExist:
         return JsonResponse({'error': 'Not found'}, status=404)
+
+@check_auth
+def nest_item(request, item_id):
+    """
+    Nesting of an order item.
+    Query params: quantidade (default: item quantity), largura (forces one roll width, mm),
+    engine ('skyline' = bbox preview, 'true_shape' = no-fit polygons),
+    zoom (px per mm) or largura_px (drawing width of the roll): the returned outlines
+    are simplified to that scale; the nesting always uses the full geometry.
+    At most ENCAIXE_NESTING_MAX_PLACEMENTS copies per request, like `nest`.
+    """
+    try:
+        item = PedidoItem.objects.select_related('produto', 'molde').get(id=item_id)
+    except PedidoItem.DoesNotExist:
+        return JsonResponse({'error': 'Not found'}, status=404)
+
+    try:
+        quantity = int(request.GET['quantidade']) if request.GET.get('quantidade') else None
+        fabric_width = float(request.GET['largura']) if request.GET.get('largura') else None
+        mm_per_px = None
+        if request.GET.get('zoom') or request.GET.get('largura_px'):
+            zoom = float(request.GET['zoom']) if request.GET.get('zoom') else None
+            width_px = float(request.GET['largura_px']) if request.GET.get('largura_px') else None
+            if (zoom or width_px or 0) <= 0:
+                raise ValueError('zoom and largura_px must be positive')
+            mm_per_px = 1 / zoom if zoom else (fabric_width or get_item_fabric_width(item)) / width_px
+        result = nest_order_item(
+            item, quantity=quantity, fabric_width=fabric_width, engine=request.GET.get('engine'), mm_per_px=mm_per_px,
+        )
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    result['pedido_item_id'] = item.id
+    return JsonResponse(result)
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@check_auth
+def nest(request):
+    """
+    Nesting of arbitrary pieces.
+    Body: {"pecas": [{"id", "name", "qty", "w", "h", "fabric_name", "color_name", "color", "fabric_width",
+                      "rotacao_fixa", "orientacao_fio", "pts": [[x, y], ...]}],
+           "quantidade": 1, "largura": 1500, "engine": "skyline" | "true_shape"}
+    At most ENCAIXE_NESTING_MAX_PLACEMENTS copies (qty x quantidade) per request.
+    """
+    try:
+        data = json.loads(request.body)
+        pieces = data.get('pecas', [])
+        quantity = int(data.get('quantidade', 1))
+        check_placements(pieces, quantity)
+        for p in pieces:
+            # The layout cache trusts geometry_hash: never take it from the client
+            p.pop('geometry_hash', None)
+            p['w'] = float(p['w'])
+            p['h'] = float(p['h'])
+            if p.get('pts'):
+                p['pts'] = gk.to_tuples(gk.as_array(p['pts']))
+        result = nest_pieces(
+            pieces,
+            quantity=quantity,
+            fabric_width=data.get('largura'),
+            engine=data.get('engine'),
+        )
+        return JsonResponse(result)
+    except (ValueError, KeyError, TypeError) as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+@check_auth
+def fabric_width_sweep(request):
+    """
+    Fabric consumption of a set of orders for several candidate roll widths.
+    Query params: pedidos (ids, comma separated), larguras (mm or m, comma separated),
+    materiais (optional material ids).
+    """
+    try:
+        order_ids = [int(i) for i in request.GET.get('pedidos', '').split(',') if i.strip()]
+        widths = parse_widths(request.GET.get('larguras'))
+        material_ids = [int(i) for i in request.GET.get('materiais', '').split(',') if i.strip()]
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    sweep = width_sweep(Pedido.objects.filter(id__in=order_ids), widths, material_ids=material_ids or None)
+    return JsonResponse({
+        'larguras_mm': sweep['widths'],
+        'linhas': [
+            {
+                'material_id': row['material'].id,
+                'material': row['material'].nome,
+                'cor_id': row['cor'].id if row['cor'] else None,
+                'cor': row['cor'].nome if row['cor'] else None,
+                'largura_atual_mm': row['current_width'],
+                'metros_atual': row['current_mm'] / 1000.0,
+                'metros': [mm / 1000.0 for mm in row['mm']],
+            }
+            for row in sweep['rows']
+        ],
+    })
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@check_auth
+def import_stock_receipts(request):
+    """
+    Bulk stock receipt (supplier delivery). The file goes in the multipart
+    field 'arquivo' or as the request body (text/csv, application/json or
+    JSON Lines). Optional query params: formato (csv|json), fornecedor.
+    """
+    arquivo = request.FILES.get('arquivo')
+    if arquivo:
+        stream = io.TextIOWrapper(arquivo.file, encoding='utf-8-sig', newline='')
+        fmt = guess_format(arquivo.name)
+    else:
+        stream = io.StringIO(request.body.decode('utf-8-sig'), newline='')
+        fmt = FORMAT_JSON if 'json' in request.content_type else FORMAT_CSV
+    fmt = request.GET.get('formato', fmt)
+    if fmt not in RECEIPT_FORMATS:
+        return JsonResponse({'error': f'Unknown format: {fmt}'}, status=400)
+
+    try:
+        result = import_receipts(stream, fmt, request.GET.get('fornecedor', ''))
+    except ReceiptImportError as e:
+        return JsonResponse({
+            'error': str(e),
+            'linhas_invalidas': [{'linha': line, 'erro': message} for line, message in e.errors],
+        }, status=400)
+    except (UnicodeDecodeError, ValueError) as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    return JsonResponse({'linhas': result['linhas'], 'pares': len(result['quantidades'])}, status=201)
@@ -88,7 +88,15 @@ DATABASES = {
         'NAME': BASE_DIR / 'db.sqlite3',
         'OPTIONS': {
             'timeout': 20,
-        }
+            # Writers take the lock when the transaction begins and wait on
+            # `timeout`, instead of failing when a reader upgrades to writer
+            'transaction_mode': 'IMMEDIATE',
+        },
+        # File based test database: the in-memory one fails concurrent
+        # writers at once ("table is locked") instead of waiting on the lock
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
@@ -21,6 +21,7 @@ urlpatterns = [
     # MLD Project Views
     path('project/detail/', mld.detalhe_projeto_view, name='project_detail'),
     path('project/cover/', mld.capa_projeto_view, name='project_cover'),
+    path('project/list/', mld.lista_projetos_view, name='project_list'),
 
     # Legacy / Misc
     path('visualize/', legacy.visualize_encaixe, name='visualize_encaixe'),
@@ -0,0 +1,105 @@
+import json
+import math
+import time
+
+from django.core.management.base import BaseCommand
+
+from encaixe.services import geometry_kernel as gk
+from encaixe.services.geometry import piece_points, polygon_area
+from encaixe.services.skyline import skyline_layout
+from encaixe.services.true_shape import allowed_rotations, true_shape_layout
+from molds.models import MoldeDetalhe
+
+
+def _synthetic_pieces():
+    """Trapezoids, a triangle, a rectangle and a circle: the shapes where bbox nesting wastes most."""
+    circle = [(150 * math.cos(i * math.pi / 16), 150 * math.sin(i * math.pi / 16)) for i in range(32)]
+    return [
+        {'name': 'Corpo (trapézio)', 'pts': [(0, 0), (420, 0), (380, 610), (40, 610)], 'qty': 2, 'rotacao_fixa': True},
+        {'name': 'Fole (trapézio)', 'pts': [(0, 0), (120, 0), (90, 480), (30, 480)], 'qty': 2, 'rotacao_fixa': False},
+        {'name': 'Aba (triângulo)', 'pts': [(0, 0), (300, 0), (0, 220)], 'qty': 2, 'rotacao_fixa': False},
+        {'name': 'Fundo (retângulo)', 'pts': [(0, 0), (320, 0), (320, 150), (0, 150)], 'qty': 1, 'rotacao_fixa': True},
+        {'name': 'Tampa (círculo)', 'pts': circle, 'qty': 1, 'rotacao_fixa': False},
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Compares the bbox (skyline) and true-shape (NFP) nesting engines: marker length, fabric utilisation and runtime'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--molde', type=int, action='append', help='Molde id to benchmark (repeatable). Default: synthetic pieces')
+        parser.add_argument('--quantities', type=str, default='5,20,50', help='Comma separated product quantities')
+        parser.add_argument('--width', type=float, default=1500, help='Roll width (mm)')
+        parser.add_argument('--json', action='store_true', help='Machine-readable output')
+
+    def _pieces(self, molde_ids):
+        if not molde_ids:
+            return _synthetic_pieces()
+        pieces = []
+        for peca in MoldeDetalhe.objects.filter(molde_id__in=molde_ids).order_by('molde_id', 'id'):
+            pts = piece_points(peca.geometria_json or {})
+            if len(pts) >= 3:
+                pieces.append({
+                    'name': peca.nome_original,
+                    'pts': pts,
+                    'qty': peca.qtd_padrao or 1,
+                    'rotacao_fixa': peca.rotacao_fixa,
+                    'orientacao_fio': peca.orientacao_fio,
+                })
+        return pieces
+
+    def handle(self, *args, **options):
+        width = options['width']
+        quantities = [int(q) for q in options['quantities'].split(',') if q.strip()]
+        pieces = self._pieces(options['molde'])
+        if not pieces:
+            self.stderr.write(self.style.ERROR('No pieces with geometry found.'))
+            return
+
+        areas = [polygon_area(p['pts']) for p in pieces]
+        sizes = [gk.bbox_size(gk.as_array(p['pts'])) for p in pieces]
+        shapes = [(p['pts'], allowed_rotations(p.get('rotacao_fixa'), p.get('orientacao_fio'))) for p in pieces]
+
+        results = []
+        for quantity in quantities:
+            counts = [p['qty'] * quantity for p in pieces]
+            used_area = sum(a * c for a, c in zip(areas, counts))
+
+            for engine, run in (
+                ('skyline', lambda: skyline_layout(sizes, counts, width)),
+                ('true_shape', lambda: true_shape_layout(shapes, counts, width)),
+            ):
+                start = time.perf_counter()
+                layout = run()
+                elapsed = time.perf_counter() - start
+
+                length = layout['length_mm']
+                results.append({
+                    'engine': engine,
+                    'quantity': quantity,
+                    'pieces': sum(counts),
+                    'length_mm': round(length, 1),
+                    'utilisation': round(used_area / (width * length), 4) if length else 0.0,
+                    'seconds': round(elapsed, 4),
+                })
+
+        if options['json']:
+            self.stdout.write(json.dumps({'width': width, 'results': results}, indent=2))
+            return
+
+        self.stdout.write(f"Roll width {width:.0f} mm, {len(pieces)} distinct pieces")
+        self.stdout.write(f"{'engine':<12}{'qty':>6}{'pieces':>8}{'length (m)':>12}{'util.':>8}{'time (s)':>10}")
+        for r in results:
+            self.stdout.write(
+                f"{r['engine']:<12}{r['quantity']:>6}{r['pieces']:>8}{r['length_mm'] / 1000:>12.2f}"
+                f"{r['utilisation'] * 100:>7.1f}%{r['seconds']:>10.3f}"
+            )
+
+        by_key = {(r['engine'], r['quantity']): r for r in results}
+        for quantity in quantities:
+            bbox = by_key[('skyline', quantity)]['length_mm']
+            shape = by_key[('true_shape', quantity)]['length_mm']
+            if bbox:
+                self.stdout.write(self.style.SUCCESS(
+                    f"qty {quantity}: true-shape saves {(1 - shape / bbox) * 100:.1f}% of fabric"
+                ))
@@ -1,8 +1,9 @@
 import json
-import math
 from django.core.management.base import BaseCommand
 import os
 
+from encaixe.services.geometry import piece_area
+
 class Command(BaseCommand):
     help = 'Calculates fabric usage based on a mold JSON file'
 
@@ -44,34 +45,8 @@ class Command(BaseCommand):
             name = piece.get('name')
             qty_per_item = piece.get('qty', 1)
             geom = piece.get('geom', {})
-            geom_type = geom.get('type')
-            
-            area_mm2 = 0.0
 
-            if geom_type == 'poly':
-                pts = geom.get('pts', [])
-                # Shoelace formula for polygon area
-                n = len(pts)
-                if n > 2:
-                    sum1 = 0
-                    sum2 = 0
-                    for i in range(n - 1):
-                        sum1 += pts[i]['x'] * pts[i+1]['y']
-                        sum2 += pts[i]['y'] * pts[i+1]['x']
-                    # Add last point connection to first
-                    sum1 += pts[n-1]['x'] * pts[0]['y']
-                    sum2 += pts[n-1]['y'] * pts[0]['x']
-                    area_mm2 = 0.5 * abs(sum1 - sum2)
-            
-            elif geom_type == 'rect':
-                # Rect defined by halfW and halfH
-                w = geom.get('halfW', 0) * 2
-                h = geom.get('halfH', 0) * 2
-                area_mm2 = w * h
-            
-            elif geom_type == 'circle':
-                radius = geom.get('radius', 0)
-                area_mm2 = math.pi * (radius ** 2)
+            area_mm2 = piece_area(geom)
 
             # Convert mm2 to m2 (1 m2 = 1,000,000 mm2)
             area_m2 = area_mm2 / 1_000_000.0
@@ -86,7 +61,7 @@ class Command(BaseCommand):
             usage_by_color[color] += total_piece_area
 
             # Detailed output for verification
-            # self.stdout.write(f"Piece: {name} | Type: {geom_type} | Area/pc: {area_m2:.6f} m2 | Qty: {qty_per_item} | Total: {total_piece_area:.4f} m2 | Color: {color}")
+            # self.stdout.write(f"Piece: {name} | Area/pc: {area_m2:.6f} m2 | Qty: {qty_per_item} | Total: {total_piece_area:.4f} m2 | Color: {color}")
 
         self.stdout.write("-" * 40)
         self.stdout.write("TOTAL FABRIC USAGE (Net Area):")
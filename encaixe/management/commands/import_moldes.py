@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from encaixe.services.bulk_molde_import import import_mold_directory
+
+
+class Command(BaseCommand):
+    help = (
+        'Imports every .mld / .json mold file of a directory tree (one Molde per file). '
+        'Files are parsed in a process pool and written in bulk batches.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', type=str, help='Directory (scanned recursively) or single file')
+        parser.add_argument('--workers', type=int, default=0, help='Parser processes (default: CPU count, 1 = in-process)')
+        parser.add_argument('--batch-size', type=int, default=100, help='Files written per transaction')
+        parser.add_argument('--skip-existing', action='store_true', help='Skip files whose name is already a Molde')
+        parser.add_argument('--no-thumbnails', action='store_true', help='Do not store the .mld thumbnails as Molde.imagem')
+        parser.add_argument('--attach', action='store_true', help='Copy each source file into Molde.arquivo_json')
+
+    def _progress(self, done, total, errors):
+        elapsed = time.perf_counter() - self.start
+        rate = done / elapsed if elapsed else 0
+        self.stdout.write(f'  {done}/{total} files ({errors} errors) {rate:.1f} files/s')
+
+    def handle(self, *args, **options):
+        self.start = time.perf_counter()
+        try:
+            summary = import_mold_directory(
+                options['path'],
+                workers=options['workers'] or None,
+                batch_size=max(options['batch_size'], 1),
+                skip_existing=options['skip_existing'],
+                thumbnails=not options['no_thumbnails'],
+                attach=options['attach'],
+                progress=self._progress,
+            )
+        except OSError as e:
+            raise CommandError(str(e))
+
+        for path, message in summary['errors']:
+            self.stderr.write(f'{path}: {message}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{summary['imported']} moldes ({summary['pieces']} pieces) imported in "
+            f"{time.perf_counter() - self.start:.1f}s; {summary['skipped']} skipped, {len(summary['errors'])} errors."
+        ))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from molds.models import MoldeDetalhe
+
+
+class Command(BaseCommand):
+    help = 'Backfills the precomputed geometry index (bbox, area, perimeter, hull, rotated bbox) of MoldeDetalhe'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Reindex every piece, not only the ones never indexed (or missing the geometry hash / levels of detail)')
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows per bulk_update')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        queryset = MoldeDetalhe.objects.all().order_by('id')
+        if not options['all']:
+            queryset = queryset.filter(
+                Q(geometria_indexada=False) | Q(geometria_hash='') | Q(tipo_geom='poly', geometria_lod={})
+            )
+
+        total = queryset.count()
+        self.stdout.write(f"Indexing {total} pieces...")
+
+        batch = []
+        done = 0
+        for detalhe in queryset.iterator(chunk_size=batch_size):
+            detalhe.atualizar_indice()
+            batch.append(detalhe)
+
+            if len(batch) >= batch_size:
+                MoldeDetalhe.objects.bulk_update(batch, MoldeDetalhe.INDEX_FIELDS)
+                done += len(batch)
+                batch = []
+                self.stdout.write(f"  {done}/{total}")
+
+        if batch:
+            MoldeDetalhe.objects.bulk_update(batch, MoldeDetalhe.INDEX_FIELDS)
+            done += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f'Geometry index updated for {done} pieces.'))
@@ -0,0 +1,24 @@
+# Generated by Django 6.0 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EncaixeCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chave', models.CharField(max_length=64, unique=True)),
+                ('geometrias', models.TextField(blank=True, default='', help_text='Hashes das geometrias envolvidas, separados por espaço')),
+                ('resultado', models.JSONField()),
+                ('data_criacao', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -4,3 +4,17 @@ from django.db import models
 # - products.models
 # - sales.models
 # - purchases.models
+
+
+class EncaixeCache(models.Model):
+    """
+    Resultado persistido de um encaixe (ver encaixe/services/nesting_cache.py).
+    Só é usado quando ENCAIXE_NESTING_CACHE_PERSISTENT = True.
+    """
+    chave = models.CharField(max_length=64, unique=True)
+    geometrias = models.TextField(blank=True, default='', help_text="Hashes das geometrias envolvidas, separados por espaço")
+    resultado = models.JSONField()
+    data_criacao = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.chave
@@ -0,0 +1,128 @@
+"""
+Bulk import of a directory tree of mold files (.mld / .json).
+
+Reading the files and computing the geometry index of every piece is CPU
+bound and independent per file, so it runs in a process pool
+(molde_parser.parse_mold_file). The main process only writes: each batch of
+parsed files becomes one transaction with a bulk_create of the Molde rows and
+one of their MoldeDetalhe rows (already indexed, no per-row save()).
+
+bulk_create sends no signals: the pieces of new moldes have no SKUs yet, so
+there are no consumos or nesting layouts to invalidate.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from encaixe.services.molde_parser import find_mold_files, parse_mold_file
+from molds.models import Molde, MoldeDetalhe
+
+
+def molde_name(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def _parsed(paths, workers):
+    """parse_mold_file over `paths`, in order, in `workers` processes."""
+    if workers <= 1 or len(paths) <= 1:
+        yield from map(parse_mold_file, paths)
+        return
+    with ProcessPoolExecutor(max_workers=min(workers, len(paths))) as pool:
+        yield from pool.map(parse_mold_file, paths, chunksize=max(len(paths) // (workers * 8), 1))
+
+
+def _save_files(molde, result, thumbnails, attach, saved):
+    """
+    Stores the thumbnail / source file of a created Molde. Names carry the
+    Molde id, so files with the same name in different subdirectories do not
+    collide. Returns True when a file field was set.
+    """
+    changed = False
+    if thumbnails and result['thumbnail']:
+        molde.imagem = default_storage.save(
+            f"moldes/thumbs/thumb_{molde.pk}_{molde.nome}.png", ContentFile(result['thumbnail'])
+        )
+        saved.append(molde.imagem.name)
+        changed = True
+    if attach:
+        with open(result['path'], 'rb') as f:
+            molde.arquivo_json = default_storage.save(
+                f"moldes/{molde.pk}_{os.path.basename(result['path'])}", File(f)
+            )
+        saved.append(molde.arquivo_json.name)
+        changed = True
+    return changed
+
+
+def _write_batch(results, thumbnails, attach):
+    moldes = [Molde(nome=molde_name(result['path'])) for result in results]
+
+    # Files are written once the rows exist and removed if the batch rolls back
+    saved = []
+    try:
+        with transaction.atomic():
+            Molde.objects.bulk_create(moldes)
+            detalhes = [
+                MoldeDetalhe(molde=molde, **fields)
+                for molde, result in zip(moldes, results) for fields in result['pieces']
+            ]
+            MoldeDetalhe.objects.bulk_create(detalhes, batch_size=500)
+
+            with_files = [
+                molde for molde, result in zip(moldes, results)
+                if _save_files(molde, result, thumbnails, attach, saved)
+            ]
+            if with_files:
+                Molde.objects.bulk_update(with_files, ['imagem', 'arquivo_json'])
+    except BaseException:
+        for name in saved:
+            default_storage.delete(name)
+        raise
+    return len(detalhes)
+
+
+def import_mold_directory(root, workers=None, batch_size=100, skip_existing=False,
+                          thumbnails=True, attach=False, progress=None):
+    """
+    Imports every mold file under `root` (or the single file `root`).
+
+    One Molde per file, named after the file. `skip_existing` leaves out
+    files whose name is already a Molde; `attach` copies the source file into
+    Molde.arquivo_json. `progress(done, total, errors)` is called after each batch.
+    Returns {'files', 'imported', 'pieces', 'skipped', 'errors': [(path, message)]}.
+    """
+    paths = find_mold_files(root) if os.path.isdir(root) else [root]
+    skipped = 0
+    if skip_existing:
+        existing = set(Molde.objects.values_list('nome', flat=True))
+        before = len(paths)
+        paths = [path for path in paths if molde_name(path) not in existing]
+        skipped = before - len(paths)
+
+    workers = workers or os.cpu_count() or 1
+    summary = {'files': len(paths), 'imported': 0, 'pieces': 0, 'skipped': skipped, 'errors': []}
+    done = 0
+    batch = []
+
+    def flush():
+        summary['pieces'] += _write_batch(batch, thumbnails, attach)
+        summary['imported'] += len(batch)
+        batch.clear()
+        if progress:
+            progress(done, len(paths), len(summary['errors']))
+
+    for result in _parsed(paths, workers):
+        done += 1
+        if result['error']:
+            summary['errors'].append((result['path'], result['error']))
+        else:
+            batch.append(result)
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+
+    return summary
@@ -0,0 +1,247 @@
+"""
+Geometria das peças (MoldeDetalhe.geometria_json).
+
+geometria_json segue o formato do CadMolde:
+    {'type': 'poly', 'pts': [{'x': .., 'y': ..}, ...]}
+    {'type': 'rect', 'halfW': .., 'halfH': ..}
+    {'type': 'circle', 'radius': ..}
+
+`geometry_index` calcula os valores persistidos em MoldeDetalhe para que
+calculadoras e telas não precisem reprocessar os pontos a cada chamada.
+`geometry_lods` gera as versões simplificadas (Douglas-Peucker) usadas só
+para desenhar; o encaixe e o consumo usam sempre o geometria_json completo.
+"""
+import hashlib
+import json
+import math
+
+from encaixe.services import geometry_kernel as gk
+
+# Segmentos usados para aproximar círculos em casco convexo / bbox rotacionado
+CIRCLE_SEGMENTS = 64
+
+# Tolerâncias (mm) dos níveis de detalhe de MoldeDetalhe.geometria_lod
+LOD_TOLERANCES = (0.1, 0.5, 2.0)
+
+
+def piece_bbox(geom):
+    """Bounding box (w, h) em mm a partir do geometria_json da peça."""
+    g_type = geom.get('type', 'unknown')
+
+    w_box, h_box = 0, 0
+
+    if g_type == 'rect':
+        w_box = geom.get('halfW', 0) * 2
+        h_box = geom.get('halfH', 0) * 2
+    elif g_type == 'circle':
+        r = geom.get('radius', 0)
+        w_box = r * 2
+        h_box = r * 2
+    elif g_type == 'poly':
+        pts = geom.get('pts', [])
+        if pts:
+            w_box, h_box = gk.bbox_size(gk.as_array(pts))
+
+    return w_box, h_box
+
+
+def piece_points(geom):
+    """Contorno da peça como lista de tuplas (x, y). Círculos viram polígonos regulares."""
+    g_type = geom.get('type', 'unknown')
+
+    if g_type == 'poly':
+        return [(p['x'], p['y']) for p in geom.get('pts', [])]
+    if g_type == 'rect':
+        hw = geom.get('halfW', 0)
+        hh = geom.get('halfH', 0)
+        return [(-hw, -hh), (hw, -hh), (hw, hh), (-hw, hh)]
+    if g_type == 'circle':
+        r = geom.get('radius', 0)
+        step = 2 * math.pi / CIRCLE_SEGMENTS
+        return [(r * math.cos(i * step), r * math.sin(i * step)) for i in range(CIRCLE_SEGMENTS)]
+    return []
+
+
+def piece_area(geom):
+    """Área real da peça em mm² (círculo e retângulo exatos, polígono por Shoelace)."""
+    g_type = geom.get('type', 'unknown')
+    if g_type == 'circle':
+        return math.pi * (geom.get('radius', 0) ** 2)
+    if g_type == 'rect':
+        return (geom.get('halfW', 0) * 2) * (geom.get('halfH', 0) * 2)
+    if g_type == 'poly':
+        return gk.area(gk.as_array(geom.get('pts', [])))
+    return 0.0
+
+
+def polygon_area(pts):
+    """Área pela fórmula de Shoelace (valor absoluto)."""
+    return gk.area(gk.as_array(pts))
+
+
+def polygon_perimeter(pts):
+    return gk.perimeter(gk.as_array(pts))
+
+
+def convex_hull(pts):
+    """Casco convexo (Andrew's monotone chain), em sentido anti-horário."""
+    points = sorted(set(pts))
+    if len(points) <= 2:
+        return points
+
+    def cross(o, a, b):
+        return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+    lower = []
+    for p in points:
+        while len(lower) >= 2 and cross(lower[-2], lower[-1], p) <= 0:
+            lower.pop()
+        lower.append(p)
+
+    upper = []
+    for p in reversed(points):
+        while len(upper) >= 2 and cross(upper[-2], upper[-1], p) <= 0:
+            upper.pop()
+        upper.append(p)
+
+    return lower[:-1] + upper[:-1]
+
+
+def min_area_rect(hull):
+    """
+    Menor retângulo envolvente (rotacionado) de um casco convexo.
+    Testa a orientação de cada aresta do casco (todas de uma vez no kernel).
+    Retorna (largura, altura, angulo_graus).
+    """
+    if len(hull) < 3:
+        xs = [p[0] for p in hull] or [0]
+        ys = [p[1] for p in hull] or [0]
+        return max(xs) - min(xs), max(ys) - min(ys), 0.0
+
+    angles = []
+    seen = set()
+    n = len(hull)
+    for i in range(n):
+        x1, y1 = hull[i]
+        x2, y2 = hull[(i + 1) % n]
+        angle = math.atan2(y2 - y1, x2 - x1) % (math.pi / 2)
+        key = round(angle, 9)
+        if key not in seen:
+            seen.add(key)
+            angles.append(angle)
+
+    widths, heights = gk.projected_extents(gk.as_array(hull), angles)
+    best = min(range(len(angles)), key=lambda i: widths[i] * heights[i])
+    return widths[best], heights[best], math.degrees(angles[best])
+
+
+def geometry_hash(geom):
+    """
+    Hash (sha256) do conteúdo geométrico da peça. Ignora o nome, que as telas
+    costumam sobrescrever no dicionário.
+    """
+    content = {k: v for k, v in (geom or {}).items() if k != 'name'}
+    payload = json.dumps(content, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def geometry_index(geom):
+    """
+    Valores do índice geométrico persistido em MoldeDetalhe:
+    bbox, área, perímetro, área do casco convexo e bbox rotacionado mínimo.
+    """
+    g_type = geom.get('type', 'unknown')
+    w_box, h_box = piece_bbox(geom)
+
+    if g_type == 'circle':
+        r = geom.get('radius', 0)
+        return {
+            'largura_mm': w_box,
+            'altura_mm': h_box,
+            'area_mm2': math.pi * (r ** 2),
+            'perimetro_mm': 2 * math.pi * r,
+            'area_convexa_mm2': math.pi * (r ** 2),
+            'largura_rotacionada_mm': w_box,
+            'altura_rotacionada_mm': h_box,
+            'angulo_rotacionado': 0.0,
+        }
+
+    pts = piece_points(geom)
+    arr = gk.as_array(pts)
+    hull = convex_hull(pts)
+    rot_w, rot_h, rot_angle = min_area_rect(hull)
+
+    return {
+        'largura_mm': w_box,
+        'altura_mm': h_box,
+        'area_mm2': gk.area(arr),
+        'perimetro_mm': gk.perimeter(arr),
+        'area_convexa_mm2': polygon_area(hull),
+        'largura_rotacionada_mm': rot_w,
+        'altura_rotacionada_mm': rot_h,
+        'angulo_rotacionado': rot_angle,
+    }
+
+
+def lod_key(tolerance):
+    """Chave do nível em geometria_lod: 0.5 -> '0.5', 2.0 -> '2'."""
+    return f'{tolerance:g}'
+
+
+def geometry_lods(geom):
+    """
+    Níveis de detalhe de um polígono: {lod_key(tolerância): geometria_json
+    simplificado}. Níveis que não removem pontos em relação ao anterior (mais
+    fino) não são guardados; retângulos e círculos não têm níveis.
+    """
+    if (geom or {}).get('type') != 'poly' or len(geom.get('pts', [])) <= 3:
+        return {}
+
+    lods = {}
+    arr = gk.as_array(geom['pts'])
+    previous = len(arr)
+    for tolerance in LOD_TOLERANCES:
+        simplified = gk.simplify(arr, tolerance)
+        if len(simplified) < previous:
+            lods[lod_key(tolerance)] = dict(geom, pts=gk.to_points(simplified))
+            previous = len(simplified)
+    return lods
+
+
+def lod_tolerance(mm_per_px):
+    """Maior tolerância de LOD que não passa de um pixel na escala (None = completa)."""
+    fitting = [t for t in LOD_TOLERANCES if t <= mm_per_px]
+    return max(fitting) if fitting else None
+
+
+def geometry_for_scale(geom, lods, mm_per_px):
+    """
+    geometria_json para desenhar a peça com `mm_per_px` milímetros por pixel:
+    o nível mais simples cujo erro cabe em um pixel, ou a geometria completa.
+    """
+    tolerance = lod_tolerance(mm_per_px) if mm_per_px else None
+    if tolerance is None or not lods:
+        return geom
+    for t in sorted(LOD_TOLERANCES, reverse=True):
+        if t <= tolerance and lod_key(t) in lods:
+            return lods[lod_key(t)]
+    return geom
+
+
+def index_fields(geom, area_base_mm2=0.0, geometria_hash=None):
+    """
+    Valores de todos os campos do índice de MoldeDetalhe (INDEX_FIELDS).
+    A área informada (area_base_mm2, vinda do arquivo) só tem prioridade sobre a
+    calculada enquanto a geometria é a mesma: no import (sem `geometria_hash`
+    anterior) ou quando o hash não mudou. Depois de editar a geometria vale a
+    área calculada.
+    """
+    fields = geometry_index(geom or {})
+    area = fields.pop('area_mm2')
+    new_hash = geometry_hash(geom or {})
+    keep_area = area_base_mm2 and geometria_hash in (None, '', new_hash)
+    fields['area_base_mm2'] = area_base_mm2 if keep_area else area
+    fields['geometria_hash'] = new_hash
+    fields['geometria_indexada'] = True
+    fields['geometria_lod'] = geometry_lods(geom or {})
+    return fields
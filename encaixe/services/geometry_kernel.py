@@ -0,0 +1,262 @@
+"""
+Vectorized kernel of the piece outline math.
+
+An outline is converted once (as_array) from the geometria_json points
+({'x', 'y'} dicts) or (x, y) tuples into a contiguous (n, 2) float64 array;
+area, centroid, bbox, perimeter, rotation and translation then run as NumPy
+array operations instead of Python loops over dicts, which matters for CAD
+exports with thousands of spline-sampled points per piece.
+
+Without NumPy the same functions fall back to plain Python over a list of
+(x, y) tuples, like sales/services/row_yield.py. Rotations by multiples of
+90 degrees are exact (coordinates are swapped, not multiplied by cos/sin).
+"""
+import math
+from itertools import chain
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def as_array(pts):
+    """(n, 2) float64 array of the points (list of tuples without NumPy)."""
+    if np is not None and isinstance(pts, np.ndarray):
+        return np.ascontiguousarray(pts, dtype=np.float64).reshape(-1, 2)
+    pts = list(pts)
+    if pts and isinstance(pts[0], dict):
+        if np is None:
+            return [(float(p['x']), float(p['y'])) for p in pts]
+        flat = np.fromiter(chain.from_iterable((p['x'], p['y']) for p in pts), dtype=np.float64, count=2 * len(pts))
+        return flat.reshape(-1, 2)
+    if np is None:
+        return [(float(x), float(y)) for x, y in pts]
+    return np.array(pts, dtype=np.float64).reshape(-1, 2)
+
+
+def _number(value):
+    # JSON from the CAD (JavaScript) never writes 100.0: keep integral values as int
+    return int(value) if value.is_integer() else value
+
+
+def to_points(arr):
+    """Array back to the geometria_json format: [{'x': .., 'y': ..}, ...]."""
+    rows = arr.tolist() if np is not None else arr
+    return [{'x': _number(x), 'y': _number(y)} for x, y in rows]
+
+
+def to_tuples(arr):
+    """Array back to a list of (x, y) tuples."""
+    rows = arr.tolist() if np is not None else arr
+    return [(x, y) for x, y in rows]
+
+
+def area(arr, signed=False):
+    """Shoelace area (counter-clockwise positive when signed)."""
+    if len(arr) < 3:
+        return 0.0
+    if np is None:
+        acc = sum(x1 * y2 - x2 * y1 for (x1, y1), (x2, y2) in zip(arr, arr[1:] + arr[:1]))
+    else:
+        x, y = arr[:, 0], arr[:, 1]
+        acc = float(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)))
+    return acc / 2.0 if signed else abs(acc) / 2.0
+
+
+def centroid(arr):
+    """Area centroid (x, y); the mean of the points for degenerate outlines."""
+    n = len(arr)
+    if n == 0:
+        return 0.0, 0.0
+    signed = area(arr, signed=True)
+    if abs(signed) < 1e-12:
+        if np is None:
+            return sum(x for x, _ in arr) / n, sum(y for _, y in arr) / n
+        mean = arr.mean(axis=0)
+        return float(mean[0]), float(mean[1])
+
+    if np is None:
+        cx = cy = 0.0
+        for (x1, y1), (x2, y2) in zip(arr, arr[1:] + arr[:1]):
+            cross = x1 * y2 - x2 * y1
+            cx += (x1 + x2) * cross
+            cy += (y1 + y2) * cross
+    else:
+        nxt = np.roll(arr, -1, axis=0)
+        cross = arr[:, 0] * nxt[:, 1] - nxt[:, 0] * arr[:, 1]
+        cx = float(np.dot(arr[:, 0] + nxt[:, 0], cross))
+        cy = float(np.dot(arr[:, 1] + nxt[:, 1], cross))
+    return cx / (6.0 * signed), cy / (6.0 * signed)
+
+
+def bbox(arr):
+    """(min_x, min_y, max_x, max_y); zeros for an empty outline."""
+    if len(arr) == 0:
+        return 0.0, 0.0, 0.0, 0.0
+    if np is None:
+        xs = [x for x, _ in arr]
+        ys = [y for _, y in arr]
+        return min(xs), min(ys), max(xs), max(ys)
+    lo = arr.min(axis=0)
+    hi = arr.max(axis=0)
+    return float(lo[0]), float(lo[1]), float(hi[0]), float(hi[1])
+
+
+def bbox_size(arr):
+    """(width, height) of the bounding box."""
+    min_x, min_y, max_x, max_y = bbox(arr)
+    return max_x - min_x, max_y - min_y
+
+
+def perimeter(arr):
+    n = len(arr)
+    if n < 2:
+        return 0.0
+    if np is None:
+        return sum(math.dist(a, b) for a, b in zip(arr, arr[1:] + arr[:1]))
+    return float(np.hypot(*(np.roll(arr, -1, axis=0) - arr).T).sum())
+
+
+def rotate(arr, angle, origin=(0.0, 0.0)):
+    """Rotates the points by `angle` degrees (counter-clockwise) around `origin`."""
+    angle = angle % 360
+    ox, oy = origin
+    if np is None:
+        pts = [(x - ox, y - oy) for x, y in arr]
+        if angle == 90:
+            pts = [(-y, x) for x, y in pts]
+        elif angle == 180:
+            pts = [(-x, -y) for x, y in pts]
+        elif angle == 270:
+            pts = [(y, -x) for x, y in pts]
+        elif angle:
+            c, s = math.cos(math.radians(angle)), math.sin(math.radians(angle))
+            pts = [(x * c - y * s, x * s + y * c) for x, y in pts]
+        return [(x + ox, y + oy) for x, y in pts]
+
+    pts = arr - (ox, oy) if (ox or oy) else arr
+    if angle == 0:
+        out = pts.copy()
+    elif angle == 90:
+        out = np.column_stack((-pts[:, 1], pts[:, 0]))
+    elif angle == 180:
+        out = -pts
+    elif angle == 270:
+        out = np.column_stack((pts[:, 1], -pts[:, 0]))
+    else:
+        c, s = math.cos(math.radians(angle)), math.sin(math.radians(angle))
+        out = pts @ np.array([[c, s], [-s, c]])
+    if ox or oy:
+        out = out + (ox, oy)
+    return np.ascontiguousarray(out)
+
+
+def translate(arr, dx, dy):
+    if np is None:
+        return [(x + dx, y + dy) for x, y in arr]
+    return arr + (dx, dy)
+
+
+def normalize(arr):
+    """Translates the points so the bounding box starts at (0, 0)."""
+    min_x, min_y, _, _ = bbox(arr)
+    return translate(arr, -min_x, -min_y)
+
+
+def projected_extents(arr, angles):
+    """
+    Widths and heights of the points' bounding box after rotating the frame by
+    each of `angles` (radians), for all angles at once: two lists.
+    """
+    if np is None:
+        widths, heights = [], []
+        for angle in angles:
+            c, s = math.cos(angle), math.sin(angle)
+            us = [x * c + y * s for x, y in arr]
+            vs = [-x * s + y * c for x, y in arr]
+            widths.append(max(us) - min(us))
+            heights.append(max(vs) - min(vs))
+        return widths, heights
+
+    angles = np.asarray(angles, dtype=np.float64)
+    c, s = np.cos(angles)[:, None], np.sin(angles)[:, None]
+    x, y = arr[:, 0], arr[:, 1]
+    us = c * x + s * y
+    vs = -s * x + c * y
+    return (us.max(axis=1) - us.min(axis=1)).tolist(), (vs.max(axis=1) - vs.min(axis=1)).tolist()
+
+
+def _segment_distances(arr, start, end):
+    """Distances of arr[start+1:end] to the segment arr[start] -> arr[end]."""
+    a, b = arr[start], arr[end]
+    pts = arr[start + 1:end]
+    ab = b - a
+    length2 = float(np.dot(ab, ab))
+    if length2 == 0.0:
+        return np.hypot(*(pts - a).T)
+    t = np.clip((pts - a) @ ab / length2, 0.0, 1.0)
+    return np.hypot(*(pts - (a + t[:, None] * ab)).T)
+
+
+def _douglas_peucker(arr, tolerance):
+    """Mask of the points kept by Douglas-Peucker on the open chain `arr`."""
+    n = len(arr)
+    if np is None:
+        keep = [False] * n
+    else:
+        keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[n - 1] = True
+
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        if np is None:
+            (ax, ay), (bx, by) = arr[start], arr[end]
+            dx, dy = bx - ax, by - ay
+            length2 = dx * dx + dy * dy
+            best, index = -1.0, start
+            for i in range(start + 1, end):
+                px, py = arr[i]
+                t = 0.0 if length2 == 0 else min(1.0, max(0.0, ((px - ax) * dx + (py - ay) * dy) / length2))
+                d = math.hypot(px - ax - t * dx, py - ay - t * dy)
+                if d > best:
+                    best, index = d, i
+        else:
+            distances = _segment_distances(arr, start, end)
+            offset = int(distances.argmax())
+            best, index = float(distances[offset]), start + 1 + offset
+        if best > tolerance:
+            keep[index] = True
+            stack.append((start, index))
+            stack.append((index, end))
+    return keep
+
+
+def simplify(arr, tolerance):
+    """
+    Douglas-Peucker simplification of a closed outline: no point of the
+    original is farther than `tolerance` (mm) from the result. The ring is
+    split at the first point and the point farthest from it. Outlines that
+    would drop below 3 points are returned unchanged.
+    """
+    n = len(arr)
+    if n <= 3 or tolerance <= 0:
+        return arr
+
+    if np is None:
+        x0, y0 = arr[0]
+        far = max(range(n), key=lambda i: (arr[i][0] - x0) ** 2 + (arr[i][1] - y0) ** 2)
+        ring = arr + arr[:1]
+        keep = _douglas_peucker(ring[:far + 1], tolerance) + _douglas_peucker(ring[far:], tolerance)[1:-1]
+        kept = [p for p, k in zip(arr, keep) if k]
+        return kept if len(kept) >= 3 else arr
+
+    far = int(np.hypot(*(arr - arr[0]).T).argmax())
+    ring = np.concatenate((arr, arr[:1]))
+    keep = np.concatenate((_douglas_peucker(ring[:far + 1], tolerance), _douglas_peucker(ring[far:], tolerance)[1:-1]))
+    if keep.sum() < 3:
+        return arr
+    return np.ascontiguousarray(arr[keep])
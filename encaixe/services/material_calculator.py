@@ -1,6 +1,7 @@
 import math
 from products.models import ProdutoConsumo
-from molds.models import MoldePeca
+from molds.models import MoldeDetalhe
+from inventory.units import to_storage, unit_for
 
 def get_material_requirements_for_orders(orders):
     """
@@ -21,26 +22,8 @@ def get_material_requirements_for_orders(orders):
                 
                 width_mm = conf.material.largura_padrao_mm if conf.material.largura_padrao_mm else 1500
                 
-                # Extract Geometry to calc BBox
-                geom = conf.molde_peca.geometria_json
-                g_type = geom.get('type', 'unknown')
-                
-                w_box, h_box = 0, 0
-                
-                if g_type == 'rect':
-                    w_box = geom.get('halfW', 0) * 2
-                    h_box = geom.get('halfH', 0) * 2
-                elif g_type == 'circle':
-                    r = geom.get('radius', 0)
-                    w_box = r * 2
-                    h_box = r * 2
-                elif g_type == 'poly':
-                    pts = geom.get('pts', [])
-                    if pts:
-                        xs = [p['x'] for p in pts]
-                        ys = [p['y'] for p in pts]
-                        w_box = max(xs) - min(xs)
-                        h_box = max(ys) - min(ys)
+                # Precomputed geometry index (bbox)
+                w_box, h_box = conf.molde_peca.get_bbox()
                 
                 # Add Margin
                 margin = 0 
@@ -93,12 +76,7 @@ def get_material_requirements_for_orders(orders):
                     
                     # Normalize to MM if it's a measure unit (because View expects MM for these units)
                     # Assuming MoldeMaterial stores the value in the Material's unit (e.g. 0.8 for 0.8 mt)
-                    if material.is_unidade_medida():
-                        u = material.unidade.lower().strip()
-                        if u in ['mt', 'm', 'mts', 'metro', 'metros']:
-                            qty_unit *= 1000.0
-                        elif u in ['cm', 'centimetro']:
-                            qty_unit *= 10.0
+                    qty_unit = to_storage(qty_unit, unit_for(material))
                     
                     qty_total = qty_unit * item.quantidade
                     
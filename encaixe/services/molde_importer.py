@@ -1,17 +1,109 @@
 import json
-import math
 from molds.models import MoldeDetalhe
 from inventory.models import Material
 from django.db import transaction
 
 from encaixe.utils import read_mld_file
+from encaixe.services.molde_parser import indexed_piece_fields
+from encaixe.services.nesting_cache import invalidate_geometries
 
 from django.core.files.base import ContentFile
+from django.dispatch import Signal
+
+# Sent after a re-import changed pieces of a molde (bulk writes send no
+# post_save): molde=Molde, created/updated/deleted=lists of MoldeDetalhe ids
+pecas_reimportadas = Signal()
+
+
+def _match_pieces(existing, incoming):
+    """
+    Pairs the stored pieces with the pieces of the file, in three passes:
+    CAD id, then name + geometry hash (unchanged piece), then name alone
+    (same piece, new geometry). Returns ([(detalhe or None, fields)], unmatched detalhes).
+    """
+    pairs = [None] * len(incoming)
+    remaining = list(existing)
+    passes = [
+        (lambda d: d.id_externo or None, lambda f: f['id_externo'] or None),
+        (lambda d: (d.nome_original, d.geometria_hash), lambda f: (f['nome_original'], f['geometria_hash'])),
+        (lambda d: d.nome_original, lambda f: f['nome_original']),
+    ]
+    for stored_key, file_key in passes:
+        by_key = {}
+        for detalhe in remaining:
+            key = stored_key(detalhe)
+            if key is not None:
+                by_key.setdefault(key, []).append(detalhe)
+        for n, fields in enumerate(incoming):
+            candidates = by_key.get(file_key(fields)) if pairs[n] is None else None
+            if candidates:
+                pairs[n] = candidates.pop(0)
+        matched = {id(detalhe) for detalhe in pairs if detalhe is not None}
+        remaining = [detalhe for detalhe in remaining if id(detalhe) not in matched]
+
+    return list(zip(pairs, incoming)), remaining
+
+
+def sync_molde_pieces(molde, pieces_data):
+    """
+    Applies the pieces of a file to a molde as a diff, keeping the ids (and
+    the BOM rows / order configs pointing at them) of the pieces that stay:
+    changed pieces are bulk_updated, new ones bulk_created and only the
+    pieces missing from the file are deleted, in one transaction.
+    Returns {'created', 'updated', 'unchanged', 'deleted'} counts.
+    """
+    incoming = [indexed_piece_fields(p_data) for p_data in pieces_data]
+    pairs, removed = _match_pieces(list(molde.detalhes.order_by('id')), incoming)
+
+    to_create = []
+    to_update = []
+    update_fields = set()
+    stale_hashes = {detalhe.geometria_hash for detalhe in removed}
+    for detalhe, fields in pairs:
+        if detalhe is None:
+            to_create.append(MoldeDetalhe(molde=molde, **fields))
+            continue
+        changed = [field for field, value in fields.items() if getattr(detalhe, field) != value]
+        if not changed:
+            continue
+        if 'geometria_hash' in changed:
+            stale_hashes.add(detalhe.geometria_hash)
+        for field in changed:
+            setattr(detalhe, field, fields[field])
+        update_fields.update(changed)
+        to_update.append(detalhe)
+
+    with transaction.atomic():
+        # Nesting layouts built from geometries that changed or left the molde
+        if stale_hashes:
+            invalidate_geometries(stale_hashes)
+        if removed:
+            # Row by row signals (consumos, etc) fire for the deleted pieces
+            MoldeDetalhe.objects.filter(id__in=[detalhe.id for detalhe in removed]).delete()
+        if to_update:
+            MoldeDetalhe.objects.bulk_update(to_update, sorted(update_fields), batch_size=500)
+        if to_create:
+            MoldeDetalhe.objects.bulk_create(to_create, batch_size=500)
+
+    if to_create or to_update or removed:
+        pecas_reimportadas.send(
+            sender=MoldeDetalhe, molde=molde,
+            created=[detalhe.id for detalhe in to_create],
+            updated=[detalhe.id for detalhe in to_update],
+            deleted=[detalhe.id for detalhe in removed],
+        )
+    return {
+        'created': len(to_create),
+        'updated': len(to_update),
+        'unchanged': len(pairs) - len(to_create) - len(to_update),
+        'deleted': len(removed),
+    }
 
 def process_molde_json(molde, file_stream=None):
     """
-    Parses the JSON file (or .mld file) associated with a Molde and creates MoldeDetalhe records.
-    Ignores Insumos/Materials as they are now defined in Produto.
+    Parses the JSON file (or .mld file) associated with a Molde and syncs its MoldeDetalhe
+    records with it (see sync_molde_pieces). Ignores Insumos/Materials as they are now
+    defined in Produto. Returns the counts of sync_molde_pieces.
     
     Args:
         molde: The Molde instance to populate.
@@ -39,6 +131,7 @@ def process_molde_json(molde, file_stream=None):
                 # read_mld_file now handles file-like objects
                 mld_content = read_mld_file(source)
                 data = mld_content.get('data', {})
+                thumb_bytes = mld_content.get('thumbnail')
                 
                 if thumb_bytes and len(thumb_bytes) > 0:
                     filename = f"thumb_{molde.id}.png"
@@ -70,117 +163,7 @@ def process_molde_json(molde, file_stream=None):
         # insumos_data = data.get('insumos', []) # Ignored
         # accessories_data = data.get('accessories', []) # Ignored
         
-        with transaction.atomic():
-            # Clear old data 
-            molde.detalhes.all().delete()
-            # materials were removed from Molde model
-
-            # Process Pieces (Geometry Only)
-            for p_data in pieces_data:
-                geom = p_data.get('geom', {})
-                tipo = geom.get('type', 'unknown')
-                
-                # Area Calculation (Priority: JSON value > Calculated)
-                area = float(p_data.get('area_mm2', 0.0))
-                
-                if area == 0.0:
-                    # Fallback calculation
-                    if tipo == 'rect':
-                        hw = geom.get('halfW', 0)
-                        hh = geom.get('halfH', 0)
-                        area = (hw * 2) * (hh * 2)
-                        w_current = hw * 2
-                        h_current = hh * 2
-                    elif tipo == 'circle':
-                        r = geom.get('radius', 0)
-                        area = math.pi * (r ** 2)
-                        w_current = r * 2
-                        h_current = r * 2
-                    elif tipo == 'poly':
-                        pts = geom.get('pts', [])
-                        if pts:
-                            xs = [p['x'] for p in pts]
-                            ys = [p['y'] for p in pts]
-                            w_current = max(xs) - min(xs)
-                            h_current = max(ys) - min(ys)
-                            
-                            # Shoelace Formula
-                            area_accum = 0.0
-                            n = len(pts)
-                            for i in range(n):
-                                j = (i + 1) % n
-                                area_accum += pts[i]['x'] * pts[j]['y']
-                                area_accum -= pts[j]['x'] * pts[i]['y']
-                            area = abs(area_accum) / 2.0
-                        else:
-                            area = 0.0
-                else:
-                    # Provide dummy dimensions for rotation logic if needed
-                    w_current = 100
-                    h_current = 100
-
-                # Rotation Constraints and Grain
-                can_rotate = p_data.get('canRotate', True)
-                fixed_rot = p_data.get('fixedRotation', False)
-                auto_orient = p_data.get('autoOrient', False) 
-                grain_axis = p_data.get('grainAxis', p_data.get('grain', 'y')) 
-                
-                should_rotate_90 = False
-                
-                # Logic 1: Auto Orient (Longest Side -> Y)
-                if area == 0.0 and auto_orient: # Only calc rotation if we calculated dims
-                    if w_current > h_current:
-                        should_rotate_90 = True
-                
-                # Logic 2: Explicit Grain Axis (Arrow)
-                if str(grain_axis).lower() in ['x', 'h', 'horizontal']:
-                    should_rotate_90 = True
-                
-                if should_rotate_90:
-                    # Perform Rotation (Transpose / Flip)
-                    if tipo == 'rect':
-                        geom['halfW'] = hh
-                        geom['halfH'] = hw
-                    elif tipo == 'poly':
-                        pts = geom.get('pts', [])
-                        new_pts = []
-                        min_x_new = float('inf')
-                        min_y_new = float('inf')
-                        
-                        for p in pts:
-                            # Rotate (x,y) -> (y, -x)
-                            nx = p['y']
-                            ny = -p['x']
-                            new_pts.append({'x': nx, 'y': ny})
-                            if nx < min_x_new: min_x_new = nx
-                            if ny < min_y_new: min_y_new = ny
-                        
-                        # Normalize
-                        for p in new_pts:
-                            p['x'] -= min_x_new
-                            p['y'] -= min_y_new
-                        
-                        geom['pts'] = new_pts
-                    
-                    fixed_rot = True
-
-                is_fixed = False
-                if can_rotate is False: is_fixed = True
-                if fixed_rot is True: is_fixed = True
-
-                MoldeDetalhe.objects.create(
-                    molde=molde,
-                    nome_original=p_data.get('name', 'Peca Sem Nome'),
-                    tipo_geom=tipo,
-                    area_base_mm2=area,
-                    largura_mm=w_current,
-                    altura_mm=h_current,
-                    # material_padrao removed
-                    qtd_padrao=p_data.get('qty', 1),
-                    rotacao_fixa=is_fixed,
-                    orientacao_fio=str(grain_axis),
-                    geometria_json=geom
-                )
+        return sync_molde_pieces(molde, pieces_data)
             
     except Exception as e:
         print(f"Erro ao processar JSON: {e}")
@@ -0,0 +1,122 @@
+"""
+Parsing of mold files (.mld / .json) into MoldeDetalhe field values.
+
+Pure functions (no ORM): process_molde_json diffs the indexed_piece_fields()
+of an upload against the stored pieces, and the bulk importer runs
+parse_mold_file() in worker processes, leaving only the inserts to the main process.
+"""
+import json
+import os
+
+from encaixe.services import geometry_kernel as gk
+from encaixe.services.geometry import index_fields, piece_area, piece_bbox
+from encaixe.utils import MldFile
+
+MOLD_EXTENSIONS = ('.mld', '.json')
+
+
+def piece_fields(p_data):
+    """
+    MoldeDetalhe field values of one piece of the file ('pieces' entry):
+    grain / auto-orient rotation applied to the geometry, rotation lock and
+    the area of the file (0 when absent; the geometry index fills it).
+    """
+    geom = p_data.get('geom', {})
+    tipo = geom.get('type', 'unknown')
+
+    # Area (Priority: JSON value > Calculated by the geometry index on save)
+    area = float(p_data.get('area_mm2', 0.0))
+    w_current, h_current = piece_bbox(geom)
+
+    # Rotation Constraints and Grain
+    can_rotate = p_data.get('canRotate', True)
+    fixed_rot = p_data.get('fixedRotation', False)
+    auto_orient = p_data.get('autoOrient', False)
+    grain_axis = p_data.get('grainAxis', p_data.get('grain', 'y'))
+
+    should_rotate_90 = False
+
+    # Logic 1: Auto Orient (Longest Side -> Y)
+    # Only for pieces without an area, neither in the file nor from the geometry
+    if area == 0.0 and piece_area(geom) == 0.0 and auto_orient:
+        if w_current > h_current:
+            should_rotate_90 = True
+
+    # Logic 2: Explicit Grain Axis (Arrow)
+    if str(grain_axis).lower() in ['x', 'h', 'horizontal']:
+        should_rotate_90 = True
+
+    if should_rotate_90:
+        # Perform Rotation (Transpose / Flip)
+        if tipo == 'rect':
+            hw = geom.get('halfW', 0)
+            hh = geom.get('halfH', 0)
+            geom['halfW'] = hh
+            geom['halfH'] = hw
+        elif tipo == 'poly':
+            pts = geom.get('pts', [])
+            if pts:
+                # Rotate (x,y) -> (y, -x) and normalize to (0, 0)
+                rotated = gk.rotate(gk.as_array(pts), -90)
+                geom['pts'] = gk.to_points(gk.normalize(rotated))
+
+        fixed_rot = True
+
+    is_fixed = False
+    if can_rotate is False: is_fixed = True
+    if fixed_rot is True: is_fixed = True
+
+    return {
+        'nome_original': p_data.get('name', 'Peca Sem Nome'),
+        'id_externo': str(p_data.get('id') or ''),
+        'tipo_geom': tipo,
+        'area_base_mm2': area,
+        'qtd_padrao': p_data.get('qty', 1),
+        'rotacao_fixa': is_fixed,
+        'orientacao_fio': str(grain_axis),
+        'geometria_json': geom,
+    }
+
+
+def indexed_piece_fields(p_data):
+    """piece_fields() plus the geometry index (what MoldeDetalhe.atualizar_indice sets)."""
+    fields = piece_fields(p_data)
+    fields.update(index_fields(fields['geometria_json'], fields['area_base_mm2']))
+    return fields
+
+
+def read_mold_source(path):
+    """(data dict, thumbnail bytes or None) of a .mld, or of a plain JSON file."""
+    try:
+        with MldFile(path) as mld:
+            return mld.data, bytes(mld.thumbnail) or None
+    except ValueError:
+        if not path.lower().endswith('.json'):
+            raise
+    with open(path, 'rb') as f:
+        return json.loads(f.read().decode('utf-8-sig')), None
+
+
+def parse_mold_file(path):
+    """
+    Worker of the bulk import: reads one file and computes the pieces with
+    their geometry index.
+    Never raises: errors come back in 'error' so one bad file does not stop the pool.
+    """
+    try:
+        data, thumbnail = read_mold_source(path)
+        if not isinstance(data, dict):
+            raise ValueError('JSON sem objeto raiz')
+
+        pieces = [indexed_piece_fields(p_data) for p_data in data.get('pieces', [])]
+        return {'path': path, 'pieces': pieces, 'thumbnail': thumbnail, 'error': None}
+    except Exception as e:
+        return {'path': path, 'pieces': [], 'thumbnail': None, 'error': f'{type(e).__name__}: {e}'}
+
+
+def find_mold_files(root):
+    """Paths of the .mld / .json files under `root`, sorted."""
+    found = []
+    for directory, _, files in os.walk(root):
+        found.extend(os.path.join(directory, name) for name in files if name.lower().endswith(MOLD_EXTENSIONS))
+    return sorted(found)
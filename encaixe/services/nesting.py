@@ -0,0 +1,283 @@
+"""
+Nesting (encaixe) of mold pieces on fabric rolls.
+
+The default engine is the skyline bin packer (bounding boxes), a port of the packer that used to run in sales/templates/sales/visualize.html:
+pieces are expanded by quantity, grouped by fabric + colour (one roll per
+group), sorted by width descending and placed left-to-right at the lowest
+skyline segment that fits ("best fit"). The marker length of a group is the
+highest point of its skyline.
+
+Two engines share this orchestration:
+  - 'skyline' (default): bounding boxes only, fast, used for previews;
+  - 'true_shape': no-fit-polygon placement of the piece outlines
+    (see encaixe/services/true_shape.py), slower and tighter.
+The default comes from ENCAIXE_NESTING_ENGINE.
+
+Rolls are independent, so nest_rolls() fans the ones missing from the cache
+out to a process pool (ENCAIXE_NESTING_WORKERS, default 1 = in-process).
+Each roll may be bounded by ENCAIXE_NESTING_GROUP_BUDGET seconds. Results are
+merged in input order, so they do not depend on the number of workers.
+
+Input pieces are plain dicts, the same shape visualize.html consumes:
+    {'id', 'name', 'qty', 'w', 'h', 'color', 'color_name', 'fabric_name',
+     'fabric_width', 'geometry_hash', 'rotacao_fixa', 'orientacao_fio', 'pts'}
+'pts' (the outline as [(x, y), ...]) is only used by the true-shape engine;
+pieces without it are nested as their bounding box. An optional 'pts_desenho'
+(a simplified level of detail of 'pts') is returned as the placed outline
+instead of 'pts'; the nesting itself always uses 'pts'.
+'geometry_hash' keys the layout cache in place of the outline, so it must be
+the MoldeDetalhe.geometria_hash of that exact geometry (marker.get_item_pieces);
+pieces from other sources leave it out and are keyed by 'pts'.
+"""
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+
+from encaixe.services import nesting_cache
+from encaixe.services.skyline import skyline_pack, skyline_layout
+from encaixe.services import geometry_kernel as gk
+from encaixe.services.true_shape import allowed_rotations, bbox_shape, rotated_outline, true_shape_layout
+
+DEFAULT_FABRIC_WIDTH_MM = 1500
+DEFAULT_FABRIC_NAME = 'Tecido Padrão'
+DEFAULT_COLOR_NAME = 'Outro'
+
+ENGINE_SKYLINE = 'skyline'
+ENGINE_TRUE_SHAPE = 'true_shape'
+ENGINES = (ENGINE_SKYLINE, ENGINE_TRUE_SHAPE)
+
+# Copies (sum of qty x quantity) one request may nest
+DEFAULT_MAX_PLACEMENTS = 5000
+
+
+def get_workers(workers=None):
+    return max(int(workers or getattr(settings, 'ENCAIXE_NESTING_WORKERS', 1)), 1)
+
+
+def get_engine(engine=None):
+    engine = engine or getattr(settings, 'ENCAIXE_NESTING_ENGINE', ENGINE_SKYLINE)
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown nesting engine: {engine}")
+    return engine
+
+
+def get_time_budget(time_budget=None):
+    return time_budget or getattr(settings, 'ENCAIXE_NESTING_GROUP_BUDGET', None)
+
+
+def get_max_placements(max_placements=None):
+    return int(max_placements or getattr(settings, 'ENCAIXE_NESTING_MAX_PLACEMENTS', DEFAULT_MAX_PLACEMENTS))
+
+
+def group_key(piece):
+    """Key of the roll a piece is cut from: (fabric, colour name, colour hex)."""
+    return (
+        piece.get('fabric_name') or DEFAULT_FABRIC_NAME,
+        piece.get('color_name') or DEFAULT_COLOR_NAME,
+        piece.get('color') or '',
+    )
+
+
+def group_pieces(pieces):
+    """Groups the distinct pieces by roll. Returns {group_key: [piece, ...]}."""
+    groups = {}
+    for piece in pieces:
+        groups.setdefault(group_key(piece), []).append(piece)
+    return groups
+
+
+def nest_group(items, fabric_width):
+    """
+    Nests one roll of already expanded items (one dict per copy). Pieces are
+    sorted by width descending (stable, like the JS Array.sort) before packing.
+    Returns a JSON-ready dict with placements and marker length (mm).
+    """
+    ordered = sorted(items, key=lambda p: -p['w'])
+    placements, length, unplaced, _ = skyline_pack(ordered, fabric_width)
+
+    return {
+        'fabric_width': fabric_width,
+        'length_mm': length,
+        'placements': [
+            {'id': p.get('id'), 'name': p.get('name'), 'x': x, 'y': y, 'w': p['w'], 'h': p['h']}
+            for p, x, y in placements
+        ],
+        'unplaced': [{'id': p.get('id'), 'name': p.get('name'), 'w': p['w'], 'h': p['h']} for p in unplaced],
+    }
+
+
+def _roll_counts(pieces, quantity):
+    return [max(int(p.get('qty') or 1) * int(quantity), 0) for p in pieces]
+
+
+def count_placements(pieces, quantity=1):
+    """Copies nest_pieces would place: every piece 'qty' times per product."""
+    return sum(_roll_counts(pieces, quantity))
+
+
+def check_placements(pieces, quantity=1):
+    """Raises ValueError when the request would place more than get_max_placements() copies."""
+    total, limit = count_placements(pieces, quantity), get_max_placements()
+    if total > limit:
+        raise ValueError(f"Too many pieces to nest: {total} (max {limit})")
+
+
+def _layout_task(engine, pieces, counts, fabric_width, time_budget):
+    """(function, args) computing the layout of one roll with `engine`."""
+    if engine == ENGINE_TRUE_SHAPE:
+        shapes = [
+            (
+                p.get('pts') or bbox_shape(p['w'], p['h']),
+                allowed_rotations(p.get('rotacao_fixa'), p.get('orientacao_fio')),
+            )
+            for p in pieces
+        ]
+        return true_shape_layout, (shapes, counts, fabric_width, time_budget)
+    return skyline_layout, ([(p['w'], p['h']) for p in pieces], counts, fabric_width, time_budget)
+
+
+def _compute_layouts(tasks, workers):
+    """
+    Runs every (function, args) task, in a process pool when workers > 1.
+    Returns the layouts in task order.
+    """
+    if workers <= 1 or len(tasks) <= 1:
+        return [func(*args) for func, args in tasks]
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+        futures = [pool.submit(func, *args) for func, args in tasks]
+        return [future.result() for future in futures]
+
+
+def _hydrate(pieces, layout, fabric_width):
+    """Turns an index-based layout into placements of the caller's pieces."""
+    def _piece(index):
+        p = pieces[index]
+        return {'id': p.get('id'), 'name': p.get('name'), 'w': p['w'], 'h': p['h']}
+
+    # Rotated outline per (piece, angle), translated to each copy
+    outlines = {}
+
+    def _outline(index, angle, x, y):
+        if (index, angle) not in outlines:
+            p = pieces[index]
+            outlines[index, angle] = rotated_outline(p['pts'], angle, p.get('pts_desenho'))
+        rotated, min_x, min_y = outlines[index, angle]
+        return gk.to_tuples(gk.translate(rotated, x - min_x, y - min_y))
+
+    placements = []
+    for index, x, y, *rotation in layout['placements']:
+        placement = _piece(index)
+        placement.update({'x': x, 'y': y})
+        if rotation:
+            # True-shape layouts: angle and the outline on the roll
+            placement['rotation'] = rotation[0]
+            if pieces[index].get('pts'):
+                placement['pts'] = _outline(index, rotation[0], x, y)
+        placements.append(placement)
+
+    return {
+        'fabric_width': fabric_width,
+        'length_mm': layout['length_mm'],
+        'placements': placements,
+        'unplaced': [_piece(index) for index in layout['unplaced']],
+        'complete': layout.get('complete', True),
+    }
+
+
+def nest_rolls(rolls, workers=None, time_budget=None, engine=None):
+    """
+    Nests many independent rolls. `rolls` is a list of
+    (pieces, quantity, fabric_width), where `pieces` are the distinct pieces of
+    the roll (each cut 'qty' times per product).
+
+    Layouts are looked up in the cache (see nesting_cache); the misses are
+    computed once per distinct key, in parallel when workers > 1. Layouts cut
+    short by the time budget are returned but not cached.
+    Returns one nest_group-like dict per roll, in input order.
+    """
+    workers = get_workers(workers)
+    time_budget = get_time_budget(time_budget)
+    engine = get_engine(engine)
+
+    keys = []
+    layouts = {}
+    missing = {}
+    for pieces, quantity, fabric_width in rolls:
+        counts = _roll_counts(pieces, quantity)
+        key = nesting_cache.nesting_key(engine, pieces, counts, fabric_width)
+        keys.append(key)
+
+        if key in layouts or key in missing:
+            continue
+        layout = nesting_cache.get_layout(key)
+        if layout is not None:
+            layouts[key] = layout
+        else:
+            missing[key] = (pieces, counts, fabric_width)
+
+    if missing:
+        tasks = [
+            _layout_task(engine, pieces, counts, fabric_width, time_budget)
+            for pieces, counts, fabric_width in missing.values()
+        ]
+        for key, layout in zip(missing, _compute_layouts(tasks, workers)):
+            layouts[key] = layout
+            if layout['complete']:
+                pieces = missing[key][0]
+                nesting_cache.store_layout(key, layout, [p.get('geometry_hash') for p in pieces])
+
+    return [
+        _hydrate(pieces, layouts[key], fabric_width)
+        for (pieces, _, fabric_width), key in zip(rolls, keys)
+    ]
+
+
+def nest_roll(pieces, quantity, fabric_width, engine=None):
+    """
+    Nests `quantity` products made of the distinct `pieces` of one roll.
+    Returns the same dict as nest_group.
+    """
+    return nest_rolls([(pieces, quantity, fabric_width)], workers=1, engine=engine)[0]
+
+
+def _group_width(items, fabric_width):
+    if fabric_width:
+        return fabric_width
+    return items[0].get('fabric_width') or DEFAULT_FABRIC_WIDTH_MM
+
+
+def nest_pieces(pieces, quantity=1, fabric_width=None, workers=None, time_budget=None, engine=None):
+    """
+    Nests `quantity` products made of `pieces`, one roll per fabric + colour.
+
+    `fabric_width` overrides the width of every roll; when omitted each group
+    uses the 'fabric_width' of its pieces (default 1500 mm).
+
+    Returns:
+        {
+          'length_mm': total marker length over all rolls,
+          'groups': [{'fabric_name', 'color_name', 'color', 'fabric_width',
+                      'length_mm', 'placements': [...], 'unplaced': [...],
+                      'complete'}],
+        }
+    Groups come sorted by (fabric, colour) so the result is deterministic.
+    """
+    groups = group_pieces(pieces)
+    keys = sorted(groups)
+
+    nested = nest_rolls(
+        [(groups[key], quantity, _group_width(groups[key], fabric_width)) for key in keys],
+        workers=workers,
+        time_budget=time_budget,
+        engine=engine,
+    )
+
+    result_groups = []
+    total = 0.0
+    for (fabric_name, color_name, color), group in zip(keys, nested):
+        group.update({'fabric_name': fabric_name, 'color_name': color_name, 'color': color})
+        result_groups.append(group)
+        total += group['length_mm']
+
+    return {'length_mm': total, 'engine': get_engine(engine), 'groups': result_groups}
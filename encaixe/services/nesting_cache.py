@@ -0,0 +1,173 @@
+"""
+Cache of nesting layouts.
+
+A layout depends only on the content of the pieces (geometry hash, bbox,
+rotation/grain flags), how many copies of each are cut and the roll width, so
+the key is a hash of exactly that. Repeat SKUs hit the same key regardless of
+order, item or mold.
+
+Two levels:
+  - an in-process LRU (ENCAIXE_NESTING_CACHE_SIZE entries, default 1024);
+  - an optional persistent table, EncaixeCache
+    (ENCAIXE_NESTING_CACHE_PERSISTENT = True), shared between processes.
+
+Entries remember the geometry hashes they were built from so re-importing a
+mold (process_molde_json) can drop them with invalidate_geometries().
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import Q
+
+from encaixe.models import EncaixeCache
+
+DEFAULT_CACHE_SIZE = 1024
+
+
+class LRUCache:
+    """Thread-safe LRU of key -> value, indexed by geometry hash for invalidation."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()      # key -> (value, geometries)
+        self._by_geometry = {}          # geometry hash -> {key}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            self._data.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value, geometries=()):
+        geometries = frozenset(geometries)
+        with self._lock:
+            if key in self._data:
+                self._discard(key)
+            self._data[key] = (value, geometries)
+            for geometry in geometries:
+                self._by_geometry.setdefault(geometry, set()).add(key)
+
+            while len(self._data) > self.maxsize:
+                self._discard(next(iter(self._data)))
+
+    def invalidate(self, geometries):
+        with self._lock:
+            for geometry in geometries:
+                for key in list(self._by_geometry.get(geometry, ())):
+                    self._discard(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._by_geometry.clear()
+
+    def _discard(self, key):
+        _, geometries = self._data.pop(key)
+        for geometry in geometries:
+            keys = self._by_geometry.get(geometry)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_geometry[geometry]
+
+
+_memory = None
+_memory_lock = threading.Lock()
+
+
+def _memory_cache():
+    global _memory
+    if _memory is None:
+        with _memory_lock:
+            if _memory is None:
+                _memory = LRUCache(getattr(settings, 'ENCAIXE_NESTING_CACHE_SIZE', DEFAULT_CACHE_SIZE))
+    return _memory
+
+
+def persistent_enabled():
+    return getattr(settings, 'ENCAIXE_NESTING_CACHE_PERSISTENT', False)
+
+
+def nesting_key(engine, pieces, counts, fabric_width):
+    """
+    Content hash of a nesting request.
+    `pieces` are the distinct pieces of one roll, `counts` the copies of each.
+    """
+    payload = {
+        'engine': engine,
+        'width': float(fabric_width),
+        'pieces': [
+            [
+                # Pieces without a stored geometry are keyed by their outline
+                p.get('geometry_hash') or p.get('pts') or '',
+                float(p['w']),
+                float(p['h']),
+                int(count),
+                bool(p.get('rotacao_fixa')),
+                p.get('orientacao_fio') or '',
+            ]
+            for p, count in zip(pieces, counts)
+        ],
+    }
+    data = json.dumps(payload, separators=(',', ':'))
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def get_layout(key):
+    """Cached layout for `key`, or None."""
+    memory = _memory_cache()
+    layout = memory.get(key)
+    if layout is not None:
+        return layout
+
+    if persistent_enabled():
+        row = EncaixeCache.objects.filter(chave=key).values('resultado', 'geometrias').first()
+        if row:
+            layout = row['resultado']
+            memory.set(key, layout, row['geometrias'].split())
+            return layout
+
+    return None
+
+
+def store_layout(key, layout, geometries=()):
+    """Stores a (JSON-serializable) layout built from the given geometry hashes."""
+    geometries = sorted({g for g in geometries if g})
+    _memory_cache().set(key, layout, geometries)
+
+    if persistent_enabled():
+        EncaixeCache.objects.update_or_create(
+            chave=key,
+            defaults={'resultado': layout, 'geometrias': ' '.join(geometries)},
+        )
+
+
+def invalidate_geometries(hashes):
+    """Drops every cached layout that used one of the given geometry hashes."""
+    hashes = {h for h in hashes if h}
+    if not hashes:
+        return
+
+    _memory_cache().invalidate(hashes)
+
+    if persistent_enabled():
+        query = Q()
+        for h in hashes:
+            query |= Q(geometrias__contains=h)
+        EncaixeCache.objects.filter(query).delete()
+
+
+def clear():
+    """Empties the in-memory cache and the persistent table."""
+    _memory_cache().clear()
+    if persistent_enabled():
+        EncaixeCache.objects.all().delete()
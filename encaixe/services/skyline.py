@@ -0,0 +1,157 @@
+"""
+Skyline packing kernel.
+
+Pure Python with no Django imports, so it can run inside process-pool
+workers regardless of the start method (fork, spawn or forkserver).
+The orchestration (grouping, cache, pool) lives in encaixe/services/nesting.py.
+"""
+import time
+
+# Same tolerance the JS used when merging skyline segments
+_MERGE_EPS = 0.1
+
+# How often (in placements) the deadline is checked
+_DEADLINE_STRIDE = 64
+
+
+def _shelf_pack(items, fabric_width, start_y):
+    """
+    Simple rows, left to right, starting at `start_y`. Used for the pieces
+    left over when a group runs out of time budget.
+    Returns (placements, length, unplaced).
+    """
+    placements = []
+    unplaced = []
+    x = 0.0
+    y = start_y
+    row_h = 0.0
+    for item in items:
+        w = item['w']
+        h = item['h']
+        if w > fabric_width:
+            unplaced.append(item)
+            continue
+        if x + w > fabric_width:
+            y += row_h
+            x = 0.0
+            row_h = 0.0
+        placements.append((item, x, y))
+        x += w
+        if h > row_h:
+            row_h = h
+    return placements, y + row_h, unplaced
+
+
+def skyline_pack(items, fabric_width, deadline=None):
+    """
+    Packs `items` (dicts with 'w' and 'h', already in placement order) on a
+    roll of `fabric_width` mm.
+
+    `deadline` (time.monotonic() value) bounds the run: once it passes, the
+    remaining items are laid in plain rows on top of the skyline.
+
+    Returns (placements, length_mm, unplaced, complete):
+      placements: [(item, x, y)] with y relative to the start of the roll
+      length_mm:  height of the skyline after the last placement
+      unplaced:   items wider than the roll
+      complete:   False when the deadline cut the skyline search short
+    """
+    skyline = [[0.0, 0.0, float(fabric_width)]]  # [x, y, w]
+    placements = []
+    unplaced = []
+    length = 0.0
+
+    for n, item in enumerate(items):
+        if deadline is not None and n % _DEADLINE_STRIDE == 0 and n and time.monotonic() > deadline:
+            rest, rest_length, rest_unplaced = _shelf_pack(items[n:], fabric_width, length)
+            placements.extend(rest)
+            unplaced.extend(rest_unplaced)
+            return placements, max(length, rest_length), unplaced, False
+
+        w = item['w']
+        h = item['h']
+
+        # Find position: lowest y over the segments spanned by the piece
+        best_index = None
+        best_y = float('inf')
+        for i in range(len(skyline)):
+            x = skyline[i][0]
+            if x + w > fabric_width:
+                continue
+
+            y = 0.0
+            width_left = w
+            for j in range(i, len(skyline)):
+                if skyline[j][1] > y:
+                    y = skyline[j][1]
+                width_left -= skyline[j][2]
+                if width_left <= 0:
+                    break
+
+            if width_left <= 0 and y < best_y:
+                best_y = y
+                best_index = i
+
+        if best_index is None:
+            unplaced.append(item)
+            continue
+
+        x = skyline[best_index][0]
+        top = best_y + h
+        if top > length:
+            length = top
+        placements.append((item, x, best_y))
+
+        # Update skyline: cut the region [x, x + w) and raise it to `top`
+        region_end = x + w
+        new_skyline = []
+        for node in skyline:
+            node_end = node[0] + node[2]
+            if node_end <= x:
+                new_skyline.append(node)
+            elif node[0] < x < node_end:
+                new_skyline.append([node[0], node[1], x - node[0]])
+        new_skyline.append([x, top, region_end - x])
+        for node in skyline:
+            node_end = node[0] + node[2]
+            if node[0] >= region_end:
+                new_skyline.append(node)
+            elif node[0] < region_end < node_end:
+                new_skyline.append([region_end, node[1], node_end - region_end])
+
+        # Merge neighbours at the same height
+        merged = [new_skyline[0]]
+        for node in new_skyline[1:]:
+            current = merged[-1]
+            if abs(current[1] - node[1]) < _MERGE_EPS and abs(current[0] + current[2] - node[0]) < _MERGE_EPS:
+                merged[-1] = [current[0], current[1], current[2] + node[2]]
+            else:
+                merged.append(node)
+        skyline = merged
+
+    return placements, length, unplaced, True
+
+
+def skyline_layout(sizes, counts, fabric_width, time_budget=None):
+    """
+    Layout of one roll by piece index. `sizes` are the (w, h) of the distinct
+    pieces and `counts` the copies of each. Pieces are sorted by width
+    descending (stable, like the JS Array.sort) before packing.
+
+    Returns {'length_mm', 'placements': [[index, x, y], ...],
+             'unplaced': [index, ...], 'complete': bool}
+    """
+    deadline = time.monotonic() + time_budget if time_budget else None
+
+    protos = [{'w': w, 'h': h, 'index': i} for i, (w, h) in enumerate(sizes)]
+    items = [proto for proto, count in zip(protos, counts) for _ in range(count)]
+
+    ordered = sorted(items, key=lambda p: -p['w'])
+    placements, length, unplaced, complete = skyline_pack(ordered, fabric_width, deadline)
+
+    return {
+        'length_mm': length,
+        'placements': [[p['index'], x, y] for p, x, y in placements],
+        'unplaced': [p['index'] for p in unplaced],
+        'complete': complete,
+    }
@@ -0,0 +1,280 @@
+"""
+True-shape nesting with no-fit polygons (NFP).
+
+Each piece is placed by its polygon instead of its bounding box:
+
+  - the polygon (MoldeDetalhe.geometria_json 'pts', rects and circles are
+    converted by piece_points) is rotated by every allowed angle and reduced to
+    its convex hull. Convex pieces (trapezoids, rounded panels) are nested
+    exactly; concave ones conservatively, by their hull, so pieces never overlap;
+  - the NFP of a placed piece A and a moving piece B is the Minkowski sum
+    A + (-B): B overlaps A exactly when its reference point (bbox bottom-left)
+    is inside it. NFPs only depend on the two shapes, so they are computed once
+    per (shape, rotation) pair and translated;
+  - candidate positions are the vertical lines through NFP vertices (plus the
+    roll edges). On each line the piece drops to the lowest y outside every
+    NFP; the candidate with the lowest top (then leftmost) wins.
+
+Rotations: rotacao_fixa keeps the grain line, so only 0/180 deg; pieces whose
+orientacao_fio is horizontal ('x', 'h', 'horizontal') are turned across the
+roll (90/270); free pieces try 0/90/180/270.
+
+Pure Python with no Django imports, so it can run in process-pool workers.
+"""
+import time
+
+from encaixe.services import geometry_kernel as gk
+from encaixe.services.geometry import convex_hull, polygon_area
+
+_EPS = 1e-6
+
+# How often (in placements) the deadline is checked
+_DEADLINE_STRIDE = 8
+
+_HORIZONTAL_GRAIN = ('x', 'h', 'horizontal')
+
+
+def allowed_rotations(rotacao_fixa, orientacao_fio=None):
+    """Rotation angles (degrees) a piece may take on the roll."""
+    if rotacao_fixa:
+        return (0, 180)
+    if str(orientacao_fio or '').lower() in _HORIZONTAL_GRAIN:
+        return (90, 270)
+    return (0, 90, 180, 270)
+
+
+def rotate_points(pts, angle):
+    """Rotates (x, y) points by `angle` degrees. Multiples of 90 are exact."""
+    return gk.to_tuples(gk.rotate(gk.as_array(pts), angle))
+
+
+def _normalized(pts):
+    """Translates points so their bbox starts at (0, 0)."""
+    return gk.to_tuples(gk.normalize(gk.as_array(pts)))
+
+
+class _Shape:
+    """One piece in one rotation: normalized convex hull and its bbox."""
+
+    __slots__ = ('index', 'angle', 'hull', 'w', 'h')
+
+    def __init__(self, index, angle, pts):
+        hull = _normalized(convex_hull(rotate_points(pts, angle)))
+        self.index = index
+        self.angle = angle
+        self.hull = hull
+        self.w = max(x for x, _ in hull)
+        self.h = max(y for _, y in hull)
+
+
+def no_fit_polygon(fixed, moving):
+    """
+    NFP of two convex hulls: Minkowski sum fixed + (-moving), as a convex
+    polygon (counter-clockwise) in the fixed piece's coordinates.
+    """
+    return convex_hull([(ax - bx, ay - by) for ax, ay in fixed for bx, by in moving])
+
+
+def _vertical_interval(poly, x):
+    """
+    (low, high) of the open interval where the vertical line `x` crosses the
+    interior of convex `poly`, or None when it does not.
+    """
+    low = high = None
+    n = len(poly)
+    for i in range(n):
+        x1, y1 = poly[i]
+        x2, y2 = poly[(i + 1) % n]
+        if (x1 - x) * (x2 - x) > 0:
+            continue
+        if x1 == x2:
+            ys = (y1, y2)
+        else:
+            t = (x - x1) / (x2 - x1)
+            ys = (y1 + t * (y2 - y1),)
+        for y in ys:
+            if low is None or y < low:
+                low = y
+            if high is None or y > high:
+                high = y
+    if low is None or high - low <= _EPS:
+        return None
+    return low, high
+
+
+def _variants(index, pts, rotations):
+    """Distinct rotations of a piece (symmetric pieces collapse, e.g. rects at 0/180)."""
+    if len(pts) < 3:
+        return []
+    variants = []
+    seen = set()
+    for angle in rotations:
+        shape = _Shape(index, angle, pts)
+        signature = tuple(sorted((round(x, 6), round(y, 6)) for x, y in shape.hull))
+        if signature not in seen:
+            seen.add(signature)
+            variants.append(shape)
+    return variants
+
+
+class _Placed:
+    __slots__ = ('shape', 'x', 'y', 'top')
+
+    def __init__(self, shape, x, y):
+        self.shape = shape
+        self.x = x
+        self.y = y
+        self.top = y + shape.h
+
+
+def _drop(x, nfps, floor):
+    """Lowest y >= floor on the vertical line x outside every NFP."""
+    intervals = []
+    for poly, px, py, min_x, max_x in nfps:
+        if x <= min_x + px + _EPS or x >= max_x + px - _EPS:
+            continue
+        interval = _vertical_interval(poly, x - px)
+        if interval:
+            intervals.append((interval[0] + py, interval[1] + py))
+
+    y = floor
+    for low, high in sorted(intervals):
+        if y <= low + _EPS:
+            break
+        if high > y:
+            y = high
+    return y
+
+
+def true_shape_layout(shapes, counts, fabric_width, time_budget=None):
+    """
+    Layout of one roll by piece index.
+
+    `shapes` are the distinct pieces as (pts, rotations): the outline as a list
+    of (x, y) and the allowed angles (see allowed_rotations). `counts` are the
+    copies of each. Pieces are placed by hull area, largest first.
+
+    Returns {'length_mm', 'placements': [[index, x, y, angle], ...],
+             'unplaced': [index, ...], 'complete': bool}
+    where (x, y) translate the rotated outline (normalized to its bbox origin,
+    see placement_points) onto the roll.
+    """
+    deadline = time.monotonic() + time_budget if time_budget else None
+
+    variants = [_variants(index, pts, rotations) for index, (pts, rotations) in enumerate(shapes)]
+
+    order = sorted(
+        (index for index, count in enumerate(counts) for _ in range(count)),
+        key=lambda index: -max((polygon_area(v.hull) for v in variants[index]), default=0.0),
+    )
+    max_h = max((v.h for vs in variants for v in vs), default=0.0)
+
+    nfp_cache = {}
+    placed = []
+    placements = []
+    unplaced = []
+    length = 0.0
+
+    for n, index in enumerate(order):
+        if deadline is not None and n % _DEADLINE_STRIDE == 0 and n and time.monotonic() > deadline:
+            rest, length, rest_unplaced = _shelf_rest(order[n:], variants, fabric_width, length)
+            placements.extend(rest)
+            unplaced.extend(rest_unplaced)
+            return _result(length, placements, unplaced, False)
+
+        # Pieces entirely below the floor cannot touch anything placed above it
+        floor = max(0.0, length - 2 * max_h)
+        active = [p for p in placed if p.top > floor]
+
+        best = None
+        for shape in variants[index]:
+            max_x = fabric_width - shape.w
+            if max_x < -_EPS:
+                continue
+            max_x = max(max_x, 0.0)
+
+            nfps = []
+            xs = {0.0, max_x}
+            for p in active:
+                key = (p.shape.index, p.shape.angle, shape.index, shape.angle)
+                entry = nfp_cache.get(key)
+                if entry is None:
+                    poly = no_fit_polygon(p.shape.hull, shape.hull)
+                    entry = (poly, min(x for x, _ in poly), max(x for x, _ in poly))
+                    nfp_cache[key] = entry
+                poly, poly_min_x, poly_max_x = entry
+                nfps.append((poly, p.x, p.y, poly_min_x, poly_max_x))
+                for vx, _ in poly:
+                    x = vx + p.x
+                    if 0.0 <= x <= max_x:
+                        xs.add(x)
+
+            for x in sorted(xs):
+                y = _drop(x, nfps, floor)
+                top = y + shape.h
+                if best is None or top < best[0] - _EPS or (abs(top - best[0]) <= _EPS and x < best[1] - _EPS):
+                    best = (top, x, y, shape)
+
+        if best is None:
+            unplaced.append(index)
+            continue
+
+        top, x, y, shape = best
+        placed.append(_Placed(shape, x, y))
+        placements.append([index, x, y, shape.angle])
+        if top > length:
+            length = top
+
+    return _result(length, placements, unplaced, True)
+
+
+def _shelf_rest(indexes, variants, fabric_width, start_y):
+    """Rows of bounding boxes on top of the marker, for pieces left when the time budget runs out."""
+    placements = []
+    unplaced = []
+    x = 0.0
+    y = start_y
+    row_h = 0.0
+    for index in indexes:
+        fitting = [v for v in variants[index] if v.w <= fabric_width + _EPS]
+        if not fitting:
+            unplaced.append(index)
+            continue
+        shape = fitting[0]
+        if x + shape.w > fabric_width + _EPS:
+            y += row_h
+            x = 0.0
+            row_h = 0.0
+        placements.append([index, x, y, shape.angle])
+        x += shape.w
+        row_h = max(row_h, shape.h)
+    return placements, y + row_h, unplaced
+
+
+def _result(length, placements, unplaced, complete):
+    return {'length_mm': length, 'placements': placements, 'unplaced': unplaced, 'complete': complete}
+
+
+def rotated_outline(pts, angle, outline=None):
+    """
+    (rotated outline, min x, min y) of a piece in one rotation: what
+    placement_points translates to each position. `outline` (a simplified
+    level of detail of `pts`) is rotated instead of `pts`, keeping the offset
+    of the full outline so it lands on the same spot.
+    """
+    rotated = gk.rotate(gk.as_array(pts), angle)
+    min_x, min_y, _, _ = gk.bbox(rotated)
+    if outline is not None:
+        rotated = gk.rotate(gk.as_array(outline), angle)
+    return rotated, min_x, min_y
+
+
+def placement_points(pts, angle, x, y, outline=None):
+    """Outline of a placed piece on the roll (rotated, normalized to the hull bbox, translated)."""
+    rotated, min_x, min_y = rotated_outline(pts, angle, outline)
+    return gk.to_tuples(gk.translate(rotated, x - min_x, y - min_y))
+
+
+def bbox_shape(w, h):
+    """Outline of a piece known only by its bounding box."""
+    return [(0.0, 0.0), (w, 0.0), (w, h), (0.0, h)]
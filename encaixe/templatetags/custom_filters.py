@@ -1,5 +1,7 @@
 from django import template
 
+from inventory.units import resolve_unit, to_display
+
 register = template.Library()
 
 @register.filter
@@ -25,10 +27,4 @@ def format_unit(value, material_or_unit):
         return f"{material_or_unit.get_valor_display(val_float):.2f}"
     
     # Se passou string direta (ex: 'mt')
-    unit_str = str(material_or_unit).lower().strip()
-    if unit_str in ['mt', 'm', 'mts', 'metro', 'metros']:
-        return f"{val_float / 1000.0:.2f}"
-    elif unit_str in ['cm', 'centimetro']:
-        return f"{val_float / 10.0:.2f}"
-        
-    return f"{val_float:.2f}"
+    return f"{to_display(val_float, resolve_unit(material_or_unit)):.2f}"
@@ -1,3 +1,600 @@
-from django.test import TestCase
+import io
+import itertools
+import json
+import math
+import os
+import struct
+import tempfile
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from encaixe.models import EncaixeCache
+from encaixe.services import geometry_kernel as gk, nesting_cache
+from encaixe.services.bulk_molde_import import import_mold_directory
+from encaixe.services.geometry import geometry_hash, piece_area
+from encaixe.services.molde_importer import process_molde_json
+from encaixe.services.molde_parser import piece_fields
+from encaixe.services.nesting import nest_group, nest_pieces, nest_roll
+from encaixe.services.skyline import skyline_pack, skyline_layout
+from encaixe.services.true_shape import allowed_rotations, true_shape_layout
+from encaixe.utils import MLD_MAGIC, MldFile, read_mld_file
+from inventory.models import Material
+from molds.models import Molde, MoldeDetalhe
+from products.models import ItensMaterial, Produto, ProdutoConsumo, ProdutoConsumoPendente
+from products.services.consumo import rebuild_consumos
+
+
+class SkylineNestingTests(SimpleTestCase):
+
+    def test_fills_rows_left_to_right(self):
+        items = [{'id': n, 'w': 400, 'h': 300} for n in range(7)]
+        placements, length, unplaced, complete = skyline_pack(items, 1500)
+
+        # 3 per row (1200 of 1500 mm), 3 rows
+        self.assertEqual([(x, y) for _, x, y in placements][:4], [(0, 0), (400, 0), (800, 0), (0, 300)])
+        self.assertEqual(length, 900)
+        self.assertEqual(unplaced, [])
+        self.assertTrue(complete)
+
+    def test_best_fit_uses_lowest_segment(self):
+        # The tall piece raises the left side; the small ones go to the low right side
+        group = nest_group([
+            {'id': 'a', 'w': 1000, 'h': 800},
+            {'id': 'b', 'w': 500, 'h': 200},
+            {'id': 'c', 'w': 500, 'h': 200},
+        ], 1500)
+
+        positions = {p['id']: (p['x'], p['y']) for p in group['placements']}
+        self.assertEqual(positions, {'a': (0, 0), 'b': (1000, 0), 'c': (1000, 200)})
+        self.assertEqual(group['length_mm'], 800)
+
+    def test_pieces_wider_than_the_roll_are_reported(self):
+        group = nest_group([{'id': 'big', 'w': 1600, 'h': 100}, {'id': 'ok', 'w': 100, 'h': 100}], 1500)
+        self.assertEqual([p['id'] for p in group['unplaced']], ['big'])
+        self.assertEqual(group['length_mm'], 100)
+
+    def test_groups_by_fabric_and_colour(self):
+        pieces = [
+            {'id': 1, 'name': 'Corpo', 'qty': 2, 'w': 700, 'h': 500, 'fabric_name': 'Lona', 'color_name': 'Preto', 'color': '#000'},
+            {'id': 2, 'name': 'Fundo', 'qty': 1, 'w': 300, 'h': 150, 'fabric_name': 'Lona', 'color_name': 'Azul', 'color': '#00f'},
+        ]
+        result = nest_pieces(pieces, quantity=3, fabric_width=1400)
+
+        self.assertEqual([(g['fabric_name'], g['color_name']) for g in result['groups']], [('Lona', 'Azul'), ('Lona', 'Preto')])
+        azul, preto = result['groups']
+        self.assertEqual(len(azul['placements']), 3)
+        self.assertEqual(len(preto['placements']), 6)
+        # 2 per row -> 3 rows of 500 mm
+        self.assertEqual(preto['length_mm'], 1500)
+        self.assertEqual(result['length_mm'], azul['length_mm'] + preto['length_mm'])
+
+    @override_settings(ENCAIXE_NESTING_MAX_PLACEMENTS=100)
+    def test_api_rejects_too_many_copies(self):
+        pieces = [{'id': 1, 'qty': 30, 'w': 100, 'h': 50}, {'id': 2, 'qty': 20, 'w': 80, 'h': 40}]
+        body = {'pecas': pieces, 'quantidade': 2, 'largura': 1000}
+
+        with mock.patch('api.views.nest_pieces', return_value={}) as nest:
+            ok = self.client.post(reverse('api_nest'), json.dumps(body), content_type='application/json')
+            body['quantidade'] = 3
+            response = self.client.post(reverse('api_nest'), json.dumps(body), content_type='application/json')
+
+        self.assertEqual(ok.status_code, 200)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('150', response.json()['error'])
+        self.assertEqual(nest.call_count, 1)
+
+
+class NestingCacheTests(TestCase):
+
+    pieces = [
+        {'id': 1, 'name': 'Corpo', 'qty': 2, 'w': 420, 'h': 610, 'geometry_hash': 'corpo'},
+        {'id': 2, 'name': 'Fundo', 'qty': 1, 'w': 320, 'h': 150, 'geometry_hash': 'fundo'},
+    ]
+
+    def setUp(self):
+        nesting_cache.clear()
+
+    def _count_packs(self):
+        return mock.patch('encaixe.services.nesting.skyline_layout', wraps=skyline_layout)
+
+    def test_repeat_requests_are_lookups(self):
+        with self._count_packs() as pack:
+            first = nest_roll(self.pieces, 10, 1500)
+            second = nest_roll(self.pieces, 10, 1500)
+            nest_roll(self.pieces, 11, 1500)
+            nest_roll(self.pieces, 10, 1400)
+
+        self.assertEqual(first, second)
+        self.assertEqual(pack.call_count, 3)
+
+    def test_hit_is_rebuilt_with_the_callers_ids(self):
+        nest_roll(self.pieces, 2, 1500)
+        other_mold = [dict(p, id=p['id'] + 100, name=p['name'] + ' B') for p in self.pieces]
+
+        with self._count_packs() as pack:
+            result = nest_roll(other_mold, 2, 1500)
+
+        self.assertEqual(pack.call_count, 0)
+        self.assertEqual({p['id'] for p in result['placements']}, {101, 102})
+
+    def test_rotation_flags_are_part_of_the_key(self):
+        fixed = [dict(p, rotacao_fixa=True) for p in self.pieces]
+        self.assertNotEqual(
+            nesting_cache.nesting_key('skyline', self.pieces, [1, 1], 1500),
+            nesting_cache.nesting_key('skyline', fixed, [1, 1], 1500),
+        )
+
+    @override_settings(ENCAIXE_NESTING_CACHE_PERSISTENT=True)
+    def test_persistent_table_and_invalidation(self):
+        nest_roll(self.pieces, 5, 1500)
+        self.assertEqual(EncaixeCache.objects.count(), 1)
+
+        # Another process: empty memory, hit from the table
+        nesting_cache._memory_cache().clear()
+        with self._count_packs() as pack:
+            nest_roll(self.pieces, 5, 1500)
+        self.assertEqual(pack.call_count, 0)
+
+        nesting_cache.invalidate_geometries(['fundo'])
+        self.assertEqual(EncaixeCache.objects.count(), 0)
+        with self._count_packs() as pack:
+            nest_roll(self.pieces, 5, 1500)
+        self.assertEqual(pack.call_count, 1)
+
+    @override_settings(ENCAIXE_NESTING_CACHE_PERSISTENT=True)
+    def test_api_pieces_are_keyed_by_their_outline(self):
+        # A client sends the hash of a stored piece with another outline
+        piece = {'id': 1, 'qty': 1, 'w': 100, 'h': 100, 'geometry_hash': 'corpo',
+                 'pts': [[0, 0], [100, 0], [0, 100]]}
+        body = {'pecas': [piece], 'largura': 1500, 'engine': 'true_shape'}
+        response = self.client.post(reverse('api_nest'), json.dumps(body), content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        stored = dict(piece, pts=None)
+        self.assertIsNone(nesting_cache.get_layout(nesting_cache.nesting_key('true_shape', [stored], [1], 1500)))
+        self.assertEqual(EncaixeCache.objects.get().geometrias, '')
+
+    def test_lru_evicts_least_recently_used(self):
+        lru = nesting_cache.LRUCache(2)
+        lru.set('a', 1, ['g1'])
+        lru.set('b', 2, ['g2'])
+        lru.get('a')
+        lru.set('c', 3, ['g1'])
+
+        self.assertIsNone(lru.get('b'))
+        lru.invalidate(['g1'])
+        self.assertEqual(len(lru), 0)
+
+
+class ParallelNestingTests(SimpleTestCase):
+
+    def _pieces(self):
+        fabrics = ['Lona', 'Nylon', 'Oxford']
+        colours = [('Preto', '#000'), ('Azul', '#00f'), ('Vermelho', '#f00')]
+        pieces = []
+        for n in range(12):
+            colour_name, colour = colours[n % 3]
+            pieces.append({
+                'id': n, 'name': f'P{n}', 'qty': 1 + n % 3,
+                'w': 150 + 37 * n, 'h': 90 + 23 * (n % 5),
+                'fabric_name': fabrics[n % 3 if n < 9 else 0], 'color_name': colour_name, 'color': colour,
+                'geometry_hash': f'parallel-{n}',
+            })
+        return pieces
+
+    def setUp(self):
+        nesting_cache.clear()
+
+    def test_workers_do_not_change_the_result(self):
+        serial = nest_pieces(self._pieces(), quantity=25, fabric_width=1500, workers=1)
+        nesting_cache.clear()
+        parallel = nest_pieces(self._pieces(), quantity=25, fabric_width=1500, workers=4)
+
+        self.assertGreater(len(serial['groups']), 3)
+        self.assertEqual(serial, parallel)
+
+    def test_time_budget_finishes_the_roll_in_rows(self):
+        items = [{'w': 100 + n % 7, 'h': 50} for n in range(200)]
+        placements, length, unplaced, complete = skyline_pack(items, 1000, deadline=0)
+
+        self.assertFalse(complete)
+        self.assertEqual(len(placements), 200)
+        self.assertEqual(unplaced, [])
+        self.assertGreater(length, 0)
+
+    @override_settings(ENCAIXE_NESTING_GROUP_BUDGET=5)
+    def test_partial_layouts_are_not_cached(self):
+        pieces = [{'id': 1, 'w': 100, 'h': 50, 'qty': 1, 'geometry_hash': 'budget'}]
+        clock = itertools.chain([0], itertools.repeat(10))
+        with mock.patch('encaixe.services.skyline.time.monotonic', side_effect=clock):
+            result = nest_roll(pieces, 200, 1000)
+        self.assertFalse(result['complete'])
+        self.assertIsNone(nesting_cache.get_layout(
+            nesting_cache.nesting_key('skyline', pieces, [200], 1000)
+        ))
+
+
+class TrueShapeNestingTests(SimpleTestCase):
+    TRAPEZOID = [(0, 0), (400, 0), (300, 600), (100, 600)]
+
+    def _overlaps(self, a, b):
+        # Separating axis test on convex outlines
+        for poly in (a, b):
+            for i in range(len(poly)):
+                x1, y1 = poly[i]
+                x2, y2 = poly[(i + 1) % len(poly)]
+                nx, ny = y1 - y2, x2 - x1
+                pa = [nx * x + ny * y for x, y in a]
+                pb = [nx * x + ny * y for x, y in b]
+                if max(pa) <= min(pb) + 1e-3 or max(pb) <= min(pa) + 1e-3:
+                    return False
+        return True
+
+    def test_allowed_rotations(self):
+        self.assertEqual(allowed_rotations(True, 'vertical'), (0, 180))
+        self.assertEqual(allowed_rotations(False, 'horizontal'), (90, 270))
+        self.assertEqual(allowed_rotations(False, None), (0, 90, 180, 270))
+
+    def test_trapezoids_nest_tighter_than_bounding_boxes(self):
+        shape = true_shape_layout([(self.TRAPEZOID, (0, 180))], [12], 1500)
+        bbox = skyline_layout([(400, 600)], [12], 1500)
+
+        self.assertTrue(shape['complete'])
+        self.assertEqual(len(shape['placements']), 12)
+        self.assertLess(shape['length_mm'], bbox['length_mm'])
+        self.assertTrue({angle for *_, angle in shape['placements']} <= {0, 180})
+
+    def test_placed_outlines_do_not_overlap(self):
+        pieces = [
+            {'id': 't', 'w': 400, 'h': 600, 'qty': 3, 'pts': self.TRAPEZOID, 'rotacao_fixa': True},
+            {'id': 'r', 'w': 300, 'h': 200, 'qty': 2, 'pts': [(0, 0), (300, 0), (300, 200), (0, 200)]},
+            {'id': 'x', 'w': 250, 'h': 250, 'qty': 2, 'pts': [(0, 0), (250, 0), (0, 250)]},
+        ]
+        nesting_cache.clear()
+        group = nest_pieces(pieces, quantity=2, fabric_width=1200, engine='true_shape')['groups'][0]
+
+        outlines = [p['pts'] for p in group['placements']]
+        self.assertEqual(len(outlines), 14)
+        for p in group['placements']:
+            self.assertIn('rotation', p)
+            self.assertTrue(all(-1e-6 <= x <= 1200 + 1e-6 and y >= -1e-6 for x, y in p['pts']))
+        for i in range(len(outlines)):
+            for j in range(i + 1, len(outlines)):
+                self.assertFalse(self._overlaps(outlines[i], outlines[j]), (i, j))
+
+
+class GeometryKernelTests(SimpleTestCase):
+    L_SHAPE = [{'x': 0, 'y': 0}, {'x': 400, 'y': 0}, {'x': 400, 'y': 100}, {'x': 100, 'y': 100},
+               {'x': 100, 'y': 300}, {'x': 0, 'y': 300}]
+
+    def _scalar_area(self, pts):
+        n = len(pts)
+        return abs(sum(pts[i][0] * pts[(i + 1) % n][1] - pts[(i + 1) % n][0] * pts[i][1] for i in range(n))) / 2
+
+    def test_area_centroid_bbox(self):
+        arr = gk.as_array(self.L_SHAPE)
+        self.assertEqual(arr.shape, (6, 2))
+        self.assertTrue(arr.flags['C_CONTIGUOUS'])
+        self.assertEqual(gk.area(arr), 60000.0)
+        self.assertEqual(gk.bbox(arr), (0.0, 0.0, 400.0, 300.0))
+        # 400x100 bar (centroid 200, 50) + 100x200 column (centroid 50, 200)
+        cx, cy = gk.centroid(arr)
+        self.assertAlmostEqual(cx, (40000 * 200 + 20000 * 50) / 60000)
+        self.assertAlmostEqual(cy, (40000 * 50 + 20000 * 200) / 60000)
+
+    def test_rotation_and_translation(self):
+        arr = gk.as_array(self.L_SHAPE)
+        self.assertEqual(gk.to_tuples(gk.rotate(arr, 90))[1], (0.0, 400.0))
+        self.assertEqual(gk.to_tuples(gk.rotate(arr, -90))[1], (0.0, -400.0))
+
+        turned = gk.rotate(arr, 37.5, origin=(200, 150))
+        self.assertAlmostEqual(gk.area(turned), 60000.0, places=6)
+        back = gk.rotate(turned, -37.5, origin=(200, 150))
+        for (x1, y1), (x2, y2) in zip(gk.to_tuples(back), gk.to_tuples(arr)):
+            self.assertAlmostEqual(x1, x2, places=9)
+            self.assertAlmostEqual(y1, y2, places=9)
+
+        moved = gk.translate(arr, 10, -5)
+        self.assertEqual(gk.bbox(moved), (10.0, -5.0, 410.0, 295.0))
+        self.assertEqual(gk.bbox(gk.normalize(moved)), (0.0, 0.0, 400.0, 300.0))
+
+    def test_matches_scalar_math_on_spline_outline(self):
+        step = 2 * math.pi / 5000
+        pts = [((300 + 40 * math.sin(7 * i * step)) * math.cos(i * step),
+                (300 + 40 * math.sin(7 * i * step)) * math.sin(i * step)) for i in range(5000)]
+        arr = gk.as_array(pts)
+        self.assertAlmostEqual(gk.area(arr), self._scalar_area(pts), places=4)
+        self.assertAlmostEqual(gk.perimeter(arr), sum(math.dist(pts[i], pts[i - 1]) for i in range(5000)), places=4)
+        self.assertEqual(gk.bbox(arr), (min(x for x, _ in pts), min(y for _, y in pts),
+                                        max(x for x, _ in pts), max(y for _, y in pts)))
+
+    def _distance_to_ring(self, point, ring):
+        px, py = point
+        best = float('inf')
+        for (ax, ay), (bx, by) in zip(ring, ring[1:] + ring[:1]):
+            dx, dy = bx - ax, by - ay
+            t = max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / (dx * dx + dy * dy or 1)))
+            best = min(best, math.hypot(px - ax - t * dx, py - ay - t * dy))
+        return best
+
+    def test_simplify_stays_within_tolerance(self):
+        step = 2 * math.pi / 800
+        pts = [(200 * math.cos(i * step) + 3 * math.sin(40 * i * step), 120 * math.sin(i * step)) for i in range(800)]
+        arr = gk.as_array(pts)
+
+        counts = []
+        for tolerance in (0.1, 0.5, 2.0):
+            ring = gk.to_tuples(gk.simplify(arr, tolerance))
+            counts.append(len(ring))
+            self.assertTrue(set(ring) <= set(gk.to_tuples(arr)))
+            self.assertLessEqual(max(self._distance_to_ring(p, ring) for p in pts), tolerance + 1e-9)
+        self.assertTrue(800 > counts[0] > counts[1] > counts[2] >= 3)
+
+        square = gk.as_array([(0, 0), (1, 0), (2, 0), (2, 2), (0, 2)])
+        self.assertEqual(gk.to_tuples(gk.simplify(square, 0.1)), [(0.0, 0.0), (2.0, 0.0), (2.0, 2.0), (0.0, 2.0)])
+
+    def test_rotated_piece_keeps_integer_points(self):
+        fields = piece_fields({'name': 'L', 'grain': 'x', 'geom': {'type': 'poly', 'pts': list(self.L_SHAPE)}})
+        pts = fields['geometria_json']['pts']
+        self.assertEqual(pts[1], {'x': 0, 'y': 0})
+        self.assertEqual(pts[0], {'x': 0, 'y': 400})
+        self.assertTrue(all(type(p['x']) is int and type(p['y']) is int for p in pts))
+        self.assertEqual(piece_area(fields['geometria_json']), 60000.0)
+
+    def test_auto_orient_keeps_pieces_that_have_an_area(self):
+        wide = {'type': 'poly', 'pts': [{'x': 0, 'y': 0}, {'x': 500, 'y': 0}, {'x': 500, 'y': 100}, {'x': 0, 'y': 100}]}
+        for p_data in ({'autoOrient': True}, {'autoOrient': True, 'area_mm2': 50000}):
+            fields = piece_fields(dict(p_data, name='Faixa', geom=json.loads(json.dumps(wide))))
+            self.assertEqual(fields['geometria_json'], wide)
+            self.assertFalse(fields['rotacao_fixa'])
+
+
+def _mld_bytes(thumbnail, data, version=3):
+    body = data if isinstance(data, bytes) else json.dumps(data).encode()
+    return (
+        MLD_MAGIC + struct.pack('<II', version, len(thumbnail)) + thumbnail
+        + struct.pack('<I', len(body)) + body
+    )
+
+
+class MldFileTests(SimpleTestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.thumb = b'\x89PNG\r\n\x1a\n' + bytes(range(256)) * 4
+
+    def _write(self, name, content):
+        path = os.path.join(self.dir.name, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def test_parts_are_read_lazily_from_the_mapping(self):
+        path = self._write('a.mld', _mld_bytes(self.thumb, {'pieces': [{'id': 1}]}))
+
+        with MldFile(path) as mld:
+            self.assertEqual(mld.version, 3)
+            thumbnail = mld.thumbnail
+            self.assertIsInstance(thumbnail, memoryview)
+            self.assertEqual(thumbnail, self.thumb)
+            self.assertIsNone(mld._data)
+            self.assertEqual(mld.data, {'pieces': [{'id': 1}]})
+            del thumbnail
+
+        self.assertEqual(read_mld_file(path), {'version': 3, 'thumbnail': self.thumb, 'data': {'pieces': [{'id': 1}]}})
+        with open(path, 'rb') as f:
+            self.assertEqual(MldFile(f).data, {'pieces': [{'id': 1}]})
+        self.assertEqual(MldFile(io.BytesIO(_mld_bytes(b'', {}))).thumbnail.nbytes, 0)
+
+    def test_invalid_files(self):
+        content = _mld_bytes(self.thumb, {'a': 1})
+        for raw, message in [
+            (b'', 'inválido'),
+            (b'NOT_A_MOLD' + content[10:], 'inválido'),
+            (content[:16], 'incompleto'),
+            (content[:len(self.thumb)], 'incompleto'),
+            (content[:-1], 'incompleto'),
+        ]:
+            with self.subTest(size=len(raw)), self.assertRaisesMessage(ValueError, message):
+                MldFile(self._write('bad.mld', raw))
+        with self.assertRaises(FileNotFoundError):
+            MldFile(os.path.join(self.dir.name, 'missing.mld'))
+
+        # Broken JSON keeps the old read_mld_file behaviour (empty data)
+        path = self._write('json.mld', _mld_bytes(self.thumb, b'{broken'))
+        self.assertEqual(read_mld_file(path)['data'], {})
+
+    def test_invalid_files_are_closed(self):
+        opened = []
+
+        def spy(*args, **kwargs):
+            opened.append(open(*args, **kwargs))
+            return opened[-1]
+
+        content = _mld_bytes(self.thumb, {'a': 1})
+        with mock.patch('encaixe.utils.open', spy, create=True):
+            for raw in (b'', content[:16]):
+                with self.assertRaises(ValueError):
+                    MldFile(self._write('bad.mld', raw))
+        self.assertEqual(len(opened), 2)
+        self.assertTrue(all(f.closed for f in opened))
+
+    def test_views_read_only_the_part_they_serve(self):
+        # The JSON block is broken: the cover and the listing must not touch it
+        path = self._write('capa.mld', _mld_bytes(self.thumb, b'{broken'))
+        self._write('b.mld', _mld_bytes(b'png', {'pieces': []}, version=2))
+        self._write('ruim.mld', b'MOLDE_RAW\0')
+        self._write('notas.txt', b'x')
+
+        response = self.client.get(reverse('project_cover'), {'path': path})
+        self.assertEqual((response.status_code, response['Content-Type']), (200, 'image/png'))
+        self.assertEqual(response.content, self.thumb)
+        self.assertEqual(self.client.get(reverse('project_detail'), {'path': path}).status_code, 400)
+
+        with override_settings(ENCAIXE_MLD_DIR=self.dir.name):
+            arquivos = self.client.get(reverse('project_list')).json()['arquivos']
+        self.assertEqual([a['nome'] for a in arquivos], ['b.mld', 'capa.mld', 'ruim.mld'])
+        self.assertEqual((arquivos[0]['version'], arquivos[0]['thumbnail_size']), (2, 3))
+        self.assertEqual(arquivos[1]['data_size'], len(b'{broken'))
+        self.assertIn('erro', arquivos[2])
+
+        detalhe = self.client.get(arquivos[0]['detalhe'])
+        self.assertEqual(detalhe.json(), {'pieces': []})
+
+
+class MoldeBulkImportTests(TestCase):
+
+    PIECES = [
+        {'name': 'Frente', 'qty': 2, 'geom': {'type': 'poly', 'pts': [
+            {'x': 0, 'y': 0}, {'x': 400, 'y': 0}, {'x': 300, 'y': 600}, {'x': 0, 'y': 600}]}},
+        {'name': 'Alça', 'grainAxis': 'x', 'geom': {'type': 'rect', 'halfW': 50, 'halfH': 300}},
+        {'name': 'Botão', 'area_mm2': 1000, 'geom': {'type': 'circle', 'radius': 20}},
+    ]
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        media = override_settings(MEDIA_ROOT=os.path.join(self.dir.name, 'media'))
+        media.enable()
+        self.addCleanup(media.disable)
+
+        self.root = os.path.join(self.dir.name, 'acervo')
+        os.makedirs(os.path.join(self.root, 'bolsas'))
+        for name, content in [
+            ('mochila.mld', _mld_bytes(b'\x89PNG-thumb', {'pieces': self.PIECES})),
+            ('bolsas/tote.mld', _mld_bytes(b'', {'pieces': self.PIECES[:1]})),
+            ('bolsas/necessaire.json', json.dumps({'pieces': self.PIECES[1:]}).encode()),
+            ('bolsas/quebrado.mld', b'MOLDE_RAW\0\x01'),
+            ('bolsas/leia-me.txt', b'x'),
+        ]:
+            with open(os.path.join(self.root, name), 'wb') as f:
+                f.write(content)
+
+    def test_directory_is_parsed_in_a_pool_and_bulk_inserted(self):
+        progress = []
+        summary = import_mold_directory(
+            self.root, workers=2, batch_size=2, progress=lambda *args: progress.append(args),
+        )
+
+        self.assertEqual((summary['files'], summary['imported'], summary['pieces']), (4, 3, 6))
+        self.assertEqual([os.path.basename(path) for path, _ in summary['errors']], ['quebrado.mld'])
+        self.assertEqual(progress[-1], (4, 4, 1))
+
+        mochila = Molde.objects.get(nome='mochila')
+        self.assertTrue(mochila.imagem.name.startswith(f'moldes/thumbs/thumb_{mochila.pk}_mochila'))
+        self.assertFalse(Molde.objects.get(nome='tote').imagem)
+
+        # Same pieces and index as the one-by-one importer (save() path)
+        reference = Molde.objects.create(nome='referencia')
+        for p_data in json.loads(json.dumps(self.PIECES)):
+            MoldeDetalhe.objects.create(molde=reference, **piece_fields(p_data))
+        fields = ['nome_original', 'rotacao_fixa', 'qtd_padrao', 'geometria_json'] + MoldeDetalhe.INDEX_FIELDS
+        self.assertEqual(
+            list(mochila.detalhes.order_by('id').values(*fields)),
+            list(reference.detalhes.order_by('id').values(*fields)),
+        )
+
+    def test_files_are_unique_and_removed_when_the_batch_fails(self):
+        os.makedirs(os.path.join(self.root, 'outra'))
+        with open(os.path.join(self.root, 'outra', 'mochila.mld'), 'wb') as f:
+            f.write(_mld_bytes(b'\x89PNG-outra', {'pieces': self.PIECES[:1]}))
+
+        with mock.patch.object(Molde.objects, 'bulk_update', side_effect=RuntimeError('disk full')):
+            with self.assertRaises(RuntimeError):
+                import_mold_directory(self.root, workers=1, attach=True)
+        self.assertFalse(Molde.objects.exists())
+        media = os.path.join(self.dir.name, 'media', 'moldes')
+        self.assertEqual([files for _, _, files in os.walk(media) if files], [])
+
+        import_mold_directory(self.root, workers=1)
+        thumbs = {m.imagem.name: m.imagem.read() for m in Molde.objects.filter(nome='mochila')}
+        self.assertEqual(len(thumbs), 2)
+        self.assertEqual(sorted(thumbs.values()), [b'\x89PNG-outra', b'\x89PNG-thumb'])
+
+    def test_command_skips_existing_moldes(self):
+        import_mold_directory(self.root, workers=1)
+
+        out, err = StringIO(), StringIO()
+        call_command('import_moldes', self.root, '--skip-existing', '--workers=1', stdout=out, stderr=err)
+        self.assertIn('0 moldes (0 pieces) imported', out.getvalue())
+        self.assertIn('3 skipped, 1 errors', out.getvalue())
+        self.assertIn('quebrado.mld', err.getvalue())
+        self.assertEqual(Molde.objects.count(), 3)
+
+
+class MoldeReimportTests(TestCase):
+
+    def setUp(self):
+        self.molde = Molde.objects.create(nome='Mochila')
+        self.pieces = [
+            {'id': 'p1', 'name': 'Frente', 'geom': {'type': 'rect', 'halfW': 200, 'halfH': 300}},
+            {'name': 'Alça', 'geom': {'type': 'rect', 'halfW': 20, 'halfH': 400}},
+            {'name': 'Botão', 'geom': {'type': 'circle', 'radius': 15}},
+        ]
+        self.assertEqual(self._import(self.pieces)['created'], 3)
+        self.ids = dict(self.molde.detalhes.values_list('nome_original', 'id'))
+
+        lona = Material.objects.create(nome='Lona', unidade='mt', eh_tecido=True)
+        self.sku = Produto.objects.create(nome='Mochila', molde=self.molde, sku='MOC')
+        self.bom = ItensMaterial.objects.create(
+            produto=self.sku, molde_detalhe_id=self.ids['Frente'], material=lona, quantidade=1, tipo='tecido_padrao',
+        )
+        rebuild_consumos([self.sku.id])
+
+    def _import(self, pieces):
+        stream = io.BytesIO(json.dumps({'pieces': json.loads(json.dumps(pieces))}).encode())
+        return process_molde_json(self.molde, file_stream=stream)
+
+    def test_unchanged_file_keeps_everything(self):
+        with mock.patch('encaixe.services.molde_importer.invalidate_geometries') as invalidate:
+            result = self._import(self.pieces)
+
+        self.assertEqual(result, {'created': 0, 'updated': 0, 'unchanged': 3, 'deleted': 0})
+        self.assertEqual(dict(self.molde.detalhes.values_list('nome_original', 'id')), self.ids)
+        invalidate.assert_not_called()
+        self.assertTrue(ProdutoConsumo.objects.filter(produto=self.sku).exists())
+
+    def test_diff_keeps_the_ids_of_the_pieces_that_stay(self):
+        old = dict(self.molde.detalhes.values_list('nome_original', 'geometria_hash'))
+        pieces = [
+            # Renamed, matched by its CAD id, with a new geometry
+            {'id': 'p1', 'name': 'Frente Nova', 'geom': {'type': 'rect', 'halfW': 250, 'halfH': 300}},
+            {'name': 'Botão', 'qty': 4, 'geom': {'type': 'circle', 'radius': 15}},
+            {'name': 'Bolso', 'geom': {'type': 'rect', 'halfW': 100, 'halfH': 100}},
+        ]
+        with mock.patch('encaixe.services.molde_importer.invalidate_geometries') as invalidate:
+            result = self._import(pieces)
+
+        self.assertEqual(result, {'created': 1, 'updated': 2, 'unchanged': 0, 'deleted': 1})
+        invalidate.assert_called_once_with({old['Frente'], old['Alça']})
+
+        frente = MoldeDetalhe.objects.get(id=self.ids['Frente'])
+        self.assertEqual((frente.nome_original, frente.largura_mm, frente.area_base_mm2), ('Frente Nova', 500, 300000))
+        self.assertEqual(frente.geometria_hash, geometry_hash(pieces[0]['geom']))
+        self.assertEqual(MoldeDetalhe.objects.get(id=self.ids['Botão']).qtd_padrao, 4)
+        self.assertFalse(MoldeDetalhe.objects.filter(id=self.ids['Alça']).exists())
+        self.assertTrue(MoldeDetalhe.objects.get(nome_original='Bolso').geometria_indexada)
+
+        # The BOM row still points at its piece; the SKU consumos are queued for rebuild
+        self.bom.refresh_from_db()
+        self.assertEqual(self.bom.molde_detalhe_id, self.ids['Frente'])
+        self.assertFalse(ProdutoConsumo.objects.filter(produto=self.sku).exists())
+        self.assertTrue(ProdutoConsumoPendente.objects.filter(produto=self.sku).exists())
+
+    def test_file_area_is_kept_only_while_the_geometry_is_the_same(self):
+        self._import([dict(self.pieces[0], area_mm2=210000)] + self.pieces[1:])
+        frente = MoldeDetalhe.objects.get(id=self.ids['Frente'])
+        self.assertEqual(frente.area_base_mm2, 210000)
+
+        frente.atualizar_indice()
+        self.assertEqual(frente.area_base_mm2, 210000)
+
+        frente.geometria_json = {'type': 'rect', 'halfW': 100, 'halfH': 100}
+        frente.save()
+        frente.refresh_from_db()
+        self.assertEqual(frente.area_base_mm2, 40000)
@@ -1,60 +1,193 @@
-import struct
+import io
 import json
+import mmap
 import os
+import struct
+from collections import namedtuple
+
+# Layout do .mld:
+#   "MOLDE_RAW\0" (10 bytes) | versão (u32) | tamanho thumb (u32) | PNG
+#   | tamanho json (u32) | JSON utf-8          (inteiros little-endian)
+MLD_MAGIC = b'MOLDE_RAW\0'
+_U32 = struct.Struct('<I')
+_PREFIX = len(MLD_MAGIC) + 2 * _U32.size  # magic + versão + tamanho thumb
+
+MldHeader = namedtuple('MldHeader', 'version thumbnail_offset thumbnail_size data_offset data_size')
+
+
+def _parse_header(prefix, read_u32_at, total_size):
+    """
+    Valida o header a partir dos primeiros bytes e de uma função que lê um
+    u32 em um offset (só o tamanho do JSON fica depois da thumbnail).
+    """
+    if prefix[:len(MLD_MAGIC)] != MLD_MAGIC:
+        raise ValueError("Arquivo .mld inválido ou corrompido.")
+    if len(prefix) < _PREFIX:
+        raise ValueError("Arquivo .mld incompleto ou mal formatado.")
+
+    version, thumb_size = struct.unpack_from('<II', prefix, len(MLD_MAGIC))
+    data_size_at = _PREFIX + thumb_size
+    if data_size_at + _U32.size > total_size:
+        raise ValueError("Arquivo .mld incompleto ou mal formatado.")
+
+    data_size = read_u32_at(data_size_at)
+    data_offset = data_size_at + _U32.size
+    if data_offset + data_size > total_size:
+        raise ValueError("Arquivo .mld incompleto ou mal formatado.")
+    return MldHeader(version, _PREFIX, thumb_size, data_offset, data_size)
+
+
+def read_mld_header(path):
+    """
+    Lê apenas o header de um .mld (22 bytes, sem tocar na thumbnail nem no
+    JSON). Usado para listar diretórios.
+    """
+    with open(path, 'rb') as f:
+        total_size = os.fstat(f.fileno()).st_size
+        prefix = f.read(_PREFIX)
+
+        def read_u32_at(offset):
+            f.seek(offset)
+            return _U32.unpack(f.read(_U32.size))[0]
+
+        return _parse_header(prefix, read_u32_at, total_size)
+
+
+class MldFile:
+    """
+    Leitor preguiçoso de .mld.
+
+    Arquivos em disco (caminho ou file-like com fileno) são mapeados em
+    memória (mmap); outros file-likes são lidos uma vez. O header é validado
+    na abertura; `thumbnail` e `json_bytes` são memoryviews sem cópia sobre o
+    mapeamento, e `data` só decodifica o JSON no primeiro acesso. Servir a
+    thumbnail nunca lê as páginas do JSON (e vice-versa).
+
+    Use como context manager (ou chame close()) para liberar o mapeamento.
+    """
+
+    def __init__(self, source):
+        self._file = None
+        self._mmap = None
+        self._data = None
+
+        if isinstance(source, (str, os.PathLike)) and not os.path.exists(source):
+            raise FileNotFoundError(f"Arquivo não encontrado: {source}")
+
+        # Qualquer falha daqui em diante (ex: arquivo vazio) fecha o que foi aberto
+        try:
+            if isinstance(source, (str, os.PathLike)):
+                self._file = open(source, 'rb')
+                buffer = self._map(self._file)
+            else:
+                buffer = self._map(source) if self._has_fileno(source) else None
+                if buffer is None:
+                    # Upload em memória: lê uma vez (sem mmap possível)
+                    if hasattr(source, 'seek'):
+                        source.seek(0)
+                    buffer = source.read()
+
+            self._view = memoryview(buffer)
+            self.header = _parse_header(
+                self._view[:_PREFIX], lambda offset: _U32.unpack_from(self._view, offset)[0], len(self._view),
+            )
+        except Exception:
+            self.close()
+            raise
+
+    @staticmethod
+    def _has_fileno(source):
+        try:
+            source.fileno()
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            return False
+        return True
+
+    def _map(self, f):
+        try:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Arquivo vazio não pode ser mapeado
+            raise ValueError("Arquivo .mld inválido ou corrompido.")
+        return self._mmap
+
+    @property
+    def version(self):
+        return self.header.version
+
+    @property
+    def thumbnail(self):
+        """PNG como memoryview (sem cópia). Use bytes(...) para guardar."""
+        h = self.header
+        return self._view[h.thumbnail_offset:h.thumbnail_offset + h.thumbnail_size]
+
+    @property
+    def json_bytes(self):
+        h = self.header
+        return self._view[h.data_offset:h.data_offset + h.data_size]
+
+    @property
+    def data(self):
+        """Dados do projeto (dict), decodificados no primeiro acesso."""
+        if self._data is None:
+            self._data = json.loads(str(self.json_bytes, 'utf-8'))
+        return self._data
+
+    def close(self):
+        view = getattr(self, '_view', None)
+        if view is not None:
+            view.release()
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # Ainda há memoryviews da thumbnail em uso: o GC fecha depois
+                pass
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def list_mld_files(directory):
+    """
+    Arquivos .mld de um diretório com o header de cada um (só os headers
+    são lidos). Arquivos inválidos vêm com 'erro'.
+    """
+    arquivos = []
+    with os.scandir(directory) as entries:
+        for entry in sorted(entries, key=lambda e: e.name):
+            if not entry.is_file() or not entry.name.lower().endswith('.mld'):
+                continue
+            item = {'nome': entry.name, 'path': entry.path, 'tamanho': entry.stat().st_size}
+            try:
+                header = read_mld_header(entry.path)
+                item.update(version=header.version, thumbnail_size=header.thumbnail_size, data_size=header.data_size)
+            except (OSError, ValueError) as e:
+                item['erro'] = str(e)
+            arquivos.append(item)
+    return arquivos
+
 
 def read_mld_file(file_input):
     """
     Lê um arquivo .mld (caminho str ou objeto file-like)
     Retorna um dicionário com versão, thumbnail(bytes) e dados(dict).
+    Para ler só uma das partes, use MldFile.
     """
-    if isinstance(file_input, str):
-        if not os.path.exists(file_input):
-            raise FileNotFoundError(f"Arquivo não encontrado: {file_input}")
-        f = open(file_input, 'rb')
-        should_close = True
-    else:
-        f = file_input
-        should_close = False
-
-    try:
-        # Garante que está no inicio do stream se for um arquivo aberto
-        if hasattr(f, 'seek') and f.tell() != 0:
-            f.seek(0)
-
-        # 1. Valida Header (10 bytes)
-        header = f.read(10)
-        # O header esperado é "MOLDE_RAW\0"
-        if header != b'MOLDE_RAW\0':
-             raise ValueError("Arquivo .mld inválido ou corrompido.")
-        
-        # 2. Lê Versão (4 bytes, unsigned int, little-endian)
+    with MldFile(file_input) as mld:
         try:
-            version = struct.unpack('<I', f.read(4))[0]
-            
-            # 3. Lê Thumbnail
-            thumb_size = struct.unpack('<I', f.read(4))[0]
-            thumbnail_data = f.read(thumb_size) # Dados binários do PNG
-            
-            # 4. Lê JSON
-            json_size = struct.unpack('<I', f.read(4))[0]
-            json_bytes = f.read(json_size)
-            
-            # Decodifica o JSON
-            project_data = json.loads(json_bytes.decode('utf-8'))
-            
-            return {
-                'version': version,
-                'thumbnail': thumbnail_data,
-                'data': project_data
-            }
-        except struct.error:
-            raise ValueError("Arquivo .mld incompleto ou mal formatado.")
-        except json.JSONDecodeError:
-            return {
-                'version': version,
-                'thumbnail': thumbnail_data,
-                'data': {}
-            }
-    finally:
-        if should_close:
-            f.close()
+            data = mld.data
+        except ValueError:
+            data = {}
+        return {
+            'version': mld.version,
+            'thumbnail': bytes(mld.thumbnail),
+            'data': data,
+        }
@@ -1,7 +1,9 @@
 from django.http import JsonResponse, HttpResponse
 from django.conf import settings
+from django.urls import reverse
+from urllib.parse import urlencode
 import os
-from encaixe.utils import read_mld_file
+from encaixe.utils import MldFile, list_mld_files
 
 # Default test file path
 DEFAULT_MLD_PATH = os.path.join(settings.BASE_DIR, 'teste.mld')
@@ -10,13 +12,14 @@ def detalhe_projeto_view(request):
     """
     Returns JSON data from a .mld file.
     Accepts 'path' query parameter, defaults to DEFAULT_MLD_PATH.
+    Only the JSON block is read (the thumbnail is never touched).
     """
     caminho_arquivo = request.GET.get('path', DEFAULT_MLD_PATH)
     
     try:
-        conteudo = read_mld_file(caminho_arquivo)
-        # Retorna apenas os dados do projeto como JSON para o frontend
-        return JsonResponse(conteudo['data'])
+        with MldFile(caminho_arquivo) as mld:
+            # Retorna apenas os dados do projeto como JSON para o frontend
+            return JsonResponse(mld.data)
     except FileNotFoundError:
         return JsonResponse({'erro': 'Arquivo não encontrado'}, status=404)
     except Exception as e:
@@ -26,14 +29,34 @@ def capa_projeto_view(request):
     """
     Returns the PNG thumbnail from a .mld file.
     Accepts 'path' query parameter, defaults to DEFAULT_MLD_PATH.
+    Only the thumbnail bytes are read (the JSON is never decoded).
     """
     caminho_arquivo = request.GET.get('path', DEFAULT_MLD_PATH)
     
     try:
-        conteudo = read_mld_file(caminho_arquivo)
-        # Retorna a imagem (thumbnail) diretamente
-        return HttpResponse(conteudo['thumbnail'], content_type="image/png")
+        with MldFile(caminho_arquivo) as mld:
+            # Retorna a imagem (thumbnail) diretamente
+            return HttpResponse(mld.thumbnail, content_type="image/png")
     except FileNotFoundError:
         return HttpResponse(status=404)
     except Exception:
         return HttpResponse(status=400)
+
+def lista_projetos_view(request):
+    """
+    Lists the .mld files of ENCAIXE_MLD_DIR (default: BASE_DIR) with their
+    headers and the cover/detail URLs. Only the headers are read.
+    """
+    diretorio = getattr(settings, 'ENCAIXE_MLD_DIR', settings.BASE_DIR)
+
+    try:
+        arquivos = list_mld_files(diretorio)
+    except OSError as e:
+        return JsonResponse({'erro': str(e)}, status=400)
+
+    for arquivo in arquivos:
+        query = urlencode({'path': arquivo.pop('path')})
+        if 'erro' not in arquivo:
+            arquivo['capa'] = f"{reverse('project_cover')}?{query}"
+            arquivo['detalhe'] = f"{reverse('project_detail')}?{query}"
+    return JsonResponse({'arquivos': arquivos})
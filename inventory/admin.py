@@ -1,5 +1,5 @@
 from django.contrib import admin
-from inventory.models import Material, Cor, EstoqueMaterial, EntradaEstoque
+from inventory.models import Material, Cor, EstoqueMaterial, EntradaEstoque, MovimentoEstoque, SaldoEstoque
 
 admin.site.register(Material)
 admin.site.register(Cor)
@@ -9,3 +9,20 @@ admin.site.register(EstoqueMaterial)
 class EntradaEstoqueAdmin(admin.ModelAdmin):
     list_display = ('data', 'material', 'cor', 'quantidade', 'preco_unitario', 'fornecedor')
     list_filter = ('material', 'cor', 'data')
+
+@admin.register(MovimentoEstoque)
+class MovimentoEstoqueAdmin(admin.ModelAdmin):
+    list_display = ('data', 'tipo', 'material', 'cor', 'quantidade', 'referencia')
+    list_filter = ('tipo', 'material', 'data')
+
+    # Append-only journal: corrections are new adjustments
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(SaldoEstoque)
+class SaldoEstoqueAdmin(admin.ModelAdmin):
+    list_display = ('data', 'material', 'cor', 'quantidade')
+    list_filter = ('data', 'material')
@@ -46,3 +46,14 @@ class AddColorToMaterialForm(forms.Form):
         widget=forms.Select(attrs={'class': 'form-control'}),
         label="Escolha a Cor"
     )
+
+class ImportarEntradasForm(forms.Form):
+    arquivo = forms.FileField(
+        help_text='CSV (material; cor; quantidade; preco_unitario; fornecedor) ou JSON',
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.csv,.json,.jsonl'}),
+    )
+    fornecedor = forms.CharField(
+        required=False, max_length=200,
+        help_text='Usado nas linhas sem fornecedor',
+        widget=forms.TextInput(attrs={'class': 'form-control'}),
+    )
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from inventory.services.costing import backfill_average_costs
+
+
+class Command(BaseCommand):
+    help = 'Recomputes Material.preco_medio (weighted average cost) from the whole EntradaEstoque history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report the changes, write nothing')
+
+    def handle(self, *args, **options):
+        changes = backfill_average_costs(apply=not options['dry_run'])
+
+        for material, old, new in changes:
+            self.stdout.write(f'{material}: {old} -> {new}')
+
+        verb = 'would change' if options['dry_run'] else 'updated'
+        self.stdout.write(self.style.SUCCESS(f'preco_medio {verb} for {len(changes)} materials.'))
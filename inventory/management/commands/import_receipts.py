@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.services.receipts import FORMATS, ReceiptImportError, guess_format, import_receipts
+
+
+class Command(BaseCommand):
+    help = 'Imports a supplier delivery (CSV or JSON) as stock receipts, all lines or none'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', type=str, help='CSV, JSON array or JSON Lines file')
+        parser.add_argument('--format', choices=FORMATS, help='Default: from the file extension')
+        parser.add_argument('--fornecedor', type=str, default='', help='Supplier of the lines without one')
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows per bulk insert')
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or guess_format(options['path'])
+        start = time.perf_counter()
+        try:
+            with open(options['path'], encoding='utf-8-sig', newline='') as stream:
+                result = import_receipts(stream, fmt, options['fornecedor'], batch_size=options['batch_size'])
+        except OSError as e:
+            raise CommandError(str(e))
+        except ReceiptImportError as e:
+            for line, message in e.errors:
+                self.stderr.write(f'Line {line}: {message}')
+            raise CommandError(f'{e}, nothing imported.')
+        except ValueError as e:
+            raise CommandError(f'Invalid file: {e}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{result['linhas']} receipts imported into {len(result['quantidades'])} stock balances "
+            f"in {time.perf_counter() - start:.2f}s."
+        ))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from inventory.services.journal import rebuild_totals
+
+
+class Command(BaseCommand):
+    help = 'Recomputes EstoqueMaterial and Material.estoque_atual from the movement journal'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Only report the differences, write nothing')
+
+    def handle(self, *args, **options):
+        differences = rebuild_totals(apply=not options['check'])
+
+        for model, obj, stored, expected in differences:
+            self.stdout.write(f'{model} {obj.pk or "(new)"} {obj}: stored {stored:.4f}, journal {expected:.4f}')
+
+        if not differences:
+            self.stdout.write(self.style.SUCCESS('Totals match the journal.'))
+        elif options['check']:
+            self.stdout.write(self.style.WARNING(f'{len(differences)} totals differ from the journal.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'{len(differences)} totals rebuilt from the journal.'))
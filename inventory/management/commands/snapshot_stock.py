@@ -0,0 +1,26 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.services.journal import take_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Stores the stock balances at the end of a day (default: yesterday). Meant to run daily from cron.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=str, help='Day to photograph (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        day = None
+        if options['date']:
+            try:
+                day = datetime.date.fromisoformat(options['date'])
+            except ValueError:
+                raise CommandError(f"Invalid date: {options['date']}")
+
+        try:
+            rows = take_snapshot(day)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(f'Snapshot stored: {rows} balances.'))
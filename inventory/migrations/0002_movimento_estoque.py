@@ -0,0 +1,58 @@
+# Generated by Django 6.0 on 2026-10-18 12:00
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def saldo_inicial(apps, schema_editor):
+    """Opens the journal with the current balances, so the totals stay its sum."""
+    EstoqueMaterial = apps.get_model('inventory', 'EstoqueMaterial')
+    MovimentoEstoque = apps.get_model('inventory', 'MovimentoEstoque')
+    MovimentoEstoque.objects.bulk_create([
+        MovimentoEstoque(
+            material_id=row.material_id, cor_id=row.cor_id, quantidade=row.quantidade,
+            tipo='ajuste', referencia='Saldo inicial',
+        )
+        for row in EstoqueMaterial.objects.exclude(quantidade=0)
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovimentoEstoque',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('entrada', 'Entrada'), ('saida_producao', 'Saída para Produção'), ('ajuste', 'Ajuste'), ('transferencia', 'Transferência')], max_length=20)),
+                ('quantidade', models.FloatField(help_text='Com sinal, na unidade de banco (ex: mm)')),
+                ('data', models.DateTimeField(db_index=True, default=django.utils.timezone.now, editable=False)),
+                ('referencia', models.CharField(blank=True, help_text='Ex: OP 12, Inventário 2026', max_length=200)),
+                ('cor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='inventory.cor')),
+                ('entrada', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='movimentos', to='inventory.entradaestoque')),
+                ('material', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='movimentos', to='inventory.material')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['material', 'cor', 'data'], name='inventory_m_materia_3a6573_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SaldoEstoque',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField(db_index=True)),
+                ('quantidade', models.FloatField(default=0.0)),
+                ('cor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='inventory.cor')),
+                ('material', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='saldos', to='inventory.material')),
+            ],
+            options={
+                'unique_together': {('material', 'cor', 'data')},
+            },
+        ),
+        migrations.RunPython(saldo_inicial, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,8 @@
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
+
+from inventory import units
+from inventory.units import to_display, to_storage, unit_for
 
 class Cor(models.Model):
     nome = models.CharField(max_length=50)
@@ -29,8 +33,7 @@ class Material(models.Model):
 
     def is_unidade_medida(self):
         """Verifica se a unidade é de comprimento (metro, cm, mm)"""
-        u = self.unidade.lower().strip()
-        return u in ['mt', 'm', 'mts', 'metro', 'metros', 'cm', 'centimetro', 'mm', 'milimetro']
+        return unit_for(self).is_length
 
     def get_valor_display(self, valor_base):
         """
@@ -39,15 +42,7 @@ class Material(models.Model):
         """
         if not valor_base:
             return 0.0
-            
-        if self.is_unidade_medida():
-            u = self.unidade.lower().strip()
-            if u in ['mt', 'm', 'mts', 'metro', 'metros']:
-                return valor_base / 1000.0
-            elif u in ['cm', 'centimetro']:
-                return valor_base / 10.0
-        
-        return valor_base
+        return to_display(valor_base, unit_for(self))
 
     def to_db_value(self, valor_input):
         """
@@ -55,15 +50,17 @@ class Material(models.Model):
         """
         if not valor_input:
             return 0.0
-            
-        if self.is_unidade_medida():
-            u = self.unidade.lower().strip()
-            if u in ['mt', 'm', 'mts', 'metro', 'metros']:
-                return valor_input * 1000.0
-            elif u in ['cm', 'centimetro']:
-                return valor_input * 10.0
-        
-        return valor_input
+        return to_storage(valor_input, unit_for(self))
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        units.invalidate(self.pk)
+
+    def delete(self, *args, **kwargs):
+        pk = self.pk
+        result = super().delete(*args, **kwargs)
+        units.invalidate(pk)
+        return result
 
     def get_unidade_display(self):
         return self.unidade
@@ -114,27 +111,92 @@ class EntradaEstoque(models.Model):
         # O campo 'EstoqueMaterial.quantidade' e 'Material.estoque_atual' serão convertidos.
         
         qtd_db = self.material.to_db_value(self.quantidade)
-        
-        super().save(*args, **kwargs)
-        
-        if is_new:
-            # 1. Atualiza Preço de Custo (Referência) no Material Pai
-            self.material.preco_custo = self.preco_unitario
-            
-            # 2. Atualiza Estoque Geral
-            self.material.estoque_atual += qtd_db
-            self.material.save()
-            
-            # 3. Atualiza ou Cria o Estoque Específico
-            estoque_esp, created = EstoqueMaterial.objects.get_or_create(
-                material=self.material,
-                cor=self.cor,
-                defaults={'quantidade': 0}
-            )
-            estoque_esp.quantidade += qtd_db
-            estoque_esp.save()
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if is_new:
+                self.aplicar_no_estoque(qtd_db)
+
+    def aplicar_no_estoque(self, qtd_db):
+        """
+        Lança a entrada no diário (MovimentoEstoque) e soma nos saldos com F()
+        (UPDATE ... SET x = x + qtd), sem ler-modificar-gravar em Python: duas
+        entradas simultâneas não perdem atualizações. Deve rodar dentro da
+        transação do save().
+        """
+        from inventory.services.journal import receipt_fields, record_movement
+
+        # Atualiza também o Preço de Custo (Referência) e o Preço Médio no Material Pai
+        record_movement(
+            self.material_id, self.cor_id, qtd_db, MovimentoEstoque.TIPO_ENTRADA, entrada=self,
+            **receipt_fields(qtd_db, qtd_db * float(self.preco_unitario), self.preco_unitario),
+        )
+
+        # Mantém a instância em memória coerente com o banco
+        self.material.refresh_from_db(fields=['preco_custo', 'preco_medio', 'estoque_atual'])
 
     def __str__(self):
         cor_nome = self.cor.nome if self.cor else "S/ Cor"
         qtd_fmt = self.material.get_valor_display(self.quantidade)
         return f"{self.data} - {self.material.nome} ({cor_nome}): {qtd_fmt:.2f} {self.material.unidade}"
+
+
+class MovimentoEstoque(models.Model):
+    """
+    Diário de movimentações de estoque (somente inclusão).
+    A quantidade tem sinal e está na unidade de banco (ex: mm): entradas e
+    ajustes positivos somam, saídas para produção subtraem, e uma
+    transferência gera dois lançamentos (saída na origem, entrada no destino).
+    Os saldos (EstoqueMaterial, Material.estoque_atual) são a soma do diário.
+    """
+    TIPO_ENTRADA = 'entrada'
+    TIPO_SAIDA_PRODUCAO = 'saida_producao'
+    TIPO_AJUSTE = 'ajuste'
+    TIPO_TRANSFERENCIA = 'transferencia'
+    TIPO_CHOICES = [
+        (TIPO_ENTRADA, 'Entrada'),
+        (TIPO_SAIDA_PRODUCAO, 'Saída para Produção'),
+        (TIPO_AJUSTE, 'Ajuste'),
+        (TIPO_TRANSFERENCIA, 'Transferência'),
+    ]
+
+    material = models.ForeignKey(Material, on_delete=models.PROTECT, related_name='movimentos')
+    cor = models.ForeignKey(Cor, on_delete=models.PROTECT, null=True, blank=True)
+    tipo = models.CharField(max_length=20, choices=TIPO_CHOICES)
+    quantidade = models.FloatField(help_text="Com sinal, na unidade de banco (ex: mm)")
+    data = models.DateTimeField(default=timezone.now, editable=False, db_index=True)
+    entrada = models.ForeignKey(EntradaEstoque, on_delete=models.PROTECT, null=True, blank=True, related_name='movimentos')
+    referencia = models.CharField(max_length=200, blank=True, help_text="Ex: OP 12, Inventário 2026")
+
+    class Meta:
+        indexes = [models.Index(fields=['material', 'cor', 'data'])]
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            raise ValueError("MovimentoEstoque é somente inclusão: lance um ajuste em vez de alterar.")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValueError("MovimentoEstoque é somente inclusão: lance um ajuste em vez de excluir.")
+
+    def __str__(self):
+        cor_nome = self.cor.nome if self.cor else "S/ Cor"
+        return f"{self.data:%d/%m/%Y %H:%M} - {self.get_tipo_display()} {self.material.nome} ({cor_nome}): {self.quantidade}"
+
+class SaldoEstoque(models.Model):
+    """
+    Foto (snapshot) dos saldos ao fim do dia `data`, por Material + Cor.
+    O saldo em uma data qualquer é a foto anterior mais os movimentos do
+    intervalo, sem reler o diário inteiro (manage.py snapshot_stock).
+    """
+    material = models.ForeignKey(Material, on_delete=models.CASCADE, related_name='saldos')
+    cor = models.ForeignKey(Cor, on_delete=models.PROTECT, null=True, blank=True)
+    data = models.DateField(db_index=True)
+    quantidade = models.FloatField(default=0.0)
+
+    class Meta:
+        unique_together = ('material', 'cor', 'data')
+
+    def __str__(self):
+        cor_nome = self.cor.nome if self.cor else "S/ Cor"
+        return f"{self.data} - {self.material.nome} ({cor_nome}): {self.quantidade}"
@@ -0,0 +1,67 @@
+"""
+Backfill of Material.preco_medio from the receipt history (EntradaEstoque).
+
+The update path (journal.average_cost) keeps the weighted average in O(1)
+per receipt. Replaying every receipt of a material in that recurrence gives
+
+    preco_medio = sum(quantidade x preco_unitario) / sum(quantidade)
+
+as long as the stock never ran out in between (issues change the quantity,
+not the average). That is what is computed here, for all materials at once:
+one query over the history and one grouped sum in NumPy (pure Python when
+NumPy is not installed). Quantities are used as typed: within a material the
+unit factor cancels out.
+"""
+from decimal import Decimal
+
+from inventory.models import EntradaEstoque, Material
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+_CENT = Decimal('0.01')
+
+
+def historical_average_costs():
+    """{material_id: weighted average unit price} over every receipt."""
+    rows = list(
+        EntradaEstoque.objects.filter(quantidade__gt=0).values_list('material_id', 'quantidade', 'preco_unitario')
+    )
+    if not rows:
+        return {}
+
+    if np is None:
+        totals = {}
+        for material_id, quantidade, preco in rows:
+            qtd, valor = totals.get(material_id, (0.0, 0.0))
+            totals[material_id] = (qtd + quantidade, valor + quantidade * float(preco))
+        return {material_id: valor / qtd for material_id, (qtd, valor) in totals.items()}
+
+    material_ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+    quantidades = np.fromiter((r[1] for r in rows), dtype=np.float64, count=len(rows))
+    precos = np.fromiter((float(r[2]) for r in rows), dtype=np.float64, count=len(rows))
+
+    materials, index = np.unique(material_ids, return_inverse=True)
+    quantidade = np.bincount(index, weights=quantidades)
+    valor = np.bincount(index, weights=quantidades * precos)
+    return dict(zip(materials.tolist(), (valor / quantidade).tolist()))
+
+
+def backfill_average_costs(apply=True, batch_size=500):
+    """
+    Rewrites preco_medio of every material with receipts. Returns the changes
+    as [(material, old, new)]; with apply=False nothing is written.
+    """
+    averages = historical_average_costs()
+    changes = []
+    for material in Material.objects.filter(id__in=averages).only('id', 'nome', 'unidade', 'preco_medio'):
+        new = Decimal(str(averages[material.id])).quantize(_CENT)
+        if new != material.preco_medio:
+            changes.append((material, material.preco_medio, new))
+            material.preco_medio = new
+
+    if apply:
+        Material.objects.bulk_update([material for material, _, _ in changes], ['preco_medio'], batch_size=batch_size)
+    return changes
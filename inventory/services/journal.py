@@ -0,0 +1,233 @@
+"""
+Stock movement journal (MovimentoEstoque) and balance snapshots (SaldoEstoque).
+
+Every stock change is one append-only journal row with a signed quantity in
+the storage unit (ex: mm). The current totals (EstoqueMaterial.quantidade and
+Material.estoque_atual) are updated in the same transaction with F()
+expressions, so they are a cache of the journal sum that rebuild_totals()
+(manage.py rebuild_stock) can recompute and audit.
+
+Snapshots hold the balance of every (material, cor) at the end of a day.
+The balance at a date is the latest snapshot up to it (indexed on data) plus
+the movements between the two, instead of a replay of the whole journal.
+"""
+import datetime
+
+from django.db import transaction
+from django.db.models import Case, F, FloatField, Max, Sum, Value, When
+from django.db.models.functions import Cast, Round
+from django.utils import timezone
+
+from inventory.models import EstoqueMaterial, Material, MovimentoEstoque, SaldoEstoque
+
+_EPS = 1e-6
+
+
+def _apply_to_balances(material_id, cor_id, quantidade, **material_fields):
+    # The Material UPDATE locks the material row until commit, which
+    # serializes the create-if-missing below (unique_together does not
+    # cover a null cor)
+    Material.objects.filter(pk=material_id).update(
+        estoque_atual=F('estoque_atual') + quantidade, **material_fields,
+    )
+    updated = EstoqueMaterial.objects.filter(material_id=material_id, cor_id=cor_id).update(
+        quantidade=F('quantidade') + quantidade,
+    )
+    if not updated:
+        EstoqueMaterial.objects.create(material_id=material_id, cor_id=cor_id, quantidade=quantidade)
+
+
+def average_cost(quantidade, valor):
+    """
+    Expression of the new Material.preco_medio after receiving `quantidade`
+    (storage unit) worth `valor` (quantidade x price per purchase unit), O(1)
+    from the running stock and average of the same UPDATE:
+
+        (estoque_atual * preco_medio + valor) / (estoque_atual + quantidade)
+
+    The unit factor cancels out, so the average stays per purchase unit like
+    preco_custo. With no stock on hand the average restarts at the receipt price.
+    SET expressions read the values before the UPDATE (SQLite, PostgreSQL).
+    """
+    restart = round(valor / quantidade, 2)
+    running = (
+        F('estoque_atual') * Cast('preco_medio', FloatField()) + Value(valor)
+    ) / (F('estoque_atual') + Value(quantidade))
+    return Case(
+        When(estoque_atual__gt=0, then=Round(running, 2)),
+        default=Value(restart),
+        output_field=FloatField(),
+    )
+
+
+def receipt_fields(quantidade, valor, preco_custo):
+    """Material fields updated by a receipt: reference cost and weighted average."""
+    fields = {'preco_custo': preco_custo}
+    if quantidade > 0:
+        fields['preco_medio'] = average_cost(quantidade, valor)
+    return fields
+
+
+def record_movement(material_id, cor_id, quantidade, tipo, referencia='', entrada=None, **material_fields):
+    """
+    Journals one movement and applies it to the totals, atomically.
+    `quantidade` is signed, in the storage unit. Extra keyword arguments are
+    written on the Material in the same UPDATE (ex: preco_custo=...).
+    """
+    with transaction.atomic():
+        _apply_to_balances(material_id, cor_id, quantidade, **material_fields)
+        return MovimentoEstoque.objects.create(
+            material_id=material_id, cor_id=cor_id, quantidade=quantidade, tipo=tipo,
+            referencia=referencia, entrada=entrada,
+        )
+
+
+def append(movements, batch_size=500):
+    """
+    Writes journal rows without touching the totals: the caller applies the
+    aggregated quantities with apply_deltas() in the same transaction.
+    """
+    return MovimentoEstoque.objects.bulk_create(movements, batch_size=batch_size)
+
+
+def apply_deltas(deltas, material_fields=None):
+    """
+    Applies {(material_id, cor_id): quantidade} to the totals with one UPDATE
+    per (material, cor). `material_fields` ({material_id: {field: value}}) is
+    written on the Material in the same UPDATE as its first pair.
+    Materials are locked in id order so concurrent batches cannot deadlock.
+    """
+    pending = dict(material_fields or {})
+    with transaction.atomic():
+        for material_id, cor_id in sorted(deltas, key=lambda key: (key[0], key[1] or 0)):
+            _apply_to_balances(material_id, cor_id, deltas[(material_id, cor_id)], **pending.pop(material_id, {}))
+        for material_id, fields in pending.items():
+            Material.objects.filter(pk=material_id).update(**fields)
+
+
+def issue_to_production(material_id, cor_id, quantidade, referencia=''):
+    """Takes `quantidade` (positive, storage unit) out of stock for production."""
+    return record_movement(material_id, cor_id, -abs(quantidade), MovimentoEstoque.TIPO_SAIDA_PRODUCAO, referencia)
+
+
+def adjust(material_id, cor_id, quantidade, referencia=''):
+    """Signed correction of a balance (inventory count, losses...)."""
+    return record_movement(material_id, cor_id, quantidade, MovimentoEstoque.TIPO_AJUSTE, referencia)
+
+
+def transfer(material_id, cor_origem_id, cor_destino_id, quantidade, referencia='', material_destino_id=None):
+    """
+    Moves `quantidade` (positive, storage unit) from one (material, cor) to
+    another. Returns the (out, in) movements.
+    """
+    quantidade = abs(quantidade)
+    destino = material_destino_id or material_id
+    with transaction.atomic():
+        # Lock the materials in id order so opposite transfers cannot deadlock
+        if destino < material_id:
+            entrada = record_movement(destino, cor_destino_id, quantidade, MovimentoEstoque.TIPO_TRANSFERENCIA, referencia)
+            saida = record_movement(material_id, cor_origem_id, -quantidade, MovimentoEstoque.TIPO_TRANSFERENCIA, referencia)
+        else:
+            saida = record_movement(material_id, cor_origem_id, -quantidade, MovimentoEstoque.TIPO_TRANSFERENCIA, referencia)
+            entrada = record_movement(destino, cor_destino_id, quantidade, MovimentoEstoque.TIPO_TRANSFERENCIA, referencia)
+    return saida, entrada
+
+
+def _end_of_day(day):
+    """First instant after `day` in the current time zone."""
+    return timezone.make_aware(datetime.datetime.combine(day + datetime.timedelta(days=1), datetime.time.min))
+
+
+def _sum_by_key(qs, into):
+    rows = qs.values_list('material_id', 'cor_id').annotate(qtd=Sum('quantidade')).order_by()
+    for material_id, cor_id, qtd in rows:
+        key = (material_id, cor_id)
+        into[key] = into.get(key, 0.0) + qtd
+    return into
+
+
+def stock_at(day, material_ids=None):
+    """
+    Balances at the end of `day`: {(material_id, cor_id): quantidade}.
+    Latest snapshot up to `day` plus the movements after it.
+    """
+    snapshots = SaldoEstoque.objects.all()
+    movements = MovimentoEstoque.objects.filter(data__lt=_end_of_day(day))
+    if material_ids is not None:
+        snapshots = snapshots.filter(material_id__in=material_ids)
+        movements = movements.filter(material_id__in=material_ids)
+
+    base = snapshots.filter(data__lte=day).aggregate(ultima=Max('data'))['ultima']
+    balances = {}
+    if base:
+        balances = {
+            (material_id, cor_id): qtd
+            for material_id, cor_id, qtd in snapshots.filter(data=base).values_list('material_id', 'cor_id', 'quantidade')
+        }
+        movements = movements.filter(data__gte=_end_of_day(base))
+    return _sum_by_key(movements, balances)
+
+
+def take_snapshot(day=None):
+    """
+    Stores the balances at the end of `day` (default: yesterday), replacing a
+    snapshot of the same day. Only closed days can be photographed.
+    Returns the number of rows written.
+    """
+    today = timezone.localdate()
+    day = day or today - datetime.timedelta(days=1)
+    if day >= today:
+        raise ValueError(f'Day {day} is not closed yet: snapshots must be before {today}')
+
+    balances = stock_at(day)
+    with transaction.atomic():
+        SaldoEstoque.objects.filter(data=day).delete()
+        SaldoEstoque.objects.bulk_create([
+            SaldoEstoque(material_id=material_id, cor_id=cor_id, data=day, quantidade=qtd)
+            for (material_id, cor_id), qtd in balances.items()
+        ])
+    return len(balances)
+
+
+def rebuild_totals(apply=True):
+    """
+    Recomputes EstoqueMaterial.quantidade and Material.estoque_atual from the
+    journal (one aggregate query, bulk updates). Returns the differences found
+    as [(model name, object, stored, journal)]; with apply=False nothing is written.
+    """
+    with transaction.atomic():
+        journal = _sum_by_key(MovimentoEstoque.objects.all(), {})
+        per_material = {}
+        for (material_id, _), qtd in journal.items():
+            per_material[material_id] = per_material.get(material_id, 0.0) + qtd
+
+        differences = []
+        rows = []
+        seen = set()
+        for row in EstoqueMaterial.objects.select_related('material', 'cor'):
+            key = (row.material_id, row.cor_id)
+            seen.add(key)
+            expected = journal.get(key, 0.0)
+            if abs(row.quantidade - expected) > _EPS:
+                differences.append(('EstoqueMaterial', row, row.quantidade, expected))
+                row.quantidade = expected
+                rows.append(row)
+        missing = [
+            EstoqueMaterial(material_id=material_id, cor_id=cor_id, quantidade=qtd)
+            for (material_id, cor_id), qtd in journal.items() if (material_id, cor_id) not in seen
+        ]
+        differences.extend(('EstoqueMaterial', row, 0.0, row.quantidade) for row in missing)
+
+        materials = []
+        for material in Material.objects.only('id', 'nome', 'unidade', 'estoque_atual'):
+            expected = per_material.get(material.id, 0.0)
+            if abs(material.estoque_atual - expected) > _EPS:
+                differences.append(('Material', material, material.estoque_atual, expected))
+                material.estoque_atual = expected
+                materials.append(material)
+
+        if apply:
+            EstoqueMaterial.objects.bulk_update(rows, ['quantidade'], batch_size=500)
+            EstoqueMaterial.objects.bulk_create(missing, batch_size=500)
+            Material.objects.bulk_update(materials, ['estoque_atual'], batch_size=500)
+    return differences
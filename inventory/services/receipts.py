@@ -0,0 +1,219 @@
+"""
+Bulk stock receipts (supplier deliveries) from CSV or JSON.
+
+Columns / keys of each line:
+    material        id or name (case insensitive)
+    cor             id or name, optional
+    quantidade      in the material's purchase unit (ex: metros), like the form
+    preco_unitario  price per purchase unit
+    fornecedor      optional, defaults to the supplier given for the file
+
+CSV (header required, ',' or ';' separated) and JSON Lines are parsed one
+line at a time; a JSON array is loaded whole. Materials and colours are
+resolved against in-memory lookups, EntradaEstoque and journal rows are
+written with bulk_create in batches, and the stock and cost changes are
+summed per (material, cor) and applied with one UPDATE each at the end,
+along with the last price and the weighted average cost of each material.
+Everything runs in one transaction: a file with any invalid line writes nothing.
+"""
+import csv
+import itertools
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+
+from inventory.models import Cor, EntradaEstoque, Material, MovimentoEstoque
+from inventory.services import journal
+from inventory.units import to_storage, unit_for
+
+FORMAT_CSV = 'csv'
+FORMAT_JSON = 'json'
+FORMATS = (FORMAT_CSV, FORMAT_JSON)
+
+
+class ReceiptImportError(Exception):
+    """Invalid lines of an import. `errors` is a list of (line, message)."""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__(f'{len(errors)} invalid lines')
+
+
+def guess_format(filename):
+    return FORMAT_JSON if str(filename).lower().endswith(('.json', '.jsonl', '.ndjson')) else FORMAT_CSV
+
+
+def iter_rows(stream, fmt=FORMAT_CSV):
+    """Yields (line number, row) from a text stream; row is None when unreadable."""
+    if fmt == FORMAT_CSV:
+        first = stream.readline()
+        delimiter = ';' if first.count(';') > first.count(',') else ','
+        reader = csv.DictReader(itertools.chain([first], stream), delimiter=delimiter)
+        for row in reader:
+            row = {key.strip().lower(): value for key, value in row.items() if isinstance(key, str)}
+            if any((value or '').strip() for value in row.values()):
+                yield reader.line_num, row
+        return
+
+    first = stream.read(1)
+    while first.isspace():
+        first = stream.read(1)
+    if first == '[':
+        for n, row in enumerate(json.loads(first + stream.read()), start=1):
+            yield n, row
+        return
+
+    # JSON Lines
+    for n, line in enumerate(itertools.chain([first + stream.readline()], stream), start=1):
+        if line.strip():
+            try:
+                yield n, json.loads(line)
+            except ValueError:
+                yield n, None
+
+
+def _index_by_name(objects):
+    """{lowercase name: object}; names shared by several objects map to None."""
+    by_name = {}
+    for obj in objects:
+        name = obj.nome.strip().lower()
+        by_name[name] = None if name in by_name else obj
+    return by_name
+
+
+class ReceiptLookup:
+    """
+    In-memory lookup of materials and colours by id or name. Numeric input is
+    tried as an id first (then as a name); names shared by several records
+    are reported as ambiguous.
+    """
+
+    def __init__(self):
+        materials = list(Material.objects.only('id', 'nome', 'unidade'))
+        self.materials_by_id = {m.id: m for m in materials}
+        self.materials_by_name = _index_by_name(materials)
+
+        colours = list(Cor.objects.only('id', 'nome'))
+        self.colours_by_id = {c.id: c for c in colours}
+        self.colours_by_name = _index_by_name(colours)
+
+    @staticmethod
+    def _find(value, by_id, by_name, not_found, ambiguous):
+        text = str(value).strip()
+        if text.isdigit() and int(text) in by_id:
+            return by_id[int(text)]
+        key = text.lower()
+        if key not in by_name:
+            raise ValueError(f'{not_found}: {value}')
+        if by_name[key] is None:
+            raise ValueError(f'{ambiguous}: {value}')
+        return by_name[key]
+
+    def material(self, value):
+        return self._find(
+            value, self.materials_by_id, self.materials_by_name,
+            'Material não encontrado', 'Nome de material ambíguo, use o id',
+        )
+
+    def cor(self, value):
+        if value in (None, ''):
+            return None
+        return self._find(
+            value, self.colours_by_id, self.colours_by_name,
+            'Cor não encontrada', 'Nome de cor ambíguo, use o id',
+        )
+
+
+def _number(value, field):
+    try:
+        number = Decimal(str(value).strip().replace(',', '.'))
+    except (InvalidOperation, AttributeError):
+        raise ValueError(f'{field} inválido: {value}')
+    # NaN and Infinity parse, but would break the comparisons or the stock
+    if not number.is_finite():
+        raise ValueError(f'{field} inválido: {value}')
+    return number
+
+
+def parse_row(row, lookup, fornecedor=''):
+    """Validated EntradaEstoque (unsaved) of one line. Raises ValueError."""
+    if not isinstance(row, dict):
+        raise ValueError('Linha mal formatada')
+    if not row.get('material'):
+        raise ValueError('Material não informado')
+
+    quantidade = _number(row.get('quantidade'), 'Quantidade')
+    preco = _number(row.get('preco_unitario'), 'Preço unitário')
+    if quantidade <= 0:
+        raise ValueError('Quantidade deve ser maior que zero')
+    if preco < 0:
+        raise ValueError('Preço unitário negativo')
+
+    return EntradaEstoque(
+        material=lookup.material(row['material']),
+        cor=lookup.cor(row.get('cor')),
+        quantidade=float(quantidade),
+        preco_unitario=preco.quantize(Decimal('0.01')),
+        fornecedor=str(row.get('fornecedor') or fornecedor or '').strip() or None,
+    )
+
+
+def import_receipts(stream, fmt=FORMAT_CSV, fornecedor='', batch_size=500):
+    """
+    Imports the receipts of a text stream. Returns {'linhas', 'quantidades'}
+    where quantidades is {(material_id, cor_id): storage quantity received}.
+    Raises ReceiptImportError (and writes nothing) on any invalid line.
+    """
+    lookup = ReceiptLookup()
+    errors = []
+    deltas = {}
+    received = {}
+    total = 0
+
+    def flush(batch):
+        EntradaEstoque.objects.bulk_create(batch)
+        journal.append([
+            MovimentoEstoque(
+                material_id=entrada.material_id, cor_id=entrada.cor_id, entrada=entrada,
+                quantidade=to_storage(entrada.quantidade, unit_for(entrada.material)),
+                tipo=MovimentoEstoque.TIPO_ENTRADA,
+            )
+            for entrada in batch
+        ], batch_size=batch_size)
+
+    with transaction.atomic():
+        batch = []
+        for line, row in iter_rows(stream, fmt):
+            try:
+                entrada = parse_row(row, lookup, fornecedor)
+            except ValueError as e:
+                errors.append((line, str(e)))
+                continue
+            if errors:
+                continue  # keep validating, nothing will be written
+
+            key = (entrada.material_id, entrada.cor_id)
+            qtd_db = to_storage(entrada.quantidade, unit_for(entrada.material))
+            deltas[key] = deltas.get(key, 0.0) + qtd_db
+            # Reference cost is the last purchase price, as in EntradaEstoque.save;
+            # the average takes the quantity and value of the whole file at once
+            quantidade, valor, _ = received.get(entrada.material_id, (0.0, 0.0, None))
+            received[entrada.material_id] = (
+                quantidade + qtd_db, valor + qtd_db * float(entrada.preco_unitario), entrada.preco_unitario,
+            )
+            batch.append(entrada)
+            total += 1
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = []
+
+        if errors:
+            raise ReceiptImportError(errors)
+        if batch:
+            flush(batch)
+        journal.apply_deltas(deltas, {
+            material_id: journal.receipt_fields(*values) for material_id, values in received.items()
+        })
+
+    return {'linhas': total, 'quantidades': deltas}
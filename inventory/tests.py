@@ -1,3 +1,371 @@
-from django.test import TestCase
+import datetime
+import json
+import threading
+from decimal import Decimal
+from io import StringIO
 
-# Create your tests here.
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from encaixe.templatetags.custom_filters import format_unit
+from inventory import units
+from inventory.models import Cor, EntradaEstoque, EstoqueMaterial, Material, MovimentoEstoque, SaldoEstoque
+from inventory.services import costing, journal
+from inventory.services.receipts import ReceiptImportError, ReceiptLookup, import_receipts
+from inventory.units import resolve_unit, unit_for
+
+
+class UnitRegistryTests(SimpleTestCase):
+
+    def test_aliases_resolve_to_canonical_units(self):
+        self.assertEqual(resolve_unit(' Metros '), ('mt', 1000.0, True))
+        self.assertEqual(resolve_unit('m'), ('mt', 1000.0, True))
+        self.assertEqual(resolve_unit('centimetro'), ('cm', 10.0, True))
+        self.assertEqual(resolve_unit('MM'), ('mm', 1.0, True))
+        self.assertEqual(resolve_unit('Kg'), ('kg', 1.0, False))
+
+    def test_format_unit_accepts_unit_strings(self):
+        self.assertEqual(format_unit(2500, 'mt'), '2.50')
+        self.assertEqual(format_unit(25, 'cm'), '2.50')
+        self.assertEqual(format_unit(3, 'un'), '3.00')
+
+
+class MaterialUnitTests(TestCase):
+
+    def setUp(self):
+        units.invalidate()
+
+    def test_conversions_follow_the_unit(self):
+        lona = Material.objects.create(nome='Lona', unidade='mt')
+        self.assertTrue(lona.is_unidade_medida())
+        self.assertEqual(lona.get_valor_display(800), 0.8)
+        self.assertEqual(lona.to_db_value(2), 2000)
+        self.assertEqual(format_unit(800, lona), '0.80')
+
+        botao = Material.objects.create(nome='Botao', unidade='un')
+        self.assertFalse(botao.is_unidade_medida())
+        self.assertEqual(botao.to_db_value(4), 4)
+
+    def test_save_invalidates_the_cached_unit(self):
+        ziper = Material.objects.create(nome='Ziper', unidade='cm')
+        self.assertEqual(unit_for(ziper).canonical, 'cm')
+
+        ziper.unidade = 'mt'
+        ziper.save()
+        self.assertNotIn(ziper.pk, units._by_material)
+        self.assertEqual(Material.objects.get(pk=ziper.pk).to_db_value(1), 1000)
+
+    def test_stale_instances_are_resolved_again(self):
+        ziper = Material.objects.create(nome='Ziper', unidade='cm')
+        unit_for(ziper)
+
+        # Changed without save() (ex: queryset.update in another process)
+        Material.objects.filter(pk=ziper.pk).update(unidade='mm')
+        self.assertEqual(unit_for(Material.objects.get(pk=ziper.pk)).canonical, 'mm')
+
+
+class EntradaEstoqueTests(TestCase):
+
+    def setUp(self):
+        units.invalidate()
+        self.lona = Material.objects.create(nome='Lona', unidade='mt')
+        self.azul = Cor.objects.create(nome='Azul')
+
+    def test_entry_adds_to_both_balances(self):
+        EntradaEstoque.objects.create(material=self.lona, cor=self.azul, quantidade=2, preco_unitario=10)
+        entrada = EntradaEstoque.objects.create(material=self.lona, cor=self.azul, quantidade=1.5, preco_unitario=12)
+
+        self.assertEqual(entrada.material.estoque_atual, 3500)
+        self.lona.refresh_from_db()
+        self.assertEqual(self.lona.estoque_atual, 3500)
+        self.assertEqual(self.lona.preco_custo, 12)
+        self.assertEqual(EstoqueMaterial.objects.get(material=self.lona, cor=self.azul).quantidade, 3500)
+
+    def test_entry_writes_only_the_stock_columns(self):
+        entrada = EntradaEstoque(material=self.lona, cor=None, quantidade=1, preco_unitario=5)
+        with CaptureQueriesContext(connection) as ctx:
+            entrada.save()
+
+        material_updates = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE "inventory_material"')]
+        self.assertEqual(len(material_updates), 1)
+        self.assertNotIn('"nome"', material_updates[0])
+        self.assertEqual(EstoqueMaterial.objects.get(material=self.lona, cor=None).quantidade, 1000)
+
+
+class EntradaEstoqueConcurrencyTests(TransactionTestCase):
+    """Entries from several threads (own connections) must not lose updates."""
+
+    THREADS = 8
+    ENTRIES = 25
+
+    def test_concurrent_entries_keep_exact_totals(self):
+        lona = Material.objects.create(nome='Lona', unidade='mt')
+        cores = [Cor.objects.create(nome='Azul'), None]
+        errors = []
+        barrier = threading.Barrier(self.THREADS)
+
+        def worker(n):
+            try:
+                barrier.wait()
+                for i in range(self.ENTRIES):
+                    EntradaEstoque.objects.create(
+                        material_id=lona.id, cor=cores[(n + i) % 2], quantidade=1, preco_unitario=10,
+                    )
+            except Exception as exc:  # surfaced by the assertion below
+                errors.append(exc)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        total = self.THREADS * self.ENTRIES * 1000
+        lona.refresh_from_db()
+        self.assertEqual(lona.estoque_atual, total)
+        self.assertEqual(EstoqueMaterial.objects.filter(material=lona).count(), 2)
+        self.assertEqual(sum(EstoqueMaterial.objects.filter(material=lona).values_list('quantidade', flat=True)), total)
+
+
+class MovimentoEstoqueTests(TestCase):
+
+    def setUp(self):
+        units.invalidate()
+        self.lona = Material.objects.create(nome='Lona', unidade='mt')
+        self.azul = Cor.objects.create(nome='Azul')
+        self.preta = Cor.objects.create(nome='Preta')
+
+    def _at(self, movimento, day):
+        # The journal is append-only: dates are moved with a queryset update
+        MovimentoEstoque.objects.filter(pk=movimento.pk).update(
+            data=timezone.make_aware(datetime.datetime.combine(day, datetime.time(12)))
+        )
+
+    def _balances(self):
+        self.lona.refresh_from_db()
+        return (
+            self.lona.estoque_atual,
+            dict(EstoqueMaterial.objects.filter(material=self.lona).values_list('cor_id', 'quantidade')),
+        )
+
+    def test_every_kind_of_movement_is_journaled(self):
+        entrada = EntradaEstoque.objects.create(material=self.lona, cor=self.azul, quantidade=10, preco_unitario=8)
+        journal.issue_to_production(self.lona.id, self.azul.id, 2500, referencia='OP 1')
+        journal.transfer(self.lona.id, self.azul.id, self.preta.id, 1000)
+        journal.adjust(self.lona.id, self.preta.id, -200, referencia='Inventário')
+
+        self.assertEqual(self._balances(), (7300, {self.azul.id: 6500, self.preta.id: 800}))
+        self.assertEqual(
+            list(MovimentoEstoque.objects.order_by('id').values_list('tipo', 'quantidade')),
+            [('entrada', 10000), ('saida_producao', -2500), ('transferencia', -1000),
+             ('transferencia', 1000), ('ajuste', -200)],
+        )
+        self.assertEqual(entrada.movimentos.get().quantidade, 10000)
+
+        movimento = MovimentoEstoque.objects.first()
+        with self.assertRaises(ValueError):
+            movimento.save()
+        with self.assertRaises(ValueError):
+            movimento.delete()
+
+    def test_stock_at_uses_the_latest_snapshot(self):
+        day = datetime.date(2026, 3, 10)
+        self._at(journal.adjust(self.lona.id, self.azul.id, 5000), day)
+        self._at(journal.adjust(self.lona.id, self.azul.id, -1000), day + datetime.timedelta(days=2))
+        self._at(journal.adjust(self.lona.id, None, 300), day + datetime.timedelta(days=4))
+
+        self.assertEqual(journal.take_snapshot(day + datetime.timedelta(days=1)), 1)
+        snapshot = SaldoEstoque.objects.get()
+        self.assertEqual((snapshot.data, snapshot.quantidade), (day + datetime.timedelta(days=1), 5000))
+
+        # Movements before the snapshot are no longer read
+        MovimentoEstoque.objects.filter(data__date=day).update(quantidade=0)
+        with self.assertNumQueries(3):
+            self.assertEqual(journal.stock_at(day + datetime.timedelta(days=3)), {(self.lona.id, self.azul.id): 4000})
+        self.assertEqual(
+            journal.stock_at(day + datetime.timedelta(days=4)),
+            {(self.lona.id, self.azul.id): 4000, (self.lona.id, None): 300},
+        )
+        self.assertEqual(journal.stock_at(day), {(self.lona.id, self.azul.id): 0})
+
+        with self.assertRaises(ValueError):
+            journal.take_snapshot(timezone.localdate())
+
+    def test_rebuild_restores_totals_from_the_journal(self):
+        EntradaEstoque.objects.create(material=self.lona, cor=self.azul, quantidade=3, preco_unitario=8)
+        journal.adjust(self.lona.id, None, 400)
+        EstoqueMaterial.objects.filter(cor=self.azul).update(quantidade=1)
+        EstoqueMaterial.objects.filter(cor=None).delete()
+        Material.objects.filter(pk=self.lona.pk).update(estoque_atual=0)
+
+        out = StringIO()
+        call_command('rebuild_stock', '--check', stdout=out)
+        self.assertIn('3 totals differ', out.getvalue())
+        self.assertEqual(self._balances(), (0, {self.azul.id: 1}))
+
+        call_command('rebuild_stock', stdout=StringIO())
+        self.assertEqual(self._balances(), (3400, {self.azul.id: 3000, None: 400}))
+        self.assertEqual(journal.rebuild_totals(), [])
+
+
+class ReceiptImportTests(TestCase):
+
+    def setUp(self):
+        units.invalidate()
+        self.lona = Material.objects.create(nome='Lona', unidade='mt')
+        self.botao = Material.objects.create(nome='Botão', unidade='un')
+        self.azul = Cor.objects.create(nome='Azul')
+
+    def _balance(self, material, cor):
+        return EstoqueMaterial.objects.get(material=material, cor=cor).quantidade
+
+    def test_csv_lines_are_summed_per_material_and_colour(self):
+        csv_data = (
+            'material;cor;quantidade;preco_unitario;fornecedor\n'
+            'lona;Azul;10,5;8,00;\n'
+            f'{self.lona.id};azul;2;9.50;Tecelagem X\n'
+            ';;;;\n'
+            'Botão;;300;0,10;\n'
+        )
+        result = import_receipts(StringIO(csv_data), 'csv', fornecedor='Fornecedor Padrão')
+
+        self.assertEqual(result['linhas'], 3)
+        self.assertEqual(self._balance(self.lona, self.azul), 12500)
+        self.assertEqual(self._balance(self.botao, None), 300)
+        self.lona.refresh_from_db()
+        self.assertEqual((self.lona.estoque_atual, self.lona.preco_custo), (12500, Decimal('9.50')))
+        self.assertEqual(
+            sorted(EntradaEstoque.objects.values_list('fornecedor', flat=True)),
+            ['Fornecedor Padrão', 'Fornecedor Padrão', 'Tecelagem X'],
+        )
+        self.assertEqual(MovimentoEstoque.objects.filter(entrada__isnull=False).count(), 3)
+        self.assertEqual(journal.rebuild_totals(apply=False), [])
+
+    def test_invalid_lines_abort_the_whole_file(self):
+        jsonl = '\n'.join([
+            '{"material": "Lona", "cor": "Azul", "quantidade": 1, "preco_unitario": 5}',
+            '{"material": "Seda", "quantidade": 1, "preco_unitario": 5}',
+            '{"material": "Lona", "cor": "Verde", "quantidade": 0, "preco_unitario": 5}',
+            'not json',
+            '{"material": "Lona", "quantidade": "NaN", "preco_unitario": 5}',
+            '{"material": "Lona", "quantidade": "Infinity", "preco_unitario": 5}',
+            '{"material": "Lona", "quantidade": 1, "preco_unitario": "-inf"}',
+        ])
+        with self.assertRaises(ReceiptImportError) as ctx:
+            import_receipts(StringIO(jsonl), 'json')
+
+        self.assertEqual([line for line, _ in ctx.exception.errors], [2, 3, 4, 5, 6, 7])
+        self.assertFalse(EntradaEstoque.objects.exists())
+        self.assertFalse(EstoqueMaterial.objects.exists())
+
+    def test_lookup_keeps_ids_and_names_apart(self):
+        numeric = Material.objects.create(nome=str(self.lona.id), unidade='mt')
+        named = Material.objects.create(nome=str(numeric.id + 100), unidade='mt')
+        Cor.objects.create(nome='azul ')
+        lookup = ReceiptLookup()
+
+        # Numeric input is an id first, then a name
+        self.assertEqual(lookup.material(self.lona.id), self.lona)
+        self.assertEqual(lookup.material(f' {numeric.id} '), numeric)
+        self.assertEqual(lookup.material(numeric.id + 100), named)
+        self.assertEqual(lookup.cor(self.azul.id), self.azul)
+        # Colour names shared by two records are ambiguous, like materials
+        with self.assertRaisesMessage(ValueError, 'Nome de cor ambíguo'):
+            lookup.cor('Azul')
+
+    def test_large_delivery_is_written_in_batches(self):
+        rows = [{'material': 'Lona', 'cor': 'Azul', 'quantidade': 1, 'preco_unitario': 5}] * 1000
+        rows += [{'material': self.botao.id, 'quantidade': 2, 'preco_unitario': 1}] * 1000
+
+        with CaptureQueriesContext(connection) as ctx:
+            result = import_receipts(StringIO(json.dumps(rows)), 'json', batch_size=500)
+
+        self.assertEqual(result['linhas'], 2000)
+        # SQLite caps bulk inserts at 999 parameters: ~30 INSERTs, not 4000
+        self.assertLess(len(ctx.captured_queries), 60)
+        self.assertEqual(self._balance(self.lona, self.azul), 1000 * 1000)
+        self.assertEqual(self._balance(self.botao, None), 2000)
+
+    def test_api_endpoint_and_page(self):
+        response = self.client.post(
+            '/api/entradas-estoque/?fornecedor=Nota 12', 'material,quantidade,preco_unitario\nLona,3,7\n',
+            content_type='text/csv',
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {'linhas': 1, 'pares': 1})
+        self.assertEqual(EntradaEstoque.objects.get().fornecedor, 'Nota 12')
+
+        response = self.client.post(
+            '/api/entradas-estoque/', '[{"material": "Seda", "quantidade": 1, "preco_unitario": 1}]',
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['linhas_invalidas'][0]['linha'], 1)
+
+        arquivo = SimpleUploadedFile('nota.csv', 'material;quantidade;preco_unitario\nLona;1;7\n'.encode())
+        response = self.client.post(reverse('stock_entry_import'), {'arquivo': arquivo})
+        self.assertRedirects(response, reverse('movement_list'))
+        self.assertEqual(self._balance(self.lona, None), 4000)
+
+
+class AverageCostTests(TestCase):
+
+    def setUp(self):
+        units.invalidate()
+        self.lona = Material.objects.create(nome='Lona', unidade='mt')
+
+    def _receive(self, quantidade, preco):
+        EntradaEstoque.objects.create(material=self.lona, quantidade=quantidade, preco_unitario=preco)
+        self.lona.refresh_from_db()
+        return self.lona.preco_medio
+
+    def test_average_is_updated_on_each_receipt(self):
+        self.assertEqual(self._receive(10, 8), Decimal('8.00'))
+        self.assertEqual(self._receive(30, 12), Decimal('11.00'))
+
+        # Issues change the quantity, not the average
+        journal.issue_to_production(self.lona.id, None, 20000)
+        self.assertEqual(self._receive(20, 5), Decimal('8.00'))
+        self.assertEqual(self.lona.preco_custo, Decimal('5.00'))
+
+        # Once the stock runs out the average restarts at the receipt price
+        journal.issue_to_production(self.lona.id, None, 50000)
+        self.assertEqual(self._receive(1, 3.5), Decimal('3.50'))
+
+    def test_bulk_import_matches_sequential_receipts(self):
+        self._receive(10, 8)
+        import_receipts(StringIO('material,quantidade,preco_unitario\nLona,10,12\nLona,20,3\n'))
+        self.lona.refresh_from_db()
+        self.assertEqual(self.lona.preco_medio, Decimal('6.50'))
+        self.assertEqual(self.lona.preco_custo, Decimal('3.00'))
+
+    def test_backfill_from_history(self):
+        botao = Material.objects.create(nome='Botão', unidade='un')
+        self._receive(10, 8)
+        self._receive(30, 12)
+        EntradaEstoque.objects.create(material=botao, quantidade=100, preco_unitario=Decimal('0.25'))
+        Material.objects.update(preco_medio=0)
+
+        out = StringIO()
+        call_command('backfill_preco_medio', '--dry-run', stdout=out)
+        self.assertIn('would change for 2 materials', out.getvalue())
+        self.assertEqual(costing.historical_average_costs(), {self.lona.id: 11.0, botao.id: 0.25})
+
+        call_command('backfill_preco_medio', stdout=StringIO())
+        self.assertEqual(
+            dict(Material.objects.values_list('nome', 'preco_medio')),
+            {'Lona': Decimal('11.00'), 'Botão': Decimal('0.25')},
+        )
+
+    def test_valuation_uses_the_purchase_unit(self):
+        self._receive(10, 8)
+        response = self.client.get(reverse('material_list'))
+        self.assertEqual(response.context['total_value'], 80.0)
@@ -0,0 +1,77 @@
+"""
+Registry of material units.
+
+Lengths are stored in mm; Material.unidade is the unit the user types and
+reads (ex: 'mt', 'cm', 'un'). Each unidade string is resolved once to a
+canonical unit and the factor from that unit to the stored value:
+
+    resolve_unit('Metros ') -> Unit(canonical='mt', factor=1000.0, is_length=True)
+    resolve_unit('un')      -> Unit(canonical='un', factor=1.0, is_length=False)
+
+unit_for(material) caches the resolution per material id; Material.save()
+and delete() invalidate it. The entry also remembers the raw unidade, so a
+material edited in another process is resolved again instead of going stale.
+"""
+import threading
+from collections import namedtuple
+from functools import lru_cache
+
+Unit = namedtuple('Unit', ['canonical', 'factor', 'is_length'])
+
+# alias -> (canonical, factor to mm)
+_LENGTH_UNITS = {
+    'mt': ('mt', 1000.0),
+    'm': ('mt', 1000.0),
+    'mts': ('mt', 1000.0),
+    'metro': ('mt', 1000.0),
+    'metros': ('mt', 1000.0),
+    'cm': ('cm', 10.0),
+    'centimetro': ('cm', 10.0),
+    'mm': ('mm', 1.0),
+    'milimetro': ('mm', 1.0),
+}
+
+_lock = threading.Lock()
+_by_material = {}
+
+
+@lru_cache(maxsize=256)
+def resolve_unit(unidade):
+    """Canonical unit and factor of a unidade string (case and spaces ignored)."""
+    u = str(unidade or '').lower().strip()
+    if u in _LENGTH_UNITS:
+        canonical, factor = _LENGTH_UNITS[u]
+        return Unit(canonical, factor, True)
+    return Unit(u, 1.0, False)
+
+
+def unit_for(material):
+    """Resolved unit of a Material, cached by id."""
+    if material.pk is None:
+        return resolve_unit(material.unidade)
+
+    entry = _by_material.get(material.pk)
+    if entry is None or entry[0] != material.unidade:
+        entry = (material.unidade, resolve_unit(material.unidade))
+        with _lock:
+            _by_material[material.pk] = entry
+    return entry[1]
+
+
+def invalidate(material_id=None):
+    """Drops the cached unit of one material (or of all when None)."""
+    with _lock:
+        if material_id is None:
+            _by_material.clear()
+        else:
+            _by_material.pop(material_id, None)
+
+
+def to_display(value, unit):
+    """Stored value (mm for lengths) -> value in `unit`."""
+    return value / unit.factor if unit.is_length else value
+
+
+def to_storage(value, unit):
+    """Value in `unit` -> stored value (mm for lengths)."""
+    return value * unit.factor if unit.is_length else value
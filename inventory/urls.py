@@ -15,5 +15,6 @@ urlpatterns = [
     
     # Movimentação
     path('entry/new/', views.stock_entry_create, name='stock_entry_create'),
+    path('entry/import/', views.stock_entry_import, name='stock_entry_import'),
     path('movements/', views.movement_list, name='movement_list'),
 ]
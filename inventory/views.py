@@ -1,6 +1,9 @@
+import io
+
 from django.shortcuts import render, redirect, get_object_or_404
 from .models import Material, EntradaEstoque, Cor, EstoqueMaterial
-from .forms import MaterialForm, EntradaEstoqueForm, CorForm, AddColorToMaterialForm
+from .forms import MaterialForm, EntradaEstoqueForm, CorForm, AddColorToMaterialForm, ImportarEntradasForm
+from .services.receipts import ReceiptImportError, guess_format, import_receipts
 from django.contrib import messages
 
 # --- MATERIAIS ---
@@ -9,7 +12,8 @@ def material_list(request):
     materials = Material.objects.all().order_by('nome')
     
     # Calculate totals
-    total_value = sum(m.estoque_atual * float(m.preco_medio) for m in materials)
+    # preco_medio is per purchase unit (ex: mt), estoque_atual in the storage unit (ex: mm)
+    total_value = sum(m.get_valor_display(m.estoque_atual) * float(m.preco_medio) for m in materials)
     
     context = {
         'materials': materials,
@@ -97,6 +101,28 @@ def stock_entry_create(request):
 
     return render(request, 'inventory/stock_entry.html', {'form': form})
 
+def stock_entry_import(request):
+    """Entrada em lote (nota do fornecedor) a partir de um arquivo CSV/JSON."""
+    errors = []
+    if request.method == 'POST':
+        form = ImportarEntradasForm(request.POST, request.FILES)
+        if form.is_valid():
+            arquivo = form.cleaned_data['arquivo']
+            stream = io.TextIOWrapper(arquivo.file, encoding='utf-8-sig', newline='')
+            try:
+                result = import_receipts(stream, guess_format(arquivo.name), form.cleaned_data['fornecedor'])
+            except ReceiptImportError as e:
+                errors = e.errors
+            except (UnicodeDecodeError, ValueError) as e:
+                messages.error(request, f'Arquivo inválido: {e}')
+            else:
+                messages.success(request, f"{result['linhas']} entradas importadas.")
+                return redirect('movement_list')
+    else:
+        form = ImportarEntradasForm()
+
+    return render(request, 'inventory/stock_entry_import.html', {'form': form, 'errors': errors})
+
 def movement_list(request):
     movements = EntradaEstoque.objects.all().order_by('-data')
     return render(request, 'inventory/movement_list.html', {'movements': movements})
@@ -0,0 +1,43 @@
+# Generated by Django 6.0 on 2026-10-18 19:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('molds', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='moldedetalhe',
+            name='altura_rotacionada_mm',
+            field=models.FloatField(default=0.0, help_text='Altura do menor retângulo envolvente (rotacionado)'),
+        ),
+        migrations.AddField(
+            model_name='moldedetalhe',
+            name='angulo_rotacionado',
+            field=models.FloatField(default=0.0, help_text='Ângulo (graus) do menor retângulo envolvente'),
+        ),
+        migrations.AddField(
+            model_name='moldedetalhe',
+            name='area_convexa_mm2',
+            field=models.FloatField(default=0.0, help_text='Área do casco convexo'),
+        ),
+        migrations.AddField(
+            model_name='moldedetalhe',
+            name='geometria_indexada',
+            field=models.BooleanField(default=False, help_text='Índice geométrico calculado a partir do geometria_json'),
+        ),
+        migrations.AddField(
+            model_name='moldedetalhe',
+            name='largura_rotacionada_mm',
+            field=models.FloatField(default=0.0, help_text='Largura do menor retângulo envolvente (rotacionado)'),
+        ),
+        migrations.AddField(
+            model_name='moldedetalhe',
+            name='perimetro_mm',
+            field=models.FloatField(default=0.0),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('molds', '0002_moldedetalhe_indice_geometrico'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='moldedetalhe',
+            name='geometria_hash',
+            field=models.CharField(blank=True, db_index=True, default='', help_text='Hash do conteúdo do geometria_json (chave do cache de encaixe)', max_length=64),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('molds', '0003_moldedetalhe_geometria_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='moldedetalhe',
+            name='id_externo',
+            field=models.CharField(blank=True, default='', help_text='Id da peça no arquivo do CAD (casa as peças no re-import)', max_length=100),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('molds', '0004_moldedetalhe_id_externo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='moldedetalhe',
+            name='geometria_lod',
+            field=models.JSONField(blank=True, default=dict, help_text='Níveis de detalhe simplificados (Douglas-Peucker) do geometria_json, só para desenho'),
+        ),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
 from django.core.validators import FileExtensionValidator
 from inventory.models import Material
+from encaixe.services.geometry import geometry_for_scale, geometry_hash, index_fields, piece_bbox
 
 class Molde(models.Model):
     nome = models.CharField(max_length=200)
@@ -23,6 +24,7 @@ class MoldeDetalhe(models.Model):
     """
     molde = models.ForeignKey(Molde, on_delete=models.CASCADE, related_name='detalhes')
     nome_original = models.CharField(max_length=200) # Nome que veio do JSON
+    id_externo = models.CharField(max_length=100, blank=True, default='', help_text="Id da peça no arquivo do CAD (casa as peças no re-import)")
     tipo_geom = models.CharField(max_length=50) # pol, rect, circle
     
     # Updated Fields for Tech Pack
@@ -36,5 +38,53 @@ class MoldeDetalhe(models.Model):
     orientacao_fio = models.CharField(max_length=50, blank=True, null=True, help_text="Orientação do fio (ex: vertical, horizontal)")
     geometria_json = models.JSONField(help_text="Dados completos da geometria para desenho")
 
+    # Índice geométrico (pré-calculado a partir do geometria_json)
+    perimetro_mm = models.FloatField(default=0.0)
+    area_convexa_mm2 = models.FloatField(default=0.0, help_text="Área do casco convexo")
+    largura_rotacionada_mm = models.FloatField(default=0.0, help_text="Largura do menor retângulo envolvente (rotacionado)")
+    altura_rotacionada_mm = models.FloatField(default=0.0, help_text="Altura do menor retângulo envolvente (rotacionado)")
+    angulo_rotacionado = models.FloatField(default=0.0, help_text="Ângulo (graus) do menor retângulo envolvente")
+    geometria_hash = models.CharField(max_length=64, blank=True, default='', db_index=True, help_text="Hash do conteúdo do geometria_json (chave do cache de encaixe)")
+    geometria_indexada = models.BooleanField(default=False, help_text="Índice geométrico calculado a partir do geometria_json")
+    geometria_lod = models.JSONField(default=dict, blank=True, help_text="Níveis de detalhe simplificados (Douglas-Peucker) do geometria_json, só para desenho")
+
+    INDEX_FIELDS = [
+        'area_base_mm2', 'largura_mm', 'altura_mm', 'perimetro_mm', 'area_convexa_mm2',
+        'largura_rotacionada_mm', 'altura_rotacionada_mm', 'angulo_rotacionado', 'geometria_hash',
+        'geometria_indexada', 'geometria_lod',
+    ]
+
+    def atualizar_indice(self):
+        """
+        Recalcula bbox, perímetro, casco convexo e bbox rotacionado.
+        A área vinda do arquivo (area_mm2) só é mantida se a geometria não mudou.
+        """
+        for field, value in index_fields(self.geometria_json, self.area_base_mm2, self.geometria_hash).items():
+            setattr(self, field, value)
+
+    def get_bbox(self):
+        """(largura, altura) do bounding box. Usa o índice quando disponível."""
+        if self.geometria_indexada:
+            return self.largura_mm, self.altura_mm
+        return piece_bbox(self.geometria_json or {})
+
+    def get_geometria_desenho(self, mm_per_px=None):
+        """geometria_json no nível de detalhe da escala (mm por pixel) de desenho."""
+        return geometry_for_scale(self.geometria_json or {}, self.geometria_lod, mm_per_px)
+
+    def indice_atualizado(self):
+        """True quando o índice já corresponde ao geometria_json (mesmo hash)."""
+        return self.geometria_indexada and geometry_hash(self.geometria_json or {}) == self.geometria_hash
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            if not self.indice_atualizado():
+                self.atualizar_indice()
+        elif 'geometria_json' in update_fields and not self.indice_atualizado():
+            self.atualizar_indice()
+            kwargs['update_fields'] = set(update_fields) | set(self.INDEX_FIELDS)
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.nome_original} ({self.molde.nome})"
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+from products.services.consumo import process_pending, rebuild_all_consumos
+
+
+class Command(BaseCommand):
+    help = 'Recomputes ProdutoConsumo of the SKUs queued for rebuild (or of every SKU with --all)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Rebuild every SKU, not only the queued ones')
+        parser.add_argument('--watch', type=float, default=0, help='Keep running, polling the queue every N seconds')
+        parser.add_argument('--batch-size', type=int, default=200, help='SKUs recomputed per batch')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        if options['all']:
+            total = rebuild_all_consumos(batch_size=batch_size)
+            self.stdout.write(self.style.SUCCESS(f'Consumption rebuilt for {total} SKUs.'))
+            return
+
+        while True:
+            total = process_pending(batch_size=batch_size)
+            if total or not options['watch']:
+                self.stdout.write(self.style.SUCCESS(f'Consumption rebuilt for {total} queued SKUs.'))
+            if not options['watch']:
+                return
+            time.sleep(options['watch'])
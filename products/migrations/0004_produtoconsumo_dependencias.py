@@ -0,0 +1,35 @@
+# Generated by Django 6.0 on 2026-10-18 12:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_remove_produto_cor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProdutoConsumoPendente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateTimeField(auto_now_add=True)),
+                ('produto', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='consumo_pendente', to='products.produto')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ProdutoConsumoDependencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('material', 'Material'), ('molde', 'Molde'), ('itens_material', 'Itens Material')], max_length=20)),
+                ('objeto_id', models.IntegerField()),
+                ('produto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='consumo_dependencias', to='products.produto')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['tipo', 'objeto_id'], name='products_pr_tipo_0c0a33_idx')],
+                'unique_together': {('produto', 'tipo', 'objeto_id')},
+            },
+        ),
+    ]
@@ -76,6 +76,38 @@ class ProdutoConsumo(models.Model):
     def __str__(self):
          return f"{self.produto.nome} - {self.material.nome}"
 
+class ProdutoConsumoDependencia(models.Model):
+    """
+    Registro do que alimentou o ProdutoConsumo de um SKU (materiais, moldes e
+    linhas de ItensMaterial). Quando um deles muda, só os SKUs dependentes são
+    invalidados e recalculados.
+    """
+    TIPO_CHOICES = [
+        ('material', 'Material'),
+        ('molde', 'Molde'),
+        ('itens_material', 'Itens Material'),
+    ]
+    produto = models.ForeignKey(Produto, on_delete=models.CASCADE, related_name='consumo_dependencias')
+    tipo = models.CharField(max_length=20, choices=TIPO_CHOICES)
+    objeto_id = models.IntegerField()
+
+    class Meta:
+        unique_together = ('produto', 'tipo', 'objeto_id')
+        indexes = [models.Index(fields=['tipo', 'objeto_id'])]
+
+    def __str__(self):
+        return f"{self.produto} <- {self.tipo} #{self.objeto_id}"
+
+class ProdutoConsumoPendente(models.Model):
+    """
+    Fila de SKUs com ProdutoConsumo invalidado, aguardando recálculo em segundo plano.
+    """
+    produto = models.OneToOneField(Produto, on_delete=models.CASCADE, related_name='consumo_pendente')
+    data = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Recalcular consumo: {self.produto}"
+
 class OrdemServicoTecnica(models.Model):
     STATUS_CHOICES = [
         ('ABERTA', 'Aberta'),
@@ -0,0 +1,170 @@
+"""
+Precomputation of ProdutoConsumo (fabric consumption per SKU unit).
+
+For every 'tecido_padrao' row of a SKU's BOM (ItensMaterial):
+  - rows linked to a piece use the row-yield of the piece geometry over a
+    reference batch of ENCAIXE_CONSUMO_LOTE units (default 100), divided by
+    the batch, in the material's unit (ex: mt);
+  - unlinked rows keep their BOM quantity.
+Rows are summed per (material, cor).
+
+Each rebuild records what the SKU depends on (ProdutoConsumoDependencia):
+its materials, the moldes of its pieces and its BOM rows. products/signals.py
+invalidates only the dependent SKUs: their consumos are dropped at once (the
+calculators fall back to the BOM meanwhile) and the SKU is queued in
+ProdutoConsumoPendente for the background job (manage.py rebuild_consumos).
+"""
+from django.conf import settings
+from django.db import transaction
+from django.dispatch import Signal
+
+from inventory.units import to_display, unit_for
+from products.models import (
+    Produto, ItensMaterial, ProdutoConsumo, ProdutoConsumoDependencia, ProdutoConsumoPendente,
+)
+from sales.services.requirements_ledger import deferred_rebuild
+from sales.services.row_yield import DEFAULT_FABRIC_WIDTH_MM, linear_mm_batch
+
+DEP_MATERIAL = 'material'
+DEP_MOLDE = 'molde'
+DEP_ITENS_MATERIAL = 'itens_material'
+
+# Sent after a rebuild with produto_ids=set of SKU ids
+consumos_atualizados = Signal()
+
+
+def get_lote():
+    return max(int(getattr(settings, 'ENCAIXE_CONSUMO_LOTE', 100)), 1)
+
+
+def dependent_skus(tipo, objeto_ids):
+    """Ids of the SKUs whose consumos were computed from the given objects."""
+    return set(
+        ProdutoConsumoDependencia.objects.filter(tipo=tipo, objeto_id__in=list(objeto_ids))
+            .values_list('produto_id', flat=True)
+    )
+
+
+def invalidate_skus(produto_ids):
+    """Drops the consumos of the given SKUs and queues them for rebuild."""
+    produto_ids = set(produto_ids)
+    if not produto_ids:
+        return
+
+    # One ledger rebuild for all the rows deleted (post_delete is sent per row)
+    with deferred_rebuild():
+        ProdutoConsumo.objects.filter(produto_id__in=produto_ids).delete()
+    ProdutoConsumoDependencia.objects.filter(produto_id__in=produto_ids).delete()
+
+    existing = set(Produto.objects.filter(id__in=produto_ids).values_list('id', flat=True))
+    ProdutoConsumoPendente.objects.bulk_create(
+        [ProdutoConsumoPendente(produto_id=produto_id) for produto_id in existing],
+        ignore_conflicts=True,
+    )
+
+
+def compute_consumos(bom_items):
+    """
+    Consumption of the 'tecido_padrao' rows of one SKU, per product unit.
+    Returns ({(material_id, cor_id): consumo}, dependencies) where dependencies
+    is a set of (tipo, objeto_id).
+    """
+    lote = get_lote()
+    fabric_rows = [row for row in bom_items if row.tipo == 'tecido_padrao' and row.material_id]
+
+    linked = [
+        row for row in fabric_rows
+        if row.molde_detalhe_id and unit_for(row.material).is_length
+    ]
+    linear = linear_mm_batch(*zip(*[
+        (
+            *row.molde_detalhe.get_bbox(),
+            row.material.largura_padrao_mm or DEFAULT_FABRIC_WIDTH_MM,
+            lote * (row.molde_detalhe.qtd_padrao or 1),
+            row.molde_detalhe.rotacao_fixa,
+        )
+        for row in linked
+    ])) if linked else []
+    per_unit = {row.id: to_display(mm / lote, unit_for(row.material)) for row, mm in zip(linked, linear)}
+
+    totals = {}
+    dependencies = set()
+    for row in fabric_rows:
+        key = (row.material_id, row.cor_id)
+        totals[key] = totals.get(key, 0.0) + per_unit.get(row.id, row.quantidade)
+
+        dependencies.add((DEP_MATERIAL, row.material_id))
+        dependencies.add((DEP_ITENS_MATERIAL, row.id))
+        if row.id in per_unit:
+            dependencies.add((DEP_MOLDE, row.molde_detalhe.molde_id))
+
+    return totals, dependencies
+
+
+def rebuild_consumos(produto_ids):
+    """
+    Recomputes ProdutoConsumo of the given SKUs in one transaction and
+    removes them from the pending queue. Returns the number of SKUs rebuilt.
+    """
+    produto_ids = set(produto_ids)
+    if not produto_ids:
+        return 0
+
+    bom = {}
+    bom_qs = (
+        ItensMaterial.objects.filter(produto_id__in=produto_ids, tipo='tecido_padrao')
+            .select_related('material', 'molde_detalhe')
+            .defer('molde_detalhe__geometria_json')
+            .order_by('id')
+    )
+    for row in bom_qs:
+        bom.setdefault(row.produto_id, []).append(row)
+
+    consumos = []
+    dependencias = []
+    for produto_id in produto_ids:
+        totals, dependencies = compute_consumos(bom.get(produto_id, []))
+        consumos.extend(
+            ProdutoConsumo(produto_id=produto_id, material_id=material_id, cor_id=cor_id, consumo_total=consumo)
+            for (material_id, cor_id), consumo in totals.items()
+        )
+        dependencias.extend(
+            ProdutoConsumoDependencia(produto_id=produto_id, tipo=tipo, objeto_id=objeto_id)
+            for tipo, objeto_id in sorted(dependencies)
+        )
+
+    # The per-row post_delete of the old consumos and consumos_atualizados
+    # rebuild the ledger of each affected item once, at the end of the block
+    with deferred_rebuild():
+        with transaction.atomic():
+            ProdutoConsumo.objects.filter(produto_id__in=produto_ids).delete()
+            ProdutoConsumoDependencia.objects.filter(produto_id__in=produto_ids).delete()
+            ProdutoConsumo.objects.bulk_create(consumos)
+            ProdutoConsumoDependencia.objects.bulk_create(dependencias)
+            ProdutoConsumoPendente.objects.filter(produto_id__in=produto_ids).delete()
+
+        # bulk_create sends no post_save: listeners (ex: the sales ledger) get one signal
+        consumos_atualizados.send(sender=ProdutoConsumo, produto_ids=produto_ids)
+    return len(produto_ids)
+
+
+def process_pending(batch_size=200):
+    """Rebuilds the queued SKUs, `batch_size` at a time. Returns the number rebuilt."""
+    total = 0
+    while True:
+        produto_ids = list(
+            ProdutoConsumoPendente.objects.order_by('data', 'id').values_list('produto_id', flat=True)[:batch_size]
+        )
+        if not produto_ids:
+            return total
+        total += rebuild_consumos(produto_ids)
+
+
+def rebuild_all_consumos(batch_size=200):
+    """Rebuilds every SKU with a BOM. Returns the number of SKUs processed."""
+    produto_ids = list(
+        ItensMaterial.objects.order_by('produto_id').values_list('produto_id', flat=True).distinct()
+    )
+    for start in range(0, len(produto_ids), batch_size):
+        rebuild_consumos(produto_ids[start:start + batch_size])
+    return len(produto_ids)
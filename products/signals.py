@@ -0,0 +1,60 @@
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+
+from encaixe.services.molde_importer import pecas_reimportadas
+from inventory.models import Material
+from molds.models import MoldeDetalhe
+from products.models import Produto, ItensMaterial
+from products.services.consumo import (
+    DEP_ITENS_MATERIAL, DEP_MATERIAL, DEP_MOLDE, dependent_skus, invalidate_skus,
+)
+
+
+# --- SKU BOM ---
+
+@receiver(post_save, sender=ItensMaterial)
+@receiver(post_delete, sender=ItensMaterial)
+def consumo_bom_changed(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, Produto) or getattr(origin, 'model', None) is Produto:
+        return
+    # Insumo rows never feed the consumos (unless the row used to be a fabric)
+    if instance.tipo == 'tecido_padrao' or dependent_skus(DEP_ITENS_MATERIAL, [instance.id]):
+        invalidate_skus([instance.produto_id])
+
+
+# --- Master data ---
+
+@receiver(pre_save, sender=Material)
+def consumo_material_changing(sender, instance, **kwargs):
+    instance._consumo_changed = False
+    if instance.pk is None:
+        return
+    old = Material.objects.filter(pk=instance.pk).values('largura_padrao_mm', 'unidade').first()
+    if old:
+        instance._consumo_changed = (
+            old['largura_padrao_mm'] != instance.largura_padrao_mm or old['unidade'] != instance.unidade
+        )
+
+
+@receiver(post_save, sender=Material)
+def consumo_material_saved(sender, instance, **kwargs):
+    if getattr(instance, '_consumo_changed', False):
+        invalidate_skus(dependent_skus(DEP_MATERIAL, [instance.id]))
+
+
+@receiver(post_save, sender=MoldeDetalhe)
+def consumo_piece_saved(sender, instance, created, **kwargs):
+    if created:
+        return
+    invalidate_skus(dependent_skus(DEP_MOLDE, [instance.molde_id]))
+
+
+@receiver(post_delete, sender=MoldeDetalhe)
+def consumo_piece_deleted(sender, instance, **kwargs):
+    invalidate_skus(dependent_skus(DEP_MOLDE, [instance.molde_id]))
+
+
+@receiver(pecas_reimportadas)
+def consumo_pieces_reimported(sender, molde, **kwargs):
+    # Diff re-imports write with bulk_update / bulk_create (no post_save)
+    invalidate_skus(dependent_skus(DEP_MOLDE, [molde.id]))
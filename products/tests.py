@@ -1,3 +1,103 @@
+from unittest import mock
+
 from django.test import TestCase
 
-# Create your tests here.
+from inventory.models import Cor, Material
+from molds.models import Molde, MoldeDetalhe
+from products.models import Produto, ItensMaterial, ProdutoConsumoPendente
+from products.services.consumo import invalidate_skus, process_pending, rebuild_all_consumos, rebuild_consumos
+from sales.models import NecessidadeMaterial, Pedido, PedidoItem
+from sales.services.material_calculator import iter_item_requirements
+
+
+class ProdutoConsumoTests(TestCase):
+
+    def setUp(self):
+        self.preto = Cor.objects.create(nome='Preto')
+        self.lona = Material.objects.create(nome='Lona', unidade='mt', eh_tecido=True, largura_padrao_mm=1400)
+        self.nylon = Material.objects.create(nome='Nylon', unidade='mt', eh_tecido=True, largura_padrao_mm=1500)
+        self.ziper = Material.objects.create(nome='Ziper', unidade='cm')
+
+        self.mochila = Molde.objects.create(nome='Mochila')
+        self.corpo = MoldeDetalhe.objects.create(
+            molde=self.mochila, nome_original='Corpo', tipo_geom='rect', qtd_padrao=2, rotacao_fixa=True,
+            geometria_json={'type': 'rect', 'halfW': 200, 'halfH': 300},
+        )
+        bolsa = Molde.objects.create(nome='Bolsa')
+        self.alca = MoldeDetalhe.objects.create(
+            molde=bolsa, nome_original='Alca', tipo_geom='rect', rotacao_fixa=True,
+            geometria_json={'type': 'rect', 'halfW': 500, 'halfH': 50},
+        )
+
+        self.sku = Produto.objects.create(nome='Mochila', molde=self.mochila, sku='MOC')
+        ItensMaterial.objects.create(produto=self.sku, molde_detalhe=self.corpo, material=self.lona, cor=self.preto, quantidade=0.85, tipo='tecido_padrao')
+        ItensMaterial.objects.create(produto=self.sku, material=self.lona, cor=self.preto, quantidade=0.1, tipo='tecido_padrao')
+        ItensMaterial.objects.create(produto=self.sku, material=self.ziper, quantidade=45, tipo='insumo')
+
+        self.other = Produto.objects.create(nome='Bolsa', molde=bolsa, sku='BOL')
+        ItensMaterial.objects.create(produto=self.other, molde_detalhe=self.alca, material=self.nylon, quantidade=0.3, tipo='tecido_padrao')
+
+    def _consumos(self, produto):
+        return {(c.material_id, c.cor_id): c.consumo_total for c in produto.consumos.all()}
+
+    def test_bom_changes_queue_the_sku(self):
+        self.assertEqual(
+            set(ProdutoConsumoPendente.objects.values_list('produto_id', flat=True)),
+            {self.sku.id, self.other.id},
+        )
+        self.assertEqual(process_pending(), 2)
+        self.assertFalse(ProdutoConsumoPendente.objects.exists())
+
+    def test_consumption_from_geometry_and_bom(self):
+        rebuild_all_consumos()
+
+        # Corpo 400 x 600, 2 per unit: 200 pieces over 1400 mm -> 3 per row,
+        # 67 rows of 600 mm per 100 units; plus the unlinked 0.1 mt row
+        self.assertAlmostEqual(self._consumos(self.sku)[(self.lona.id, self.preto.id)], 67 * 0.6 / 100 + 0.1)
+        # Alca 1000 x 100 on 1500 mm -> 1 per row
+        self.assertAlmostEqual(self._consumos(self.other)[(self.nylon.id, None)], 0.1)
+
+    def test_only_dependent_skus_are_invalidated(self):
+        rebuild_all_consumos()
+
+        self.lona.largura_padrao_mm = 1000
+        self.lona.save()
+        self.assertEqual(self._consumos(self.sku), {})
+        self.assertTrue(self._consumos(self.other))
+        self.assertEqual(list(ProdutoConsumoPendente.objects.values_list('produto_id', flat=True)), [self.sku.id])
+
+        process_pending()
+        # 2 per row at 1000 mm -> 100 rows
+        self.assertAlmostEqual(self._consumos(self.sku)[(self.lona.id, self.preto.id)], 100 * 0.6 / 100 + 0.1)
+
+        self.alca.qtd_padrao = 2
+        self.alca.save()
+        self.assertEqual(list(ProdutoConsumoPendente.objects.values_list('produto_id', flat=True)), [self.other.id])
+
+    def test_insumo_rows_do_not_invalidate(self):
+        rebuild_all_consumos()
+        ItensMaterial.objects.create(produto=self.sku, material=self.ziper, quantidade=10, tipo='insumo')
+        self.assertTrue(self._consumos(self.sku))
+        self.assertFalse(ProdutoConsumoPendente.objects.exists())
+
+    def test_ledger_follows_the_rebuild(self):
+        pedido = Pedido.objects.create(cliente='Cliente')
+        PedidoItem.objects.create(pedido=pedido, molde=self.mochila, produto=self.sku, quantidade=10)
+
+        rebuild_all_consumos()
+        lona = NecessidadeMaterial.objects.get(material=self.lona)
+        self.assertAlmostEqual(lona.quantidade, (67 * 0.6 / 100 + 0.1) * 1000 * 10)
+
+    def test_ledger_is_rebuilt_once_per_change(self):
+        ItensMaterial.objects.create(produto=self.sku, material=self.nylon, cor=self.preto, quantidade=0.2, tipo='tecido_padrao')
+        pedido = Pedido.objects.create(cliente='Cliente')
+        PedidoItem.objects.create(pedido=pedido, molde=self.mochila, produto=self.sku, quantidade=10)
+        PedidoItem.objects.create(pedido=pedido, molde=self.mochila, produto=self.sku, quantidade=5)
+        rebuild_consumos([self.sku.id])
+        self.assertEqual(self.sku.consumos.count(), 2)
+
+        with mock.patch('sales.services.requirements_ledger.iter_item_requirements', wraps=iter_item_requirements) as rebuild:
+            rebuild_consumos([self.sku.id])
+            self.assertEqual(rebuild.call_count, 1)
+            invalidate_skus([self.sku.id])
+            self.assertEqual(rebuild.call_count, 2)
@@ -168,10 +168,11 @@ def product_create(request, molde_id):
 
     for peca in molde.detalhes.all().order_by('nome_original'):
         saved_item = saved_items_map.get(peca.id)
+        width, height = peca.get_bbox()
         detalhes.append({
             'obj': peca,
-            'width_mm': peca.largura_mm,
-            'height_mm': peca.altura_mm,
+            'width_mm': width,
+            'height_mm': height,
             'saved_material_id': saved_item.material.id if saved_item else None,
             'saved_qty': saved_item.quantidade if saved_item else None,
         })
@@ -198,24 +199,8 @@ def product_detail(request, product_id):
 
     detalhes = []
     for peca in product.molde.detalhes.all().order_by('nome_original'):
-        geom = peca.geometria_json or {}
-        # Simple extraction. Assuming importer stored bbox or calculating from pts.
-        width = 0.0
-        height = 0.0
-        
-        width = peca.largura_mm
-        height = peca.altura_mm
-        
-        # Fallback if stored is 0 (old data not re-imported)
-        if (width == 0 or height == 0):
-             # ... calculation logic (kept as fallback or removed if user forced re-import) ...
-             # Keeping simplified fallback for safety
-            if 'w' in geom and 'h' in geom:
-                width = geom['w']
-                height = geom['h']
-            elif 'halfW' in geom and 'halfH' in geom:
-                 width = geom['halfW'] * 2
-                 height = geom['halfH'] * 2
+        # Precomputed geometry index (falls back to geometria_json for legacy rows)
+        width, height = peca.get_bbox()
             
         saved_item = saved_map.get(peca.id)
         detalhes.append({
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('purchases', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ordemcompraitem',
+            name='quantidade_recebida',
+            field=models.FloatField(default=0.0, help_text='Quanto já entrou no estoque por esta ordem'),
+        ),
+    ]
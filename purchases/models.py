@@ -31,6 +31,7 @@ class OrdemCompraItem(models.Model):
     quantidade_necessaria = models.FloatField(default=0.0, help_text="Soma da necessidade real dos pedidos")
     quantidade_estoque_na_epoca = models.FloatField(default=0.0, help_text="Quanto havia em estoque no momento da geração")
     quantidade_comprar = models.FloatField(default=0.0, help_text="Quantidade sugerida para compra (Necessária - Estoque)")
+    quantidade_recebida = models.FloatField(default=0.0, help_text="Quanto já entrou no estoque por esta ordem")
 
     def __str__(self):
         cor_name = self.cor.nome if self.cor else "S/ Cor"
@@ -0,0 +1,225 @@
+"""
+Time-phased MRP netting.
+
+Gross requirements come from the ledger (NecessidadeMaterial) of the open
+order items, bucketed by the ISO week (Monday) of Pedido.data_entrega.
+Orders without a delivery date, and overdue ones, fall in the current week.
+
+For every (material, cor) the weeks are netted in order against the
+projected stock:
+
+    projected = previous projected + scheduled receipts - gross requirement
+    projected < 0  ->  planned order of -projected in that week, projected = 0
+
+Starting stock is the EstoqueMaterial on hand. Scheduled receipts are the
+quantities of open OrdemCompra (aberta / enviada) not yet received
+(quantidade_comprar - quantidade_recebida: what was received is already in
+the stock), expected ENCAIXE_MRP_LEAD_TIME_DAYS (default 7) after the OC was
+created, in the local date. Planned orders are released the same lead time
+before their week.
+
+Inputs are loaded with one aggregate query each. The planner keeps the last
+plan in memory: on re-plan only the (material, cor) series whose inputs
+changed are netted again, and only from the first changed week onward.
+"""
+import datetime
+import threading
+
+from django.conf import settings
+from django.db.models import F, Sum
+from django.db.models.functions import TruncWeek
+from django.utils import timezone
+
+from inventory.models import Cor, EstoqueMaterial, Material
+from purchases.models import OrdemCompraItem
+from sales.models import NecessidadeMaterial
+
+OPEN_ITEM_EXCLUDED_STATUS = ('CONCLUIDO', 'CANCELADO')
+OPEN_PO_STATUS = ('aberta', 'enviada')
+
+_EPS = 1e-9
+
+
+def get_lead_time():
+    return datetime.timedelta(days=int(getattr(settings, 'ENCAIXE_MRP_LEAD_TIME_DAYS', 7)))
+
+
+def week_start(day):
+    """Monday of the week of `day`."""
+    if isinstance(day, datetime.datetime):
+        day = day.date()
+    return day - datetime.timedelta(days=day.weekday())
+
+
+def load_inputs(today=None):
+    """
+    Batched inputs of the netting, one query each:
+      demand:   {(material_id, cor_id): {week: qty}}
+      receipts: {(material_id, cor_id): {week: qty}}
+      on_hand:  {(material_id, cor_id): qty}
+    Weeks before the current one are moved into it.
+    """
+    current = week_start(today or timezone.localdate())
+    lead_time = get_lead_time()
+
+    demand = {}
+    rows = (
+        NecessidadeMaterial.objects.exclude(pedido_item__status__in=OPEN_ITEM_EXCLUDED_STATUS)
+            .annotate(semana=TruncWeek('pedido_item__pedido__data_entrega'))
+            .values_list('material_id', 'cor_id', 'semana')
+            .annotate(qtd=Sum('quantidade'))
+            .order_by()
+    )
+    for material_id, cor_id, week, qtd in rows:
+        week = max(week_start(week), current) if week else current
+        buckets = demand.setdefault((material_id, cor_id), {})
+        buckets[week] = buckets.get(week, 0.0) + qtd
+
+    receipts = {}
+    rows = (
+        OrdemCompraItem.objects.filter(
+            ordem_compra__status__in=OPEN_PO_STATUS, quantidade_comprar__gt=F('quantidade_recebida') + _EPS,
+        )
+            .values_list('material_id', 'cor_id', 'ordem_compra__data_criacao')
+            .annotate(qtd=Sum(F('quantidade_comprar') - F('quantidade_recebida')))
+            .order_by()
+    )
+    for material_id, cor_id, created, qtd in rows:
+        week = max(week_start(timezone.localdate(created + lead_time)), current)
+        buckets = receipts.setdefault((material_id, cor_id), {})
+        buckets[week] = buckets.get(week, 0.0) + qtd
+
+    on_hand = {
+        (material_id, cor_id): qtd
+        for material_id, cor_id, qtd in EstoqueMaterial.objects.values_list('material_id', 'cor_id')
+            .annotate(qtd=Sum('quantidade')).order_by()
+    }
+
+    return demand, receipts, on_hand
+
+
+def _series(demand, receipts):
+    """Sorted [(week, gross, receipts)] of one (material, cor)."""
+    weeks = sorted(set(demand) | set(receipts))
+    return [(week, demand.get(week, 0.0), receipts.get(week, 0.0)) for week in weeks]
+
+
+def net_series(series, on_hand, start=0, previous=None):
+    """
+    Nets `series` ([(week, gross, receipts)]) against `on_hand`.
+
+    With `previous` (the buckets of an earlier netting of the same series)
+    the buckets before `start` are reused and netting resumes from the
+    projected stock at that point.
+    Returns [{'week', 'gross', 'receipts', 'projected', 'planned'}].
+    """
+    buckets = list(previous[:start]) if previous and start else []
+    projected = buckets[-1]['projected'] if buckets else on_hand
+
+    for week, gross, received in series[len(buckets):]:
+        projected += received - gross
+        planned = 0.0
+        if projected < -_EPS:
+            planned = -projected
+            projected = 0.0
+        buckets.append({'week': week, 'gross': gross, 'receipts': received, 'projected': projected, 'planned': planned})
+    return buckets
+
+
+def _first_change(old, new):
+    for n, (a, b) in enumerate(zip(old, new)):
+        if a != b:
+            return n
+    return min(len(old), len(new))
+
+
+class MRPPlanner:
+    """
+    Keeps the last plan and re-nets only what changed.
+    `stats` of the last run: series netted from scratch, resumed and reused.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}   # key -> (on_hand, series)
+        self._buckets = {}  # key -> netted buckets
+        self.stats = {}
+
+    def plan(self, today=None):
+        """
+        Returns {(material_id, cor_id): [bucket, ...]} for every pair with
+        demand or scheduled receipts.
+        """
+        demand, receipts, on_hand = load_inputs(today)
+
+        with self._lock:
+            stats = {'full': 0, 'resumed': 0, 'reused': 0}
+            series_by_key = {}
+            buckets_by_key = {}
+            for key in set(demand) | set(receipts):
+                series = _series(demand.get(key, {}), receipts.get(key, {}))
+                stock = on_hand.get(key, 0.0)
+                series_by_key[key] = (stock, series)
+
+                old = self._series.get(key)
+                if old is None or old[0] != stock:
+                    buckets_by_key[key] = net_series(series, stock)
+                    stats['full'] += 1
+                    continue
+
+                start = _first_change(old[1], series)
+                if start == len(old[1]) == len(series):
+                    buckets_by_key[key] = self._buckets[key]
+                    stats['reused'] += 1
+                else:
+                    buckets_by_key[key] = net_series(series, stock, start=start, previous=self._buckets[key])
+                    stats['resumed'] += 1
+
+            self._series = series_by_key
+            self._buckets = buckets_by_key
+            self.stats = stats
+            return dict(buckets_by_key)
+
+    def reset(self):
+        with self._lock:
+            self._series = {}
+            self._buckets = {}
+
+
+_planner = MRPPlanner()
+
+
+def get_planner():
+    return _planner
+
+
+def purchase_suggestions(today=None, planner=None):
+    """
+    Time-phased buy suggestions of the open order book:
+    [{'material', 'cor', 'week', 'release', 'quantity', 'gross', 'receipts'}]
+    sorted by week, then material name. 'release' is the week minus the lead time.
+    """
+    plan = (planner or _planner).plan(today)
+    lead_time = get_lead_time()
+
+    keys = [key for key, buckets in plan.items() if any(b['planned'] > _EPS for b in buckets)]
+    materials = Material.objects.in_bulk({material_id for material_id, _ in keys})
+    cores = Cor.objects.in_bulk({cor_id for _, cor_id in keys if cor_id})
+
+    suggestions = []
+    for key in keys:
+        material_id, cor_id = key
+        for bucket in plan[key]:
+            if bucket['planned'] <= _EPS:
+                continue
+            suggestions.append({
+                'material': materials[material_id],
+                'cor': cores.get(cor_id),
+                'week': bucket['week'],
+                'release': bucket['week'] - lead_time,
+                'quantity': bucket['planned'],
+                'gross': bucket['gross'],
+                'receipts': bucket['receipts'],
+            })
+    suggestions.sort(key=lambda s: (s['week'], s['material'].nome, s['cor'].nome if s['cor'] else ''))
+    return suggestions
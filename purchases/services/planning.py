@@ -0,0 +1,96 @@
+"""
+Order list of the purchase planning screen.
+
+Item counts, released counts and the "has open PO" flag are annotated in
+the same SQL query as the orders, and pages are cut with keyset pagination
+on (data, id) descending: a page is "the N orders after/before this cursor",
+so deep pages cost the same as the first one.
+"""
+import datetime
+
+from django.db.models import Count, Exists, F, OuterRef, Q
+
+from purchases.models import OrdemCompra
+from sales.models import Pedido, PedidoItem
+
+OPEN_PO_STATUS = ('aberta', 'enviada')
+
+STATUS_VAZIO = 'vazio'
+STATUS_PENDENTE = 'pendente'
+STATUS_PARCIAL = 'parcial'
+STATUS_LIBERADO = 'liberado'
+STATUS_FILTERS = (STATUS_VAZIO, STATUS_PENDENTE, STATUS_PARCIAL, STATUS_LIBERADO)
+
+COMPRA_ABERTA = 'aberta'
+COMPRA_SEM = 'sem'
+
+
+def planning_queryset(entrega_de=None, entrega_ate=None, status=None, compra=None):
+    """Orders annotated with total_itens, itens_liberados and tem_oc_aberta, filtered."""
+    open_po = OrdemCompra.pedidos.through.objects.filter(
+        pedido_id=OuterRef('pk'), ordemcompra__status__in=OPEN_PO_STATUS,
+    )
+    qs = Pedido.objects.annotate(
+        total_itens=Count('itens'),
+        itens_liberados=Count('itens', filter=Q(itens__status__in=PedidoItem.STATUS_LIBERADOS)),
+        tem_oc_aberta=Exists(open_po),
+    )
+
+    if entrega_de:
+        qs = qs.filter(data_entrega__gte=entrega_de)
+    if entrega_ate:
+        qs = qs.filter(data_entrega__lte=entrega_ate)
+
+    if status == STATUS_VAZIO:
+        qs = qs.filter(total_itens=0)
+    elif status == STATUS_PENDENTE:
+        qs = qs.filter(total_itens__gt=0, itens_liberados=0)
+    elif status == STATUS_PARCIAL:
+        qs = qs.filter(itens_liberados__gt=0, itens_liberados__lt=F('total_itens'))
+    elif status == STATUS_LIBERADO:
+        qs = qs.filter(total_itens__gt=0, itens_liberados=F('total_itens'))
+
+    if compra == COMPRA_ABERTA:
+        qs = qs.filter(tem_oc_aberta=True)
+    elif compra == COMPRA_SEM:
+        qs = qs.filter(tem_oc_aberta=False)
+
+    return qs
+
+
+def encode_cursor(order):
+    return f"{order.data.isoformat()}_{order.id}"
+
+
+def decode_cursor(cursor):
+    """'<data iso>_<id>' -> (datetime, id). Raises ValueError when malformed."""
+    data, _, order_id = str(cursor).rpartition('_')
+    return datetime.datetime.fromisoformat(data), int(order_id)
+
+
+def keyset_page(qs, after=None, before=None, size=50):
+    """
+    One page of `qs` ordered by (data, id) descending.
+
+    `after` continues past the cursor of the last row of the previous page,
+    `before` goes back from the first row of the next page.
+    Returns (orders, next_cursor, previous_cursor); cursors are None at the ends.
+    """
+    if before:
+        data, order_id = decode_cursor(before)
+        rows = list(
+            qs.filter(Q(data__gt=data) | Q(data=data, id__gt=order_id)).order_by('data', 'id')[:size + 1]
+        )
+        has_more = len(rows) > size
+        orders = rows[:size][::-1]
+        return orders, (encode_cursor(orders[-1]) if orders else None), (encode_cursor(orders[0]) if has_more else None)
+
+    if after:
+        data, order_id = decode_cursor(after)
+        qs = qs.filter(Q(data__lt=data) | Q(data=data, id__lt=order_id))
+
+    rows = list(qs.order_by('-data', '-id')[:size + 1])
+    orders = rows[:size]
+    next_cursor = encode_cursor(orders[-1]) if len(rows) > size else None
+    previous_cursor = encode_cursor(orders[0]) if after and orders else None
+    return orders, next_cursor, previous_cursor
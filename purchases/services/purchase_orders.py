@@ -0,0 +1,182 @@
+"""
+Purchase order (OrdemCompra) generation from the requirements ledger.
+
+Requirements and the stock snapshot are read before the write transaction,
+each in a single query, so the SQLite write lock is only held for the
+inserts (bulk_create) and, on recalculation, for the diff against the
+existing OrdemCompraItem rows.
+
+Deliveries against an OC go through receive_purchase_order_item, which
+writes the stock entry and keeps OrdemCompraItem.quantidade_recebida, so
+the MRP only counts what is still to arrive.
+"""
+from django.db import transaction
+from django.db.models import F
+
+from inventory.models import EntradaEstoque, EstoqueMaterial
+from purchases.models import OrdemCompra, OrdemCompraItem
+from sales.services.requirements_ledger import get_material_requirements_from_ledger
+
+RECALC_DIFF = 'diff'
+RECALC_FULL = 'full'
+
+# Quantities closer than this are considered unchanged (floats from SUM)
+_EPS = 1e-6
+
+
+def _key(material, cor):
+    return (material.id, cor.id if cor else None)
+
+
+def stock_snapshot(pairs):
+    """
+    Stock of the given (material, cor) pairs with one query.
+    Returns {(material_id, cor_id): quantidade}; missing pairs have no stock.
+    """
+    material_ids = {material.id for material, _ in pairs}
+    if not material_ids:
+        return {}
+    wanted = {_key(material, cor) for material, cor in pairs}
+
+    snapshot = {}
+    rows = EstoqueMaterial.objects.filter(material_id__in=material_ids).values_list('material_id', 'cor_id', 'quantidade')
+    for material_id, cor_id, quantidade in rows.order_by('id'):
+        key = (material_id, cor_id)
+        # First row wins, like the old .filter(...).first()
+        if key in wanted and key not in snapshot:
+            snapshot[key] = quantidade
+    return snapshot
+
+
+def purchase_lines(orders):
+    """
+    Requirements of `orders` against the current stock:
+    [{'material', 'cor', 'qtd_needed', 'current_stock', 'to_buy'}] sorted by material name.
+    """
+    requirements = get_material_requirements_from_ledger(orders)
+    snapshot = stock_snapshot(list(requirements))
+
+    lines = []
+    for (material, cor), data in requirements.items():
+        qtd_needed = data['qtd']
+        current_stock = snapshot.get(_key(material, cor), 0.0)
+        lines.append({
+            'material': material,
+            'cor': cor,
+            'qtd_needed': qtd_needed,
+            'current_stock': current_stock,
+            'to_buy': max(0, qtd_needed - current_stock),
+        })
+    lines.sort(key=lambda x: x['material'].nome)
+    return lines
+
+
+def _item(oc, line):
+    return OrdemCompraItem(
+        ordem_compra=oc,
+        material=line['material'],
+        cor=line['cor'],
+        quantidade_necessaria=line['qtd_needed'],
+        quantidade_estoque_na_epoca=line['current_stock'],
+        quantidade_comprar=line['to_buy'],
+    )
+
+
+def create_purchase_order(orders):
+    """Creates an OrdemCompra for `orders` with one item per (material, cor)."""
+    orders = list(orders)
+    lines = purchase_lines(orders)
+
+    with transaction.atomic():
+        oc = OrdemCompra.objects.create(status='aberta')
+        oc.pedidos.set(orders)
+        OrdemCompraItem.objects.bulk_create([_item(oc, line) for line in lines])
+    return oc
+
+
+def recalculate_purchase_order(oc, mode=RECALC_DIFF):
+    """
+    Refreshes the items of `oc` from the current requirements and stock.
+
+    RECALC_DIFF updates only the items whose quantities changed, creates the
+    new (material, cor) pairs and deletes the ones no longer needed;
+    RECALC_FULL deletes every item and recreates them.
+    Returns {'created', 'updated', 'deleted', 'unchanged'} counts.
+    """
+    lines = purchase_lines(oc.pedidos.all())
+
+    with transaction.atomic():
+        if mode == RECALC_FULL:
+            received = {}
+            for material_id, cor_id, qtd in oc.itens.values_list('material_id', 'cor_id', 'quantidade_recebida'):
+                received[(material_id, cor_id)] = received.get((material_id, cor_id), 0.0) + qtd
+            deleted, _ = oc.itens.all().delete()
+            items = [_item(oc, line) for line in lines]
+            for item in items:
+                item.quantidade_recebida = received.get((item.material_id, item.cor_id), 0.0)
+            OrdemCompraItem.objects.bulk_create(items)
+            return {'created': len(lines), 'updated': 0, 'deleted': deleted, 'unchanged': 0}
+
+        existing = {}
+        duplicates = []
+        for item in oc.itens.select_for_update().order_by('id'):
+            key = (item.material_id, item.cor_id)
+            if key in existing:
+                duplicates.append(item.id)
+            else:
+                existing[key] = item
+
+        to_create = []
+        to_update = []
+        unchanged = 0
+        for line in lines:
+            item = existing.pop(_key(line['material'], line['cor']), None)
+            if item is None:
+                to_create.append(_item(oc, line))
+                continue
+
+            values = {
+                'quantidade_necessaria': line['qtd_needed'],
+                'quantidade_estoque_na_epoca': line['current_stock'],
+                'quantidade_comprar': line['to_buy'],
+            }
+            if all(abs(getattr(item, field) - value) <= _EPS for field, value in values.items()):
+                unchanged += 1
+                continue
+            for field, value in values.items():
+                setattr(item, field, value)
+            to_update.append(item)
+
+        stale = [item.id for item in existing.values()] + duplicates
+        if stale:
+            OrdemCompraItem.objects.filter(id__in=stale).delete()
+        if to_update:
+            OrdemCompraItem.objects.bulk_update(
+                to_update, ['quantidade_necessaria', 'quantidade_estoque_na_epoca', 'quantidade_comprar']
+            )
+        OrdemCompraItem.objects.bulk_create(to_create)
+
+    return {'created': len(to_create), 'updated': len(to_update), 'deleted': len(stale), 'unchanged': unchanged}
+
+
+def receive_purchase_order_item(item, quantidade, preco_unitario, fornecedor=None):
+    """
+    Receives `quantidade` (purchase unit, like the stock entry form) of an
+    OC item: creates the EntradaEstoque and adds it to quantidade_recebida.
+    The OC is marked 'recebida' once every item is fully received.
+    Returns the EntradaEstoque.
+    """
+    with transaction.atomic():
+        entrada = EntradaEstoque.objects.create(
+            material=item.material, cor=item.cor, quantidade=quantidade,
+            preco_unitario=preco_unitario, fornecedor=fornecedor,
+        )
+        OrdemCompraItem.objects.filter(id=item.id).update(
+            quantidade_recebida=F('quantidade_recebida') + item.material.to_db_value(quantidade)
+        )
+        item.refresh_from_db(fields=['quantidade_recebida'])
+
+        pending = item.ordem_compra.itens.filter(quantidade_comprar__gt=F('quantidade_recebida') + _EPS)
+        if not pending.exists():
+            OrdemCompra.objects.filter(id=item.ordem_compra_id).update(status='recebida')
+    return entrada
@@ -1,3 +1,243 @@
-from django.test import TestCase
+import datetime
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from inventory.models import Cor, EstoqueMaterial, Material
+from products.models import Produto, ProdutoInsumo
+from molds.models import Molde
+from purchases.models import OrdemCompra
+from purchases.services.mrp import MRPPlanner, purchase_suggestions
+from purchases.services.planning import keyset_page, planning_queryset
+from purchases.services.purchase_orders import (
+    RECALC_FULL, create_purchase_order, recalculate_purchase_order, receive_purchase_order_item,
+)
+from sales.models import Pedido, PedidoItem
+
+
+class PurchaseOrderTests(TestCase):
+
+    def setUp(self):
+        self.preto = Cor.objects.create(nome='Preto')
+        self.botao = Material.objects.create(nome='Botao', unidade='un')
+        self.ziper = Material.objects.create(nome='Ziper', unidade='cm')
+        self.fio = Material.objects.create(nome='Fio', unidade='un')
+        EstoqueMaterial.objects.create(material=self.botao, quantidade=30)
+        EstoqueMaterial.objects.create(material=self.ziper, cor=self.preto, quantidade=100)
+
+        self.sku = Produto.objects.create(nome='Mochila', molde=Molde.objects.create(nome='Mochila'), sku='MOC')
+        ProdutoInsumo.objects.create(produto=self.sku, material=self.botao, quantidade=4)
+        ProdutoInsumo.objects.create(produto=self.sku, material=self.ziper, cor=self.preto, quantidade=45)
+
+        self.pedido = Pedido.objects.create(cliente='Cliente')
+        self.item = PedidoItem.objects.create(pedido=self.pedido, produto=self.sku, quantidade=10)
+
+    def _items(self, oc):
+        return {
+            (i.material_id, i.cor_id): (i.quantidade_necessaria, i.quantidade_estoque_na_epoca, i.quantidade_comprar)
+            for i in oc.itens.all()
+        }
+
+    def test_create_uses_one_stock_query_and_bulk_insert(self):
+        # orders + ledger (3) + stock, then savepoint + header + m2m (2) + one bulk insert + release
+        with self.assertNumQueries(11):
+            oc = create_purchase_order(Pedido.objects.all())
+
+        self.assertEqual(self._items(oc), {
+            (self.botao.id, None): (40, 30, 10),
+            (self.ziper.id, self.preto.id): (4500, 100, 4400),
+        })
+
+    def test_diff_recalculation_keeps_unchanged_rows(self):
+        oc = create_purchase_order(Pedido.objects.all())
+        ids = {(i.material_id, i.cor_id): i.id for i in oc.itens.all()}
+
+        EstoqueMaterial.objects.filter(material=self.botao).update(quantidade=35)
+        ProdutoInsumo.objects.filter(material=self.ziper).delete()
+        ProdutoInsumo.objects.create(produto=self.sku, material=self.fio, quantidade=2)
+
+        counts = recalculate_purchase_order(oc)
+        self.assertEqual(counts, {'created': 1, 'updated': 1, 'deleted': 1, 'unchanged': 0})
+        self.assertEqual(self._items(oc), {
+            (self.botao.id, None): (40, 35, 5),
+            (self.fio.id, None): (20, 0, 20),
+        })
+        # Updated in place
+        self.assertEqual(oc.itens.get(material=self.botao).id, ids[(self.botao.id, None)])
+
+        self.assertEqual(recalculate_purchase_order(oc)['unchanged'], 2)
+
+        before = set(oc.itens.values_list('id', flat=True))
+        recalculate_purchase_order(oc, mode=RECALC_FULL)
+        self.assertFalse(before & set(oc.itens.values_list('id', flat=True)))
+
+    def test_views(self):
+        response = self.client.post(reverse('visualize_purchase_creation'), {'selected_orders': [self.pedido.id]})
+        self.assertContains(response, 'Ziper')
+
+        response = self.client.post(reverse('purchase_order_create'), {'selected_ids': str(self.pedido.id)})
+        oc = OrdemCompra.objects.get()
+        self.assertRedirects(response, reverse('purchase_order_detail', args=[oc.id]))
+
+        response = self.client.post(reverse('purchase_order_recalculate', args=[oc.id]))
+        self.assertRedirects(response, reverse('purchase_order_detail', args=[oc.id]))
+        self.assertEqual(oc.itens.count(), 2)
+
+
+class MRPTests(TestCase):
+    MONDAY = datetime.date(2026, 10, 19)
+
+    def setUp(self):
+        self.botao = Material.objects.create(nome='Botao', unidade='un')
+        self.linha = Material.objects.create(nome='Linha', unidade='un')
+        EstoqueMaterial.objects.create(material=self.botao, quantidade=30)
+        self.estoque_linha = EstoqueMaterial.objects.create(material=self.linha, quantidade=100)
+
+        self.sku = Produto.objects.create(nome='Mochila', molde=Molde.objects.create(nome='Mochila'), sku='MOC')
+        ProdutoInsumo.objects.create(produto=self.sku, material=self.botao, quantidade=4)
+        ProdutoInsumo.objects.create(produto=self.sku, material=self.linha, quantidade=1)
+
+        # This week (overdue counts as this week) and two weeks ahead
+        self.atrasado = Pedido.objects.create(cliente='A', data_entrega=self.MONDAY - datetime.timedelta(days=3))
+        PedidoItem.objects.create(pedido=self.atrasado, produto=self.sku, quantidade=10)
+        self.futuro = Pedido.objects.create(cliente='B', data_entrega=self.MONDAY + datetime.timedelta(days=16))
+        self.item_futuro = PedidoItem.objects.create(pedido=self.futuro, produto=self.sku, quantidade=5)
+
+        # Open PO of 15 buttons, received next week (7 days lead time)
+        self.oc = oc = OrdemCompra.objects.create(status='aberta')
+        self.oc_item = oc.itens.create(material=self.botao, quantidade_necessaria=15, quantidade_comprar=15)
+        OrdemCompra.objects.filter(id=oc.id).update(
+            data_criacao=datetime.datetime(2026, 10, 20, 12, tzinfo=datetime.timezone.utc)
+        )
+
+    def test_time_phased_netting(self):
+        plan = MRPPlanner().plan(today=self.MONDAY)
+        week = datetime.timedelta(days=7)
+
+        self.assertEqual(
+            [(b['week'], b['gross'], b['receipts'], b['projected'], b['planned']) for b in plan[(self.botao.id, None)]],
+            [
+                (self.MONDAY, 40, 0, 0, 10),
+                (self.MONDAY + week, 0, 15, 15, 0),
+                (self.MONDAY + 2 * week, 20, 0, 0, 5),
+            ],
+        )
+        self.assertEqual(sum(b['planned'] for b in plan[(self.linha.id, None)]), 0)
+
+        suggestions = purchase_suggestions(today=self.MONDAY, planner=MRPPlanner())
+        self.assertEqual(
+            [(s['material'], s['week'], s['quantity'], s['release']) for s in suggestions],
+            [
+                (self.botao, self.MONDAY, 10, self.MONDAY - week),
+                (self.botao, self.MONDAY + 2 * week, 5, self.MONDAY + week),
+            ],
+        )
+
+    def test_replan_only_nets_what_changed(self):
+        planner = MRPPlanner()
+        planner.plan(today=self.MONDAY)
+        self.assertEqual(planner.stats, {'full': 2, 'resumed': 0, 'reused': 0})
+
+        # Stock of one series: that series from scratch, the other reused
+        self.estoque_linha.quantidade = 5
+        self.estoque_linha.save()
+        planner.plan(today=self.MONDAY)
+        self.assertEqual(planner.stats, {'full': 1, 'resumed': 0, 'reused': 1})
+
+        # A later bucket changes: both resume after the unchanged weeks
+        self.item_futuro.quantidade = 8
+        self.item_futuro.save()
+        plan = planner.plan(today=self.MONDAY)
+        self.assertEqual(planner.stats, {'full': 0, 'resumed': 2, 'reused': 0})
+        self.assertEqual(plan[(self.botao.id, None)][-1]['planned'], 17)
+        self.assertEqual(plan, MRPPlanner().plan(today=self.MONDAY))
+
+    @override_settings(TIME_ZONE='America/Sao_Paulo')
+    def test_receipt_week_is_the_local_date(self):
+        # Created Sunday 22h local (Monday 01h UTC): arrives Sunday, still this week
+        OrdemCompra.objects.filter(id=self.oc.id).update(
+            data_criacao=datetime.datetime(2026, 10, 19, 1, tzinfo=datetime.timezone.utc)
+        )
+        plan = MRPPlanner().plan(today=self.MONDAY)
+        self.assertEqual(plan[(self.botao.id, None)][0]['receipts'], 15)
+        self.assertEqual(len(plan[(self.botao.id, None)]), 2)
+
+    def test_partial_receipt_is_not_counted_twice(self):
+        receive_purchase_order_item(self.oc_item, 5, 1)
+
+        buckets = MRPPlanner().plan(today=self.MONDAY)[(self.botao.id, None)]
+        self.assertEqual([b['receipts'] for b in buckets], [0, 10, 0])
+        self.assertEqual([b['planned'] for b in buckets], [5, 0, 10])
+        self.oc.refresh_from_db()
+        self.assertEqual(self.oc.status, 'aberta')
+
+        receive_purchase_order_item(self.oc_item, 10, 1)
+        self.oc.refresh_from_db()
+        self.assertEqual(self.oc.status, 'recebida')
+        buckets = MRPPlanner().plan(today=self.MONDAY)[(self.botao.id, None)]
+        self.assertEqual(sum(b['receipts'] for b in buckets), 0)
+
+    def test_view(self):
+        response = self.client.get(reverse('purchase_mrp'))
+        self.assertContains(response, 'Botao')
+
+
+class PurchasePlanningTests(TestCase):
+
+    def setUp(self):
+        self.pedidos = []
+        for n in range(7):
+            pedido = Pedido.objects.create(cliente=f'Cliente {n}', data_entrega=datetime.date(2026, 11, 1 + n))
+            for status in ['LIBERADO_PRODUCAO'] * (n % 3) + ['PENDENTE_CADASTRO'] * (n % 2):
+                PedidoItem.objects.create(pedido=pedido, quantidade=1, status=status)
+            self.pedidos.append(pedido)
+        oc = OrdemCompra.objects.create(status='aberta')
+        oc.pedidos.add(self.pedidos[2])
+        OrdemCompra.objects.create(status='recebida').pedidos.add(self.pedidos[4])
+
+    def test_annotations(self):
+        orders = {o.id: o for o in planning_queryset()}
+        # n = 5: 2 released + 1 pending
+        pedido = orders[self.pedidos[5].id]
+        self.assertEqual((pedido.total_itens, pedido.itens_liberados, pedido.tem_oc_aberta), (3, 2, False))
+        self.assertTrue(orders[self.pedidos[2].id].tem_oc_aberta)
+        self.assertFalse(orders[self.pedidos[4].id].tem_oc_aberta)
+
+        self.assertEqual(
+            {o.id for o in planning_queryset(status='liberado')},
+            {self.pedidos[n].id for n in (2, 4)},
+        )
+        self.assertEqual({o.id for o in planning_queryset(status='vazio')}, {self.pedidos[0].id, self.pedidos[6].id})
+        self.assertEqual({o.id for o in planning_queryset(compra='aberta')}, {self.pedidos[2].id})
+        self.assertEqual(
+            {o.id for o in planning_queryset(entrega_de=datetime.date(2026, 11, 3), entrega_ate=datetime.date(2026, 11, 4))},
+            {self.pedidos[2].id, self.pedidos[3].id},
+        )
+
+    def test_keyset_pages_walk_every_order_once(self):
+        seen = []
+        after = None
+        pages = []
+        while True:
+            orders, next_cursor, previous_cursor = keyset_page(planning_queryset(), after=after, size=3)
+            pages.append((orders, previous_cursor))
+            seen.extend(o.id for o in orders)
+            if not next_cursor:
+                break
+            after = next_cursor
+        self.assertEqual(seen, [p.id for p in reversed(self.pedidos)])
+        self.assertEqual([len(orders) for orders, _ in pages], [3, 3, 1])
+
+        # Going back from the last page returns the previous one
+        orders, _, _ = keyset_page(planning_queryset(), before=pages[2][1], size=3)
+        self.assertEqual(orders, pages[1][0])
+
+    def test_view_query_count_is_constant(self):
+        # annotated orders + open POs of the page
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('purchase_planning'), {'por_pagina': 5})
+        self.assertContains(response, 'Próximos')
+        self.assertContains(response, 'PARCIAL')
+
+        response = self.client.get(reverse('purchase_planning'), {'status': 'pendente', 'compra': 'sem'})
+        self.assertEqual([o.id for o in response.context["orders"]], [self.pedidos[3].id])
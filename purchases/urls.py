@@ -4,6 +4,8 @@ from . import views
 urlpatterns = [
     path('purchase/planning/', views.purchase_planning, name='purchase_planning'),
     path('purchase/create/preview/', views.visualize_purchase_creation, name='visualize_purchase_creation'),
+    path('purchase/mrp/', views.purchase_mrp, name='purchase_mrp'),
+    path('purchase/width-sweep/', views.purchase_width_sweep, name='purchase_width_sweep'),
     path('purchase/create/finish/', views.purchase_order_create, name='purchase_order_create'),
     path('purchase/list/', views.purchase_order_list, name='purchase_order_list'),
     path('purchase/<int:oc_id>/', views.purchase_order_detail, name='purchase_order_detail'),
@@ -1,18 +1,67 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.db import transaction
 from django.contrib import messages
-from purchases.models import OrdemCompra, OrdemCompraItem
+from django.db.models import Prefetch
+from django.utils.dateparse import parse_date
+from purchases.models import OrdemCompra
 from sales.models import Pedido
-from inventory.models import EstoqueMaterial
-from sales.services.material_calculator import get_material_requirements_for_orders
+from purchases.services.purchase_orders import (
+    RECALC_DIFF, RECALC_FULL, create_purchase_order, purchase_lines, recalculate_purchase_order,
+)
+from purchases.services.mrp import get_lead_time, purchase_suggestions
+from purchases.services.planning import STATUS_FILTERS, keyset_page, planning_queryset
+from sales.services.width_sweep import parse_widths, width_sweep
+
+PLANNING_PAGE_SIZE = 50
+
+def _date_param(request, name):
+    try:
+        return parse_date(request.GET.get(name) or '')
+    except ValueError:
+        return None
 
 def purchase_planning(request):
     """
     Dashboard to view pending orders and select them for purchase.
+    Orders come annotated (items, released items, open PO) and keyset paginated;
+    filters: entrega_de / entrega_ate (delivery date), status, compra.
     """
-    orders = Pedido.objects.all().order_by('-data')
-        
-    return render(request, 'purchases/purchase_planning.html', {'orders': orders})
+    filters = {
+        'entrega_de': _date_param(request, 'entrega_de'),
+        'entrega_ate': _date_param(request, 'entrega_ate'),
+        'status': request.GET.get('status') or None,
+        'compra': request.GET.get('compra') or None,
+    }
+    try:
+        size = min(max(int(request.GET.get('por_pagina') or PLANNING_PAGE_SIZE), 1), 500)
+    except ValueError:
+        size = PLANNING_PAGE_SIZE
+
+    qs = planning_queryset(**filters).prefetch_related(
+        Prefetch('ordens_compra', queryset=OrdemCompra.objects.only('id', 'status').order_by('id'))
+    )
+    try:
+        orders, next_cursor, previous_cursor = keyset_page(
+            qs, after=request.GET.get('apos'), before=request.GET.get('antes'), size=size,
+        )
+    except ValueError:
+        return redirect('purchase_planning')
+
+    for order in orders:
+        order.status_planejamento = Pedido.status_info_from_counts(order.total_itens, order.itens_liberados)
+
+    # Filters carried by the pagination links
+    params = request.GET.copy()
+    for key in ('apos', 'antes'):
+        params.pop(key, None)
+
+    return render(request, 'purchases/purchase_planning.html', {
+        'orders': orders,
+        'filters': filters,
+        'status_choices': STATUS_FILTERS,
+        'filter_query': params.urlencode(),
+        'next_cursor': next_cursor,
+        'previous_cursor': previous_cursor,
+    })
 
 def visualize_purchase_creation(request):
     """
@@ -26,29 +75,8 @@ def visualize_purchase_creation(request):
 
         orders = Pedido.objects.filter(id__in=selected_ids)
         
-        # 1. Aggregate Requirements
-        requirements = get_material_requirements_for_orders(orders)
-        
-        # 2. Compare with Stock
-        preview_list = []
-        for (material, cor), data in requirements.items():
-            qtd_needed = data['qtd']
-            
-            # Get Current Stock
-            stock_entry = EstoqueMaterial.objects.filter(material=material, cor=cor).first()
-            current_stock = stock_entry.quantidade if stock_entry else 0.0
-            
-            to_buy = max(0, qtd_needed - current_stock)
-            
-            preview_list.append({
-                'material': material,
-                'cor': cor,
-                'qtd_needed': qtd_needed,
-                'current_stock': current_stock,
-                'to_buy': to_buy
-            })
-            
-        preview_list.sort(key=lambda x: x['material'].nome)
+        # Requirements (ledger) vs a one-query stock snapshot
+        preview_list = purchase_lines(orders)
         
         context = {
             'orders': orders,
@@ -59,6 +87,68 @@ def visualize_purchase_creation(request):
         
     return redirect('purchase_planning')
 
+DEFAULT_SWEEP_WIDTHS = '1400, 1500, 1600'
+
+def purchase_width_sweep(request):
+    """
+    What-if of fabric consumption: the selected orders evaluated against
+    several candidate roll widths (linear metres per material/colour).
+    """
+    data = request.POST if request.method == 'POST' else request.GET
+    selected_ids = data.getlist('selected_orders')
+    if not selected_ids:
+        messages.warning(request, "Nenhum pedido selecionado.")
+        return redirect('purchase_planning')
+
+    widths_str = data.get('larguras') or DEFAULT_SWEEP_WIDTHS
+    try:
+        widths = parse_widths(widths_str)
+    except ValueError as e:
+        messages.warning(request, f"Larguras inválidas: {e}")
+        widths_str = DEFAULT_SWEEP_WIDTHS
+        widths = parse_widths(widths_str)
+
+    orders = Pedido.objects.filter(id__in=selected_ids)
+    sweep = width_sweep(orders, widths)
+
+    rows = []
+    for row in sweep['rows']:
+        best = min(row['mm']) if row['mm'] else None
+        rows.append({
+            'material': row['material'],
+            'cor': row['cor'],
+            'current_width': row['current_width'],
+            'current_m': row['current_mm'] / 1000.0,
+            'cells': [{'m': mm / 1000.0, 'best': mm == best} for mm in row['mm']],
+        })
+
+    context = {
+        'orders': orders,
+        'selected_ids': selected_ids,
+        'larguras': widths_str,
+        'widths': widths,
+        'rows': rows,
+    }
+    return render(request, 'purchases/purchase_width_sweep.html', context)
+
+def purchase_mrp(request):
+    """
+    Time-phased buy suggestions: open order book by delivery week netted
+    against stock and open purchase orders.
+    """
+    suggestions = purchase_suggestions()
+
+    weeks = []
+    for suggestion in suggestions:
+        if not weeks or weeks[-1]['week'] != suggestion['week']:
+            weeks.append({'week': suggestion['week'], 'release': suggestion['release'], 'lines': []})
+        weeks[-1]['lines'].append(suggestion)
+
+    return render(request, 'purchases/purchase_mrp.html', {
+        'weeks': weeks,
+        'lead_time_days': get_lead_time().days,
+    })
+
 def purchase_order_create(request):
     """
     Finalizes the creation of the Purchase Order.
@@ -71,30 +161,7 @@ def purchase_order_create(request):
         selected_ids = selected_ids_str.split(',')
         orders = Pedido.objects.filter(id__in=selected_ids)
         
-        with transaction.atomic():
-            # 1. Create Header
-            oc = OrdemCompra.objects.create(status='aberta')
-            oc.pedidos.set(orders)
-            
-            # 2. Calculate Again (Safety)
-            requirements = get_material_requirements_for_orders(orders)
-            
-            # 3. Create Items
-            for (material, cor), data in requirements.items():
-                qtd_needed = data['qtd']
-                
-                stock_entry = EstoqueMaterial.objects.filter(material=material, cor=cor).first()
-                current_stock = stock_entry.quantidade if stock_entry else 0.0
-                to_buy = max(0, qtd_needed - current_stock)
-                
-                OrdemCompraItem.objects.create(
-                    ordem_compra=oc,
-                    material=material,
-                    cor=cor,
-                    quantidade_necessaria=qtd_needed,
-                    quantidade_estoque_na_epoca=current_stock,
-                    quantidade_comprar=to_buy
-                )
+        oc = create_purchase_order(orders)
         
         messages.success(request, f"Ordem de Compra #{oc.id} gerada com sucesso!")
         return redirect('purchase_order_detail', oc_id=oc.id)
@@ -125,29 +192,9 @@ def purchase_order_recalculate(request, oc_id):
     oc = get_object_or_404(OrdemCompra, id=oc_id)
     
     if request.method == 'POST':
-        with transaction.atomic():
-            # 1. Clear existing items
-            oc.itens.all().delete()
-            
-            # 2. Re-calculate requirements
-            requirements = get_material_requirements_for_orders(oc.pedidos.all())
-            
-            # 3. Create items with fresh stock data
-            for (material, cor), data in requirements.items():
-                qtd_needed = data['qtd']
-                
-                stock_entry = EstoqueMaterial.objects.filter(material=material, cor=cor).first()
-                current_stock = stock_entry.quantidade if stock_entry else 0.0
-                to_buy = max(0, qtd_needed - current_stock)
-                
-                OrdemCompraItem.objects.create(
-                    ordem_compra=oc,
-                    material=material,
-                    cor=cor,
-                    quantidade_necessaria=qtd_needed,
-                    quantidade_estoque_na_epoca=current_stock,
-                    quantidade_comprar=to_buy
-                )
+        # 'diff' (default) only touches the items that changed; 'full' recreates them all
+        mode = RECALC_FULL if request.POST.get('modo') == RECALC_FULL else RECALC_DIFF
+        recalculate_purchase_order(oc, mode=mode)
         
         messages.success(request, f"Ordem de Compra #{oc_id} recalculada com sucesso!")
             
@@ -1,6 +1,7 @@
 from django.contrib import admin
-from sales.models import Pedido, PedidoItem, PedidoConfig
+from sales.models import Pedido, PedidoItem, PedidoConfig, NecessidadeMaterial
 
 admin.site.register(Pedido)
 admin.site.register(PedidoItem)
 admin.site.register(PedidoConfig)
+admin.site.register(NecessidadeMaterial)
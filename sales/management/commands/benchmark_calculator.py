@@ -0,0 +1,173 @@
+import json
+import platform
+import statistics
+import time
+
+import django
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.client import RequestFactory
+
+from purchases import views as purchase_views
+from purchases.models import OrdemCompra
+from sales.services.material_calculator import (
+    MODE_ACCURATE,
+    get_material_requirements_for_orders,
+    get_material_requirements_for_orders_bulk,
+)
+from sales.services.requirements_ledger import get_material_requirements_from_ledger, rebuild_item_requirements
+from sales.services.synthetic import SyntheticDataset
+
+
+class _QueryCounter:
+    """connection.execute_wrapper counting queries (no DEBUG log, no 9000 cap)."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class _Rollback(Exception):
+    """Raised to undo the synthetic dataset at the end of a run."""
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks the material calculator and the purchase views on synthetic '
+        'moldes, SKUs and orders. Data is created inside a transaction and rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=str, default='10,100,1000,10000', help='Comma separated numbers of order lines')
+        parser.add_argument('--moldes', type=int, default=20, help='Synthetic moldes')
+        parser.add_argument('--pieces', type=int, default=6, help='Pieces per molde (rect, circle, poly in turn)')
+        parser.add_argument('--points', type=int, default=32, help='Vertices of the polygon pieces')
+        parser.add_argument('--skus', type=int, default=3, help='SKUs per molde')
+        parser.add_argument('--custom-ratio', type=float, default=0.3, help='Share of lines with custom fabric configs')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per measurement (the median is reported)')
+        parser.add_argument('--walk-limit', type=int, default=1000, help='Skip the per-order walk above this many lines (0 = never skip)')
+        parser.add_argument('--accurate', action='store_true', help='Also time the nesting (accurate) mode')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', type=str, help='Write the JSON results to this file')
+        parser.add_argument('--json', action='store_true', help='Print the JSON results instead of a table')
+
+    def _measure(self, func, repeat):
+        """Median wall time (s) over `repeat` runs and the SQL queries of one run."""
+        timings = []
+        queries = 0
+        for n in range(repeat):
+            counter = _QueryCounter()
+            with connection.execute_wrapper(counter):
+                start = time.perf_counter()
+                func()
+                timings.append(time.perf_counter() - start)
+            if n == 0:
+                queries = counter.count
+        return {'seconds': round(statistics.median(timings), 6), 'queries': queries}
+
+    def _post(self, view, path, data, **kwargs):
+        request = self.factory.post(path, data)
+        request._messages = CookieStorage(request)
+        return view(request, **kwargs)
+
+    def _run_size(self, lines, options):
+        repeat = options['repeat']
+        dataset = SyntheticDataset(
+            moldes=options['moldes'], pieces=options['pieces'], points=options['points'],
+            skus_per_molde=options['skus'], custom_ratio=options['custom_ratio'], seed=options['seed'],
+        )
+
+        start = time.perf_counter()
+        dataset.create_master_data()
+        orders = dataset.create_orders(lines)
+        setup = time.perf_counter() - start
+
+        order_ids = [o.id for o in orders]
+        ids_str = ','.join(str(i) for i in order_ids)
+        results = {}
+
+        # The ledger is not fed by bulk_create: building it is measured too
+        results['ledger_rebuild'] = self._measure(
+            lambda: rebuild_item_requirements([i.id for i in dataset.items]), 1
+        )
+
+        if not options['walk_limit'] or lines <= options['walk_limit']:
+            results['calculator_walk'] = self._measure(lambda: get_material_requirements_for_orders(orders), repeat)
+        results['calculator_bulk'] = self._measure(lambda: get_material_requirements_for_orders_bulk(orders), repeat)
+        if options['accurate']:
+            results['calculator_accurate'] = self._measure(
+                lambda: get_material_requirements_for_orders_bulk(orders, mode=MODE_ACCURATE), repeat
+            )
+        results['ledger_read'] = self._measure(lambda: get_material_requirements_from_ledger(orders), repeat)
+
+        results['view_purchase_planning'] = self._measure(
+            lambda: purchase_views.purchase_planning(self.factory.get('/purchase/planning/')), repeat
+        )
+        results['view_purchase_preview'] = self._measure(
+            lambda: self._post(purchase_views.visualize_purchase_creation, '/purchase/create/preview/',
+                               {'selected_orders': order_ids}),
+            repeat,
+        )
+        results['view_purchase_create'] = self._measure(
+            lambda: self._post(purchase_views.purchase_order_create, '/purchase/create/finish/',
+                               {'selected_ids': ids_str}),
+            1,
+        )
+        oc = OrdemCompra.objects.order_by('-id').first()
+        results['view_purchase_recalculate'] = self._measure(
+            lambda: self._post(purchase_views.purchase_order_recalculate, f'/purchase/{oc.id}/recalculate/', {},
+                               oc_id=oc.id),
+            repeat,
+        )
+
+        return {
+            'lines': lines,
+            'orders': len(orders),
+            'custom_lines': dataset.custom_lines,
+            'setup_seconds': round(setup, 3),
+            'results': results,
+        }
+
+    def handle(self, *args, **options):
+        self.factory = RequestFactory()
+        sizes = [int(s) for s in options['sizes'].split(',') if s.strip()]
+
+        runs = []
+        for lines in sizes:
+            if not options['json']:
+                self.stdout.write(f'Running {lines} lines...')
+            try:
+                with transaction.atomic():
+                    runs.append(self._run_size(lines, options))
+                    raise _Rollback
+            except _Rollback:
+                pass
+
+        report = {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'parameters': {
+                key: options[key] for key in ('moldes', 'pieces', 'points', 'skus', 'custom_ratio', 'repeat', 'seed')
+            },
+            'runs': runs,
+        }
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        self.stdout.write(f"{'lines':>7}  {'measurement':<28}{'seconds':>10}{'queries':>9}")
+        for run in runs:
+            for name, result in run['results'].items():
+                self.stdout.write(f"{run['lines']:>7}  {name:<28}{result['seconds']:>10.4f}{result['queries']:>9}")
+        if options['output']:
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
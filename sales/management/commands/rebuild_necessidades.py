@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from sales.services.requirements_ledger import rebuild_all_requirements
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the material requirements ledger (NecessidadeMaterial) of every order item'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Items recomputed per batch')
+
+    def handle(self, *args, **options):
+        total = rebuild_all_requirements(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Requirements ledger rebuilt for {total} items.'))
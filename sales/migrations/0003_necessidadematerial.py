@@ -0,0 +1,28 @@
+# Generated by Django 6.0 on 2026-10-18 12:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0001_initial'),
+        ('sales', '0002_pedido_data_entrega_alter_pedidoitem_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NecessidadeMaterial',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantidade', models.FloatField(default=0.0)),
+                ('cor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='inventory.cor')),
+                ('material', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='necessidades', to='inventory.material')),
+                ('pedido_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='necessidades', to='sales.pedidoitem')),
+            ],
+            options={
+                'unique_together': {('pedido_item', 'material', 'cor')},
+            },
+        ),
+    ]
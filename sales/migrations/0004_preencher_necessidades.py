@@ -0,0 +1,29 @@
+# Generated by Django 6.0 on 2026-10-18 12:00
+
+from django.db import migrations
+
+
+def preencher_necessidades(apps, schema_editor):
+    """
+    Fills the ledger of the existing order items, so purchases read them right
+    after deploy. The calculator runs on the current models, hence the
+    dependencies on the latest migrations of every app it reads.
+    """
+    from sales.services.requirements_ledger import rebuild_all_requirements
+
+    rebuild_all_requirements()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encaixe', '0001_encaixecache'),
+        ('inventory', '0002_movimento_estoque'),
+        ('molds', '0005_moldedetalhe_geometria_lod'),
+        ('products', '0004_produtoconsumo_dependencias'),
+        ('sales', '0003_necessidadematerial'),
+    ]
+
+    operations = [
+        migrations.RunPython(preencher_necessidades, migrations.RunPython.noop),
+    ]
@@ -19,17 +19,19 @@ class Pedido(models.Model):
     @property
     def status_info(self):
         items = list(self.itens.all())
-        total_items = len(items)
+        liberados = sum(1 for i in items if i.status in PedidoItem.STATUS_LIBERADOS)
+        return self.status_info_from_counts(len(items), liberados)
+
+    @staticmethod
+    def status_info_from_counts(total_items, liberados):
+        """status_info a partir das contagens (ex: anotadas via SQL na listagem)."""
         if total_items == 0:
             return {
                 'display': "Vazio",
                 'color': "#bdc3c7", # Grey
                 'pending_msg': ""
             }
-            
-        # Count statuses
-        liberados = sum(1 for i in items if i.status in ['LIBERADO_PRODUCAO', 'EM_PRODUCAO', 'CONCLUIDO'])
-        
+
         if liberados == total_items:
             return {
                 'display': "LIBERADO PRODUÇÃO",
@@ -70,6 +72,8 @@ class PedidoItem(models.Model):
         ('CONCLUIDO', 'Concluído'),
         ('CANCELADO', 'Cancelado'),
     ]
+    # Itens já liberados pelo técnico (contam como liberados no status do pedido)
+    STATUS_LIBERADOS = ['LIBERADO_PRODUCAO', 'EM_PRODUCAO', 'CONCLUIDO']
 
     pedido = models.ForeignKey(Pedido, on_delete=models.CASCADE, related_name='itens')
     molde = models.ForeignKey(Molde, on_delete=models.PROTECT, null=True, blank=True)
@@ -108,3 +112,20 @@ class PedidoConfig(models.Model):
     def __str__(self):
         mat_nome = self.material.nome if self.material else "N/A"
         return f"{self.molde_peca.nome_original} -> {mat_nome} {self.cor.nome}"
+
+class NecessidadeMaterial(models.Model):
+    """
+    Necessidade de material materializada por item de pedido (unidade base: mm para medidas).
+    Mantida por sales/signals.py; as telas de compra apenas somam esta tabela.
+    """
+    pedido_item = models.ForeignKey(PedidoItem, on_delete=models.CASCADE, related_name='necessidades')
+    material = models.ForeignKey(Material, on_delete=models.CASCADE, related_name='necessidades')
+    cor = models.ForeignKey(Cor, on_delete=models.CASCADE, null=True, blank=True)
+    quantidade = models.FloatField(default=0.0)
+
+    class Meta:
+        unique_together = ('pedido_item', 'material', 'cor')
+
+    def __str__(self):
+        cor_nome = self.cor.nome if self.cor else "S/ Cor"
+        return f"Item #{self.pedido_item_id} - {self.material.nome} ({cor_nome}): {self.quantidade}"
@@ -0,0 +1,122 @@
+"""
+Marker (encaixe) of an order item: the pieces it is cut from and their
+server-side skyline nesting.
+"""
+from encaixe.services.geometry import piece_points
+from encaixe.services.nesting import ENGINE_TRUE_SHAPE, check_placements, get_engine, nest_pieces
+from sales.models import PedidoConfig
+from sales.services.row_yield import DEFAULT_FABRIC_WIDTH_MM
+
+
+def _add_geometry(piece, peca, mm_per_px=None):
+    geom = peca.geometria_json
+    # Override name with DB name to be safe
+    geom['name'] = peca.nome_original
+    piece['geom'] = geom
+    piece['pts'] = piece_points(geom)
+    if mm_per_px:
+        # Outline drawn for every placed copy (stored level of detail of the scale)
+        piece['pts_desenho'] = piece_points(peca.get_geometria_desenho(mm_per_px))
+
+
+def get_item_pieces(item, include_geometry=True, mm_per_px=None):
+    """
+    Pieces of a PedidoItem in the dict shape used by the nesting engine and
+    visualize.html. Custom configs (PedidoConfig) win over the SKU BOM.
+    With `include_geometry` each piece also carries its geometria_json ('geom')
+    and outline ('pts', used by the true-shape engine); with `mm_per_px` also
+    the outline to draw at that scale ('pts_desenho', from the stored level of
+    detail MoldeDetalhe.geometria_lod).
+    """
+    configs = PedidoConfig.objects.filter(pedido_item=item).select_related('molde_peca', 'material', 'cor')
+
+    pieces_data = []
+
+    if configs.exists():
+        # SCENARIO A: Custom Configuration (PedidoConfig)
+        for config in configs:
+            peca = config.molde_peca
+            w_box, h_box = peca.get_bbox()
+
+            piece = {
+                'id': peca.id,
+                'name': peca.nome_original,
+                'qty': peca.qtd_padrao,
+                'w': w_box,
+                'h': h_box,
+                'geometry_hash': peca.geometria_hash,
+                'rotacao_fixa': peca.rotacao_fixa,
+                'orientacao_fio': peca.orientacao_fio,
+                'color': config.cor.hex_code if config.cor else '#cccccc',
+                'color_name': config.cor.nome if config.cor else 'Padrão',
+                'fabric_name': config.material.nome if config.material else 'Indefinido',
+                'fabric_width': config.material.largura_padrao_mm if config.material else DEFAULT_FABRIC_WIDTH_MM
+            }
+            if include_geometry:
+                _add_geometry(piece, peca, mm_per_px)
+            pieces_data.append(piece)
+
+    elif item.produto:
+        # SCENARIO B: Standard SKU (Product)
+        sku = item.produto
+        molde = item.molde or sku.molde
+
+        # Map Piece -> Material/Color from ItensMaterial ('molde_detalhe' FK)
+        sku_materials_map = {}
+        for im in sku.itens_material.select_related('material', 'cor'):
+            if im.molde_detalhe_id:
+                sku_materials_map[im.molde_detalhe_id] = im
+
+        # Iterate all pieces of the mold. For visualization, better to show
+        # unmapped pieces in grey than hide them.
+        for peca in molde.detalhes.all():
+            im = sku_materials_map.get(peca.id)
+
+            material = im.material if im else None
+            cor = im.cor if im else None
+            w_box, h_box = peca.get_bbox()
+
+            piece = {
+                'id': peca.id,
+                'name': peca.nome_original,
+                'qty': peca.qtd_padrao,
+                'w': w_box,
+                'h': h_box,
+                'geometry_hash': peca.geometria_hash,
+                'rotacao_fixa': peca.rotacao_fixa,
+                'orientacao_fio': peca.orientacao_fio,
+                'color': cor.hex_code if cor else '#e2e8f0',
+                'color_name': cor.nome if cor else 'Padrão',
+                'fabric_name': material.nome if material else 'Tecido Base',
+                'fabric_width': material.largura_padrao_mm if material and material.largura_padrao_mm else DEFAULT_FABRIC_WIDTH_MM
+            }
+            if include_geometry:
+                _add_geometry(piece, peca, mm_per_px)
+            pieces_data.append(piece)
+
+    return pieces_data
+
+
+def get_item_fabric_width(item):
+    """Default roll width for the item: the first configured fabric, else 1500 mm."""
+    config = PedidoConfig.objects.filter(pedido_item=item).select_related('material').first()
+    if config and config.material and config.material.largura_padrao_mm:
+        return config.material.largura_padrao_mm
+    return DEFAULT_FABRIC_WIDTH_MM
+
+
+def nest_order_item(item, quantity=None, fabric_width=None, engine=None, mm_per_px=None):
+    """
+    Nesting of `quantity` (default: the item quantity) units of the item.
+    `fabric_width` forces one width for every roll; by default each roll uses
+    its own fabric width. `engine` is 'skyline' (bbox, fast) or 'true_shape'.
+    The nesting always uses the full outlines; with `mm_per_px` the placed
+    outlines are the pieces' stored levels of detail for that scale.
+    Raises ValueError above ENCAIXE_NESTING_MAX_PLACEMENTS copies.
+    """
+    if quantity is None:
+        quantity = item.quantidade
+    engine = get_engine(engine)
+    pieces = get_item_pieces(item, include_geometry=(engine == ENGINE_TRUE_SHAPE), mm_per_px=mm_per_px)
+    check_placements(pieces, quantity)
+    return nest_pieces(pieces, quantity=quantity, fabric_width=fabric_width, engine=engine)
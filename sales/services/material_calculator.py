@@ -1,6 +1,156 @@
-import math
-from products.models import ProdutoConsumo
+from django.conf import settings
+
+from encaixe.services.geometry import piece_points
+from encaixe.services.nesting import ENGINE_TRUE_SHAPE, get_engine, nest_rolls
+from inventory.models import Material, Cor
+from inventory.units import to_storage, unit_for
+from products.models import ProdutoConsumo, ItensMaterial, ProdutoInsumo
 from molds.models import MoldeDetalhe
+from sales.models import PedidoItem, PedidoConfig
+from sales.services.row_yield import DEFAULT_FABRIC_WIDTH_MM, linear_mm, linear_mm_batch
+
+# Fabric consumption modes:
+#   estimate - row-yield of each piece's bounding box (fast)
+#   accurate - nesting of all pieces of a roll, as laid out in the cut room
+#              (engine: ENCAIXE_NESTING_ENGINE, skyline by default)
+MODE_ESTIMATE = 'estimate'
+MODE_ACCURATE = 'accurate'
+
+
+def get_calc_mode(mode=None):
+    """Explicit mode, else settings.ENCAIXE_CALC_MODE (default: estimate)."""
+    return mode or getattr(settings, 'ENCAIXE_CALC_MODE', MODE_ESTIMATE)
+
+
+def _config_row_yield_args(conf, item_quantidade):
+    """
+    Inputs of the row-yield kernel for one PedidoConfig:
+    (w_box, h_box, width_mm, total_qty, rotacao_fixa)
+    """
+    # --- Geometric Calculation (Bounding Box) ---
+    width_mm = conf.material.largura_padrao_mm if conf.material.largura_padrao_mm else DEFAULT_FABRIC_WIDTH_MM
+
+    # Precomputed geometry index (falls back to geometria_json for legacy rows)
+    w_box, h_box = conf.molde_peca.get_bbox()
+
+    # Add Margin
+    margin = 0 # Could be configurable
+    w_box += margin
+    h_box += margin
+
+    # Calculate Total Quantity of PIECES needed
+    qty_peca_por_produto = conf.molde_peca.qtd_padrao if conf.molde_peca.qtd_padrao else 1
+    total_item_qty = item_quantidade * qty_peca_por_produto
+
+    return w_box, h_box, width_mm, total_item_qty, conf.molde_peca.rotacao_fixa
+
+
+def _config_linear_mm(conf, item_quantidade):
+    """
+    Row-yield estimate (linear mm of fabric) for one PedidoConfig.
+    """
+    return linear_mm(*_config_row_yield_args(conf, item_quantidade)) * 1.00
+
+
+def _configs_linear_mm(rows):
+    """
+    Batched row-yield for [(conf, item_quantidade), ...].
+    Returns {conf.id: linear_mm}.
+    """
+    args = [_config_row_yield_args(conf, qty) for conf, qty in rows]
+    if not args:
+        return {}
+    linear = linear_mm_batch(*zip(*args))
+    return {conf.id: value for (conf, _), value in zip(rows, linear)}
+
+
+def _roll_pieces(pecas, with_points=False):
+    """
+    Nesting input (see encaixe.services.nesting) of a list of MoldeDetalhe.
+    `with_points` adds the outline for the true-shape engine.
+    """
+    pieces = []
+    for peca in pecas:
+        w_box, h_box = peca.get_bbox()
+        piece = {
+            'id': peca.id,
+            'w': w_box,
+            'h': h_box,
+            'qty': peca.qtd_padrao if peca.qtd_padrao else 1,
+            'geometry_hash': peca.geometria_hash,
+            'rotacao_fixa': peca.rotacao_fixa,
+            'orientacao_fio': peca.orientacao_fio,
+        }
+        if with_points:
+            piece['pts'] = piece_points(peca.geometria_json or {})
+        pieces.append(piece)
+    return pieces
+
+
+def _linked_fabric_rows(bom_items):
+    """SKU BOM fabric rows linked to a piece: nested in accurate mode."""
+    return [
+        bom_item for bom_item in bom_items
+        if bom_item.tipo == 'tecido_padrao' and bom_item.molde_detalhe_id and bom_item.material
+    ]
+
+
+def _accurate_fabric_mm(items, configs_by_item, bom_by_sku):
+    """
+    Marker length of every (item, material, cor) roll, nested in one batch so
+    the rolls of all items share the cache and the process pool.
+    Rolls come from the custom configs or, for standard SKUs, from the BOM
+    fabric rows linked to a piece.
+    Returns {item.id: [(material, cor, linear_mm), ...]} in first-seen order.
+    """
+    specs = []
+    for item in items:
+        configs = configs_by_item.get(item.id, [])
+        if configs:
+            rows = [(conf.material, conf.cor, conf.molde_peca) for conf in configs if conf.material]
+        elif item.produto_id:
+            rows = [
+                (bom_item.material, bom_item.cor, bom_item.molde_detalhe)
+                for bom_item in _linked_fabric_rows(bom_by_sku.get(item.produto_id, []))
+            ]
+        else:
+            rows = []
+
+        rolls = {}
+        for material, cor, peca in rows:
+            rolls.setdefault((material, cor), []).append(peca)
+        specs.extend((item, material, cor, pecas) for (material, cor), pecas in rolls.items())
+
+    engine = get_engine()
+    nested = nest_rolls([
+        (
+            _roll_pieces(pecas, with_points=(engine == ENGINE_TRUE_SHAPE)),
+            item.quantidade,
+            material.largura_padrao_mm if material.largura_padrao_mm else DEFAULT_FABRIC_WIDTH_MM,
+        )
+        for item, material, cor, pecas in specs
+    ], engine=engine)
+
+    fabric_mm = {}
+    for (item, material, cor, _), roll in zip(specs, nested):
+        # Pieces wider than the roll are still bought: one row each
+        linear = roll['length_mm'] + sum(p['h'] for p in roll['unplaced'])
+        fabric_mm.setdefault(item.id, []).append((material, cor, linear))
+    return fabric_mm
+
+
+def _normalize_quantity(material, quantity):
+    """Converte a quantidade da BOM (unidade do material) para a unidade base (mm)."""
+    return to_storage(quantity, unit_for(material))
+
+
+def _add_to_report(report_data, material, cor, quantity):
+    key = (material, cor)
+    if key not in report_data:
+        report_data[key] = {'qtd': 0.0, 'pecas': []}
+
+    report_data[key]['qtd'] += quantity
+
 
 def get_material_requirements_for_orders(orders):
     """
@@ -11,103 +161,26 @@ def get_material_requirements_for_orders(orders):
 
     for order in orders:
         for item in order.itens.all():
-            
+
             # 1. Fabrics (from Configs) - Dynamic Calculation
             # This ensures we handle custom fabric widths correctly vs the cached standard.
             configs = item.configuracoes.all()
             for conf in configs:
                 if not conf.material: continue
-                
-                # --- Geometric Calculation (Bounding Box) ---
-                
-                width_mm = conf.material.largura_padrao_mm if conf.material.largura_padrao_mm else 1500
-                
-                # Extract Geometry to calc BBox
-                geom = conf.molde_peca.geometria_json
-                g_type = geom.get('type', 'unknown')
-                
-                w_box, h_box = 0, 0
-                
-                if g_type == 'rect':
-                    w_box = geom.get('halfW', 0) * 2
-                    h_box = geom.get('halfH', 0) * 2
-                elif g_type == 'circle':
-                    r = geom.get('radius', 0)
-                    w_box = r * 2
-                    h_box = r * 2
-                elif g_type == 'poly':
-                    pts = geom.get('pts', [])
-                    if pts:
-                        xs = [p['x'] for p in pts]
-                        ys = [p['y'] for p in pts]
-                        w_box = max(xs) - min(xs)
-                        h_box = max(ys) - min(ys)
-                
-                # Add Margin
-                margin = 0 # Could be configurable
-                w_box += margin
-                h_box += margin
-                
-                # --- ROW YIELD CALCULATION ---
-                # Calculate Total Quantity of PIECES needed
-                qty_peca_por_produto = conf.molde_peca.qtd_padrao if conf.molde_peca.qtd_padrao else 1
-                total_item_qty = item.quantidade * qty_peca_por_produto
-                
-                # Option A: Normal Orientation
-                fits_normal = int(width_mm // w_box)
-                if fits_normal < 1: fits_normal = 1
-                
-                rows_normal = math.ceil(total_item_qty / fits_normal)
-                total_normal = rows_normal * h_box
-                
-                # Option B: Rotated Orientation (90 deg)
-                if conf.molde_peca.rotacao_fixa:
-                    linear_mm = total_normal
-                else:
-                    fits_rotated = int(width_mm // h_box)
-                    if fits_rotated < 1: fits_rotated = 1
-                    
-                    rows_rotated = math.ceil(total_item_qty / fits_rotated)
-                    total_rotated = rows_rotated * w_box
-                    
-                    linear_mm = min(total_normal, total_rotated)
-                
-                linear_mm_safe = linear_mm * 1.00
-                
-                key = (conf.material, conf.cor)
-                if key not in report_data:
-                    report_data[key] = {'qtd': 0.0, 'pecas': []}
-                
-                report_data[key]['qtd'] += linear_mm_safe
-                # report_data[key]['pecas'].append(...)
-
-            # 2. Accessories (Insumos) - Direct from Configuration (ProdutoInsumoCor)
+
+                _add_to_report(report_data, conf.material, conf.cor, _config_linear_mm(conf, item.quantidade))
+
             # 2. Accessories / Materials (Defined in ItensMaterial)
             # Logic: Use the BOM from Produto, applied with the SKU Color.
             if item.produto:
                 # item.produto is now a SKU (Unified Produto model where parent is not null)
                 sku = item.produto
-                
+
                 # Helper to add to report
                 def add_item_to_report(material, cor, quantity, order_qty):
                      if not material: return
-                     qty_unit = quantity
-                     
-                     # Normalize Unit
-                     if material.is_unidade_medida():
-                        u = material.unidade.lower().strip()
-                        if u in ['mt', 'm', 'mts', 'metro', 'metros']:
-                            qty_unit *= 1000.0
-                        elif u in ['cm', 'centimetro']:
-                            qty_unit *= 10.0
-                            
-                     qty_total = qty_unit * order_qty
-                     
-                     key = (material, cor)
-                     if key not in report_data:
-                        report_data[key] = {'qtd': 0.0, 'pecas': set()}
-                     
-                     report_data[key]['qtd'] += qty_total
+                     qty_total = _normalize_quantity(material, quantity) * order_qty
+                     _add_to_report(report_data, material, cor, qty_total)
 
                 # 0. Fabrics (Standard SKU Consumption) - IF NOT Custom Config
                 if not item.configuracoes.exists():
@@ -124,13 +197,214 @@ def get_material_requirements_for_orders(orders):
                 # 1. Iterate SKU ItensMaterial (Fabrics & Insumos linked to pieces)
                 for bom_item in sku.itens_material.all():
                     if bom_item.tipo == 'tecido_padrao': continue # Handled by Geometry/Config OR ProdutoConsumo above
-                    
+
                     if bom_item.tipo == 'insumo':
                         add_item_to_report(bom_item.material, bom_item.cor, bom_item.quantidade, item.quantidade)
-                
+
                 # 2. Iterate SKU Global Insumos
                 for insumo in sku.insumos.all():
                     add_item_to_report(insumo.material, insumo.cor, insumo.quantidade, item.quantidade)
 
     return report_data
 
+
+def _group_by(rows, attr):
+    grouped = {}
+    for row in rows:
+        grouped.setdefault(getattr(row, attr), []).append(row)
+    return grouped
+
+
+def iter_item_requirements(items, mode=None):
+    """
+    Yields (item, material, cor, quantidade_mm) for every requirement of the
+    given PedidoItem list, in the same order as the per-order walk.
+
+    Configs, BOM rows (ItensMaterial), global insumos and consumos of all items
+    are loaded up front in a fixed number of queries (4).
+
+    In accurate mode fabrics are measured by nesting: custom configs and the
+    SKU BOM fabric rows linked to a piece yield one marker length per
+    (material, cor) roll instead of one row-yield estimate per piece.
+    """
+    accurate = get_calc_mode(mode) == MODE_ACCURATE
+    # Only true-shape nesting needs the outlines
+    needs_outline = accurate and get_engine() == ENGINE_TRUE_SHAPE
+    item_ids = [i.id for i in items]
+    sku_ids = {i.produto_id for i in items if i.produto_id}
+
+    # 1. Configs (Custom fabric per piece). Dimensions come from the geometry
+    # index, so the (potentially huge) geometria_json is not loaded; the
+    # drawing-only levels of detail (geometria_lod) never are.
+    configs_qs = (
+        PedidoConfig.objects.filter(pedido_item_id__in=item_ids).select_related('material', 'cor', 'molde_peca')
+            .defer('molde_peca__geometria_lod').order_by('id')
+    )
+    if not needs_outline:
+        configs_qs = configs_qs.defer('molde_peca__geometria_json')
+    configs_by_item = _group_by(configs_qs, 'pedido_item_id')
+
+    # 2. SKU BOM (ItensMaterial), Global Insumos and Consumption cache
+    bom_qs = ItensMaterial.objects.filter(produto_id__in=sku_ids).select_related('material', 'cor').order_by('id')
+    if accurate:
+        bom_qs = bom_qs.select_related('molde_detalhe').defer('molde_detalhe__geometria_lod')
+        if not needs_outline:
+            bom_qs = bom_qs.defer('molde_detalhe__geometria_json')
+    bom_by_sku = _group_by(bom_qs, 'produto_id')
+    insumos_by_sku = _group_by(
+        ProdutoInsumo.objects.filter(produto_id__in=sku_ids).select_related('material', 'cor').order_by('id'),
+        'produto_id'
+    )
+    consumos_by_sku = _group_by(
+        ProdutoConsumo.objects.filter(produto_id__in=sku_ids).select_related('material', 'cor').order_by('id'),
+        'produto_id'
+    )
+
+    if accurate:
+        # Skyline nesting of every roll in one batch
+        rolls_mm = _accurate_fabric_mm(items, configs_by_item, bom_by_sku)
+    else:
+        # Row-yield for every fabric config in one vectorized pass
+        fabric_mm = _configs_linear_mm([
+            (conf, item.quantidade)
+            for item in items
+            for conf in configs_by_item.get(item.id, [])
+            if conf.material
+        ])
+
+    for item in items:
+        configs = configs_by_item.get(item.id, [])
+
+        # 1. Fabrics (from Configs) - Dynamic Calculation
+        # (accurate: also the SKU fabric rows linked to a piece)
+        if accurate:
+            for material, cor, quantity in rolls_mm.get(item.id, []):
+                yield item, material, cor, quantity
+        else:
+            for conf in configs:
+                if not conf.material: continue
+                yield item, conf.material, conf.cor, fabric_mm[conf.id]
+
+        if not item.produto_id:
+            continue
+
+        bom_items = bom_by_sku.get(item.produto_id, [])
+        sku_rows = []
+        linked = _linked_fabric_rows(bom_items) if accurate and not configs else []
+
+        # 0. Fabrics (Standard SKU Consumption) - IF NOT Custom Config
+        if linked:
+            # Unlinked fabric rows keep their BOM quantity
+            sku_rows.extend(
+                (bom_item.material, bom_item.cor, bom_item.quantidade)
+                for bom_item in bom_items
+                if bom_item.tipo == 'tecido_padrao' and bom_item not in linked
+            )
+        elif not configs:
+            consumos = consumos_by_sku.get(item.produto_id)
+            if consumos:
+                sku_rows.extend((cons.material, cons.cor, cons.consumo_total) for cons in consumos)
+            else:
+                sku_rows.extend(
+                    (bom_item.material, bom_item.cor, bom_item.quantidade)
+                    for bom_item in bom_items if bom_item.tipo == 'tecido_padrao'
+                )
+
+        # 1. SKU ItensMaterial (Insumos linked to pieces)
+        sku_rows.extend(
+            (bom_item.material, bom_item.cor, bom_item.quantidade)
+            for bom_item in bom_items if bom_item.tipo == 'insumo'
+        )
+
+        # 2. SKU Global Insumos
+        sku_rows.extend((insumo.material, insumo.cor, insumo.quantidade) for insumo in insumos_by_sku.get(item.produto_id, []))
+
+        for material, cor, quantity in sku_rows:
+            if not material: continue
+            yield item, material, cor, _normalize_quantity(material, quantity) * item.quantidade
+
+
+def get_material_requirements_for_orders_bulk(orders, mode=None):
+    """
+    Set-based variant of get_material_requirements_for_orders.
+
+    Loads items, configs, BOM rows (ItensMaterial), global insumos and consumos
+    for the whole order set in a fixed number of queries and aggregates in memory.
+    Iteration order matches the per-order walk, so the totals are identical.
+    `mode` selects the fabric calculation (MODE_ESTIMATE / MODE_ACCURATE).
+    Returns the same structure: key=(material, cor), value={'qtd': float, 'pecas': list}
+    """
+    # Accept both QuerySets and plain lists of Pedido
+    if hasattr(orders, 'values_list'):
+        order_ids = list(orders.values_list('id', flat=True))
+    else:
+        order_ids = [o.id for o in orders]
+
+    # Items (with SKU), in the same order the orders were given
+    items = list(
+        PedidoItem.objects.filter(pedido_id__in=order_ids).order_by('id')
+    )
+    order_pos = {order_id: pos for pos, order_id in enumerate(order_ids)}
+    items.sort(key=lambda i: order_pos[i.pedido_id])
+
+    report_data = {}
+    for _, material, cor, quantity in iter_item_requirements(items, mode=mode):
+        _add_to_report(report_data, material, cor, quantity)
+
+    return report_data
+
+
+def iter_requirement_chunks(orders, chunk_size=500, mode=None):
+    """
+    Streaming variant of get_material_requirements_for_orders_bulk for very
+    large order sets (e.g. a year of orders for forecasting).
+
+    Items are read with .iterator() and processed `chunk_size` at a time, so
+    only one chunk of items, configs and BOM rows is in memory at once.
+    Yields one partial aggregate per chunk: {(material_id, cor_id): qtd_mm}.
+    Combine them with reduce_requirements().
+    """
+    items = PedidoItem.objects.filter(pedido__in=orders).order_by('pedido_id', 'id')
+
+    chunk = []
+    for item in items.iterator(chunk_size=chunk_size):
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            yield _chunk_totals(chunk, mode)
+            chunk = []
+    if chunk:
+        yield _chunk_totals(chunk, mode)
+
+
+def _chunk_totals(items, mode):
+    totals = {}
+    for _, material, cor, quantity in iter_item_requirements(items, mode=mode):
+        key = (material.id, cor.id if cor else None)
+        totals[key] = totals.get(key, 0.0) + quantity
+    return totals
+
+
+def reduce_requirements(partials, into=None):
+    """
+    Sums partial aggregates ({(material_id, cor_id): qtd}) into one dict.
+    Accepts any iterable, so the generator is consumed one chunk at a time.
+    """
+    totals = {} if into is None else into
+    for partial in partials:
+        for key, quantity in partial.items():
+            totals[key] = totals.get(key, 0.0) + quantity
+    return totals
+
+
+def requirements_report(totals):
+    """
+    Turns {(material_id, cor_id): qtd} into the report structure of
+    get_material_requirements_for_orders: key=(material, cor), value={'qtd', 'pecas'}.
+    """
+    materials = Material.objects.in_bulk({material_id for material_id, _ in totals})
+    cores = Cor.objects.in_bulk({cor_id for _, cor_id in totals if cor_id})
+
+    return {
+        (materials[material_id], cores.get(cor_id)): {'qtd': qtd, 'pecas': []}
+        for (material_id, cor_id), qtd in totals.items()
+    }
@@ -0,0 +1,93 @@
+"""
+Ledger of material requirements per PedidoItem (NecessidadeMaterial).
+
+The rows are rebuilt by sales/signals.py whenever something that feeds the
+calculator changes, so purchase screens read requirements with a single
+SUM ... GROUP BY instead of recomputing every order.
+"""
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import Sum
+
+from sales.models import PedidoItem, NecessidadeMaterial
+from sales.services.material_calculator import iter_item_requirements, requirements_report
+
+_state = threading.local()
+
+
+def rebuild_item_requirements(item_ids):
+    """
+    Recomputes the ledger rows of the given PedidoItem ids.
+    Ids of items that no longer exist simply end up with no rows.
+    """
+    item_ids = set(item_ids)
+    if not item_ids:
+        return
+
+    # Inside deferred_rebuild() the work is postponed to the end of the block
+    pending = getattr(_state, 'pending', None)
+    if pending is not None:
+        pending.update(item_ids)
+        return
+
+    items = list(PedidoItem.objects.filter(id__in=item_ids).order_by('id'))
+
+    totals = {}
+    for item, material, cor, quantity in iter_item_requirements(items):
+        key = (item.id, material.id, cor.id if cor else None)
+        totals[key] = totals.get(key, 0.0) + quantity
+
+    # Readers never see the items without rows, and a failed insert keeps the old ones
+    with transaction.atomic():
+        NecessidadeMaterial.objects.filter(pedido_item_id__in=item_ids).delete()
+        NecessidadeMaterial.objects.bulk_create([
+            NecessidadeMaterial(pedido_item_id=item_id, material_id=material_id, cor_id=cor_id, quantidade=qtd)
+            for (item_id, material_id, cor_id), qtd in totals.items()
+        ])
+
+
+@contextmanager
+def deferred_rebuild():
+    """
+    Collects the items touched inside the block and rebuilds them once at the end.
+    Useful for views that save many configs of the same item in a loop.
+    """
+    if getattr(_state, 'pending', None) is not None:
+        # Nested: the outermost block does the work
+        yield
+        return
+
+    _state.pending = set()
+    try:
+        yield
+    except BaseException:
+        _state.pending = None
+        raise
+    item_ids = _state.pending
+    _state.pending = None
+    rebuild_item_requirements(item_ids)
+
+
+def rebuild_all_requirements(batch_size=500):
+    """Rebuilds the whole ledger. Returns the number of items processed."""
+    item_ids = list(PedidoItem.objects.order_by('id').values_list('id', flat=True))
+    for start in range(0, len(item_ids), batch_size):
+        rebuild_item_requirements(item_ids[start:start + batch_size])
+    return len(item_ids)
+
+
+def get_material_requirements_from_ledger(orders):
+    """
+    Requirements of the given orders read from the ledger with one aggregate query.
+    Returns the same structure as get_material_requirements_for_orders:
+    key=(material, cor), value={'qtd': float, 'pecas': list}
+    """
+    rows = (
+        NecessidadeMaterial.objects.filter(pedido_item__pedido__in=orders)
+            .values_list('material_id', 'cor_id')
+            .annotate(qtd=Sum('quantidade'))
+            .order_by()
+    )
+    return requirements_report({(material_id, cor_id): qtd for material_id, cor_id, qtd in rows})
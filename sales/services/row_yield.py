@@ -0,0 +1,109 @@
+"""
+Row-yield estimate of fabric consumption.
+
+A piece with bounding box (w, h) is laid in rows across the fabric width:
+each row holds floor(width / w) pieces and consumes h mm of fabric. When the
+piece may rotate, the 90 deg layout (rows of h, consuming w) is also tried and
+the shorter one is kept.
+
+`linear_mm` is the scalar reference; `linear_mm_batch` evaluates many configs
+in one vectorized NumPy pass and falls back to the scalar loop when NumPy is
+not installed. Both return exactly the same floats. `linear_mm_sweep` evaluates
+the same configs against several candidate widths at once (what-if).
+"""
+import math
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+DEFAULT_FABRIC_WIDTH_MM = 1500
+
+
+def linear_mm(w_box, h_box, width_mm, total_qty, rotacao_fixa):
+    """
+    Linear mm of fabric needed for `total_qty` pieces of (w_box x h_box).
+    Degenerate boxes (0 mm) count as one piece per row.
+    """
+    # Option A: Normal Orientation
+    fits_normal = int(width_mm // w_box) if w_box > 0 else 1
+    if fits_normal < 1: fits_normal = 1
+
+    rows_normal = math.ceil(total_qty / fits_normal)
+    total_normal = rows_normal * h_box
+
+    # Option B: Rotated Orientation (90 deg)
+    if rotacao_fixa:
+        return total_normal
+
+    fits_rotated = int(width_mm // h_box) if h_box > 0 else 1
+    if fits_rotated < 1: fits_rotated = 1
+
+    rows_rotated = math.ceil(total_qty / fits_rotated)
+    total_rotated = rows_rotated * w_box
+
+    return min(total_normal, total_rotated)
+
+
+def _fits(width_mm, box):
+    # floor_divide follows Python's float // semantics; zero boxes -> 1 per row
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fits = np.floor_divide(width_mm, np.where(box > 0, box, 1.0))
+    fits = np.where(box > 0, fits, 1.0)
+    return np.maximum(fits, 1.0)
+
+
+def linear_mm_batch(w_box, h_box, width_mm, total_qty, rotacao_fixa):
+    """
+    Vectorized linear_mm over parallel sequences (one entry per PedidoConfig).
+    Returns a list of floats in the input order.
+    """
+    if np is None:
+        return [
+            linear_mm(w, h, width, qty, fixed)
+            for w, h, width, qty, fixed in zip(w_box, h_box, width_mm, total_qty, rotacao_fixa)
+        ]
+
+    w = np.asarray(w_box, dtype=np.float64)
+    h = np.asarray(h_box, dtype=np.float64)
+    width = np.asarray(width_mm, dtype=np.float64)
+    qty = np.asarray(total_qty, dtype=np.float64)
+    fixed = np.asarray(rotacao_fixa, dtype=bool)
+
+    if w.size == 0:
+        return []
+
+    total_normal = np.ceil(qty / _fits(width, w)) * h
+    total_rotated = np.ceil(qty / _fits(width, h)) * w
+
+    linear = np.where(fixed, total_normal, np.minimum(total_normal, total_rotated))
+    return linear.tolist()
+
+
+def linear_mm_sweep(w_box, h_box, total_qty, rotacao_fixa, widths_mm):
+    """
+    linear_mm of every row (one per piece config) for every candidate width,
+    in one broadcast pass: a (rows x widths) grid as a list of lists.
+    """
+    if np is None:
+        return [
+            [linear_mm(w, h, width, qty, fixed) for width in widths_mm]
+            for w, h, qty, fixed in zip(w_box, h_box, total_qty, rotacao_fixa)
+        ]
+
+    w = np.asarray(w_box, dtype=np.float64)[:, None]
+    h = np.asarray(h_box, dtype=np.float64)[:, None]
+    qty = np.asarray(total_qty, dtype=np.float64)[:, None]
+    fixed = np.asarray(rotacao_fixa, dtype=bool)[:, None]
+    width = np.asarray(widths_mm, dtype=np.float64)[None, :]
+
+    if w.size == 0 or width.size == 0:
+        return [[] for _ in range(w.shape[0])]
+
+    total_normal = np.ceil(qty / _fits(width, w)) * h
+    total_rotated = np.ceil(qty / _fits(width, h)) * w
+
+    linear = np.where(fixed, total_normal, np.minimum(total_normal, total_rotated))
+    return linear.tolist()
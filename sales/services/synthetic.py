@@ -0,0 +1,142 @@
+"""
+Synthetic data for benchmarks: moldes, SKUs, orders and configs.
+
+Everything is created with bulk_create (no signals), so the caller decides
+when to build derived data such as the requirements ledger. The generator is
+seeded, so two runs with the same arguments create the same dataset.
+"""
+import math
+import random
+
+from inventory.models import Cor, EstoqueMaterial, Material
+from molds.models import Molde, MoldeDetalhe
+from products.models import Produto, ItensMaterial, ProdutoInsumo
+from sales.models import Pedido, PedidoItem, PedidoConfig
+
+SHAPES = ('rect', 'circle', 'poly')
+
+
+def _geometry(rng, shape, points):
+    if shape == 'rect':
+        return {'type': 'rect', 'halfW': rng.uniform(50, 400), 'halfH': rng.uniform(50, 400)}
+    if shape == 'circle':
+        return {'type': 'circle', 'radius': rng.uniform(40, 250)}
+
+    # Star-shaped polygon: `points` vertices at random radii around the origin
+    step = 2 * math.pi / points
+    return {'type': 'poly', 'pts': [
+        {'x': round(r * math.cos(i * step), 2), 'y': round(r * math.sin(i * step), 2)}
+        for i, r in enumerate(rng.uniform(100, 400) for _ in range(points))
+    ]}
+
+
+class SyntheticDataset:
+    """
+    Builds a dataset of `lines` order items (PedidoItem).
+
+    Orders get `lines_per_order` items each; `custom_ratio` of the items carry
+    a PedidoConfig per piece (custom fabrics), the rest use the SKU BOM.
+    """
+
+    def __init__(self, moldes=20, pieces=6, points=32, skus_per_molde=3,
+                 materials=12, colours=6, lines_per_order=5, custom_ratio=0.3, seed=42):
+        self.moldes = moldes
+        self.pieces = pieces
+        self.points = points
+        self.skus_per_molde = skus_per_molde
+        self.materials = materials
+        self.colours = colours
+        self.lines_per_order = lines_per_order
+        self.custom_ratio = custom_ratio
+        self.rng = random.Random(seed)
+
+    def create_master_data(self):
+        rng = self.rng
+
+        self.cores = Cor.objects.bulk_create([
+            Cor(nome=f'Bench Cor {n}', hex_code=f'#{rng.randrange(0x1000000):06x}') for n in range(self.colours)
+        ])
+        fabrics = Material.objects.bulk_create([
+            Material(nome=f'Bench Tecido {n}', unidade='mt', eh_tecido=True, largura_padrao_mm=rng.choice([1400, 1500, 1600]))
+            for n in range(self.materials)
+        ])
+        trims = Material.objects.bulk_create([
+            Material(nome=f'Bench Aviamento {n}', unidade=rng.choice(['un', 'cm', 'mt']))
+            for n in range(self.materials)
+        ])
+        self.fabrics = fabrics
+        EstoqueMaterial.objects.bulk_create([
+            EstoqueMaterial(material=material, cor=cor, quantidade=rng.uniform(0, 50000))
+            for material in fabrics + trims for cor in self.cores
+        ])
+
+        moldes = Molde.objects.bulk_create([Molde(nome=f'Bench Molde {n}') for n in range(self.moldes)])
+        detalhes = []
+        for molde in moldes:
+            for n in range(self.pieces):
+                shape = SHAPES[n % len(SHAPES)]
+                peca = MoldeDetalhe(
+                    molde=molde, nome_original=f'Peca {n}', tipo_geom=shape,
+                    qtd_padrao=rng.choice([1, 1, 2]), rotacao_fixa=rng.random() < 0.3,
+                    geometria_json=_geometry(rng, shape, self.points),
+                )
+                peca.atualizar_indice()
+                detalhes.append(peca)
+        MoldeDetalhe.objects.bulk_create(detalhes)
+        self.pieces_by_molde = {}
+        for peca in MoldeDetalhe.objects.filter(molde__in=moldes).order_by('id'):
+            self.pieces_by_molde.setdefault(peca.molde_id, []).append(peca)
+
+        skus = []
+        for molde in moldes:
+            ref = Produto.objects.create(nome=molde.nome, molde=molde, eh_padrao=True)
+            skus.extend(
+                Produto(nome=molde.nome, molde=molde, parent=ref, sku=f'{molde.id}-{n}')
+                for n in range(self.skus_per_molde)
+            )
+        self.skus = Produto.objects.bulk_create(skus)
+
+        bom = []
+        insumos = []
+        for sku in self.skus:
+            cor = rng.choice(self.cores)
+            for peca in self.pieces_by_molde[sku.molde_id]:
+                bom.append(ItensMaterial(
+                    produto=sku, molde_detalhe=peca, material=rng.choice(fabrics), cor=cor,
+                    quantidade=round(rng.uniform(0.1, 1.0), 3), tipo='tecido_padrao',
+                ))
+            bom.append(ItensMaterial(produto=sku, material=rng.choice(trims), cor=cor, quantidade=rng.randint(1, 60), tipo='insumo'))
+            insumos.append(ProdutoInsumo(produto=sku, material=rng.choice(trims), quantidade=rng.randint(1, 8)))
+        ItensMaterial.objects.bulk_create(bom)
+        ProdutoInsumo.objects.bulk_create(insumos)
+
+    def create_orders(self, lines):
+        """Creates orders totalling `lines` items. Returns the list of Pedido."""
+        rng = self.rng
+        count = max(math.ceil(lines / self.lines_per_order), 1)
+        orders = Pedido.objects.bulk_create([Pedido(cliente=f'Bench Cliente {n}') for n in range(count)])
+
+        items = []
+        for n in range(lines):
+            sku = rng.choice(self.skus)
+            items.append(PedidoItem(
+                pedido=orders[n // self.lines_per_order], molde_id=sku.molde_id, produto=sku,
+                quantidade=rng.randint(1, 200),
+            ))
+        items = PedidoItem.objects.bulk_create(items)
+
+        configs = []
+        self.custom_lines = 0
+        for item in items:
+            if rng.random() >= self.custom_ratio:
+                continue
+            self.custom_lines += 1
+            for peca in self.pieces_by_molde[item.molde_id]:
+                configs.append(PedidoConfig(
+                    pedido_item=item, molde_peca=peca,
+                    material=rng.choice(self.fabrics), cor=rng.choice(self.cores),
+                ))
+        PedidoConfig.objects.bulk_create(configs)
+
+        self.items = items
+        return orders
@@ -0,0 +1,154 @@
+"""
+What-if of fabric consumption over candidate roll widths.
+
+"What if we bought the 1.40 m instead of the 1.60 m Lona?" — every fabric row
+of the selected orders whose piece geometry is known is evaluated against all
+candidate widths in one broadcast row-yield pass (row_yield.linear_mm_sweep):
+custom PedidoConfig rows as the calculator does, and SKU BOM fabric rows
+linked to a piece as ProdutoConsumo does (row-yield of a reference batch of
+ENCAIXE_CONSUMO_LOTE units, per unit). Unlinked BOM quantities do not depend
+on the width and are added as a constant. Only materials in length units are
+swept, like compute_consumos.
+
+'current_mm' is what the calculator (and the purchase screens) report for the
+same orders: custom configs at the material's width, SKUs from their
+ProdutoConsumo rows, or their BOM quantities while those are being rebuilt.
+"""
+from inventory.units import unit_for
+from products.models import ItensMaterial, ProdutoConsumo
+from products.services.consumo import get_lote
+from sales.models import PedidoItem, PedidoConfig
+from sales.services.material_calculator import _normalize_quantity
+from sales.services.row_yield import DEFAULT_FABRIC_WIDTH_MM, linear_mm_sweep
+
+
+def parse_widths(raw):
+    """'1400, 1500,1.6m' style input -> sorted distinct widths in mm. Values under 10 are metres."""
+    widths = set()
+    for part in str(raw or '').replace(';', ',').split(','):
+        part = part.strip().lower().rstrip('m').strip()
+        if not part:
+            continue
+        value = float(part.replace(' ', ''))
+        if value <= 0:
+            raise ValueError(f"Invalid width: {part}")
+        widths.add(value * 1000.0 if value < 10 else value)
+    if not widths:
+        raise ValueError("No candidate widths given")
+    return sorted(widths)
+
+
+def width_sweep(orders, widths_mm, material_ids=None):
+    """
+    Linear mm of each fabric (material, cor) of `orders` for every width.
+
+    Returns {'widths': [mm, ...],
+             'rows': [{'material', 'cor', 'current_width', 'mm': [per width],
+                       'current_mm'}]}
+    sorted by material name. 'current_mm' uses the material's own width.
+    """
+    widths_mm = list(widths_mm)
+    items = list(PedidoItem.objects.filter(pedido__in=orders).order_by('id'))
+    item_ids = [i.id for i in items]
+
+    configs = (
+        PedidoConfig.objects.filter(pedido_item_id__in=item_ids)
+            .select_related('material', 'cor', 'molde_peca')
+            .defer('molde_peca__geometria_json', 'molde_peca__geometria_lod')
+    )
+    custom = {}
+    for conf in configs:
+        custom.setdefault(conf.pedido_item_id, []).append(conf)
+
+    sku_ids = {i.produto_id for i in items if i.produto_id}
+    bom = ItensMaterial.objects.filter(
+        produto_id__in=sku_ids, tipo='tecido_padrao'
+    ).select_related('material', 'cor', 'molde_detalhe').defer('molde_detalhe__geometria_json', 'molde_detalhe__geometria_lod')
+    consumos = ProdutoConsumo.objects.filter(produto_id__in=sku_ids).select_related('material', 'cor')
+    if material_ids:
+        bom = bom.filter(material_id__in=material_ids)
+        consumos = consumos.filter(material_id__in=material_ids)
+    bom_by_sku = {}
+    for row in bom:
+        bom_by_sku.setdefault(row.produto_id, []).append(row)
+    consumos_by_sku = {}
+    for cons in consumos:
+        consumos_by_sku.setdefault(cons.produto_id, []).append(cons)
+
+    lote = get_lote()
+
+    # (material, cor, peca, pieces, factor, custom) rows that depend on the
+    # width; constants per roll; current figures of the SKUs (calculator source)
+    variable = []
+    constant = {}
+    sku_current = {}
+    for item in items:
+        if item.id in custom:
+            # Custom fabrics replace the SKU fabric rows
+            variable.extend(
+                (c.material, c.cor, c.molde_peca, item.quantidade * (c.molde_peca.qtd_padrao or 1), 1.0, True)
+                for c in custom[item.id]
+                if c.material and (not material_ids or c.material_id in material_ids)
+            )
+            continue
+
+        for row in bom_by_sku.get(item.produto_id, []):
+            if not row.material or not unit_for(row.material).is_length:
+                continue
+            if row.molde_detalhe_id:
+                pieces = lote * (row.molde_detalhe.qtd_padrao or 1)
+                variable.append((row.material, row.cor, row.molde_detalhe, pieces, item.quantidade / lote, False))
+            else:
+                key = (row.material, row.cor)
+                constant[key] = constant.get(key, 0.0) + _normalize_quantity(row.material, row.quantidade) * item.quantidade
+
+        source = consumos_by_sku.get(item.produto_id)
+        if source:
+            source = [(cons.material, cons.cor, cons.consumo_total) for cons in source]
+        else:
+            source = [(row.material, row.cor, row.quantidade) for row in bom_by_sku.get(item.produto_id, [])]
+        for material, cor, quantity in source:
+            if not material or not unit_for(material).is_length:
+                continue
+            key = (material, cor)
+            sku_current[key] = sku_current.get(key, 0.0) + _normalize_quantity(material, quantity) * item.quantidade
+
+    args = []
+    for material, cor, peca, pieces, _, _ in variable:
+        w_box, h_box = peca.get_bbox()
+        args.append((w_box, h_box, pieces, peca.rotacao_fixa))
+
+    # Candidate widths plus the current width of each custom material, in one pass
+    current = sorted({m.largura_padrao_mm or DEFAULT_FABRIC_WIDTH_MM for m, *_, is_custom in variable if is_custom})
+    all_widths = widths_mm + current
+    grid = linear_mm_sweep(*zip(*args), all_widths) if args else []
+
+    rolls = {}
+
+    def _roll(material, cor):
+        key = (material.id, cor.id if cor else None)
+        if key not in rolls:
+            rolls[key] = {
+                'material': material,
+                'cor': cor,
+                'current_width': material.largura_padrao_mm or DEFAULT_FABRIC_WIDTH_MM,
+                'mm': [0.0] * len(widths_mm),
+                'current_mm': 0.0,
+            }
+        return rolls[key]
+
+    for (material, cor, _, _, factor, is_custom), linear in zip(variable, grid):
+        roll = _roll(material, cor)
+        for n in range(len(widths_mm)):
+            roll['mm'][n] += linear[n] * factor
+        if is_custom:
+            roll['current_mm'] += linear[len(widths_mm) + current.index(roll['current_width'])]
+    for (material, cor), value in constant.items():
+        roll = _roll(material, cor)
+        for n in range(len(widths_mm)):
+            roll['mm'][n] += value
+    for (material, cor), value in sku_current.items():
+        _roll(material, cor)['current_mm'] += value
+
+    rows = sorted(rolls.values(), key=lambda r: (r['material'].nome, r['cor'].nome if r['cor'] else ''))
+    return {'widths': widths_mm, 'rows': rows}
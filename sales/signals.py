@@ -0,0 +1,142 @@
+from django.db.models.signals import post_save, post_delete, pre_save, pre_delete
+from django.dispatch import receiver
+
+from encaixe.services.molde_importer import pecas_reimportadas
+from inventory.models import Material
+from molds.models import MoldeDetalhe
+from products.models import Produto, ItensMaterial, ProdutoInsumo, ProdutoConsumo
+from products.services.consumo import consumos_atualizados
+from sales.models import Pedido, PedidoItem, PedidoConfig
+from sales.services.requirements_ledger import deferred_rebuild, rebuild_item_requirements
+
+
+def _is_deleting_order(origin):
+    """True when the delete cascades from the order/item itself (ledger rows go with it)."""
+    model = getattr(origin, 'model', type(origin))
+    return model in (Pedido, PedidoItem)
+
+
+def _items_of_sku(produto_id):
+    return PedidoItem.objects.filter(produto_id=produto_id).values_list('id', flat=True)
+
+
+# --- Order side ---
+
+@receiver(post_save, sender=PedidoItem)
+def ledger_item_saved(sender, instance, **kwargs):
+    rebuild_item_requirements([instance.id])
+
+
+@receiver(post_save, sender=PedidoConfig)
+def ledger_config_saved(sender, instance, **kwargs):
+    rebuild_item_requirements([instance.pedido_item_id])
+
+
+@receiver(post_delete, sender=PedidoConfig)
+def ledger_config_deleted(sender, instance, origin=None, **kwargs):
+    if _is_deleting_order(origin):
+        return
+    rebuild_item_requirements([instance.pedido_item_id])
+
+
+# --- SKU BOM side ---
+
+@receiver(post_save, sender=ItensMaterial)
+@receiver(post_save, sender=ProdutoInsumo)
+@receiver(post_save, sender=ProdutoConsumo)
+def ledger_bom_saved(sender, instance, **kwargs):
+    rebuild_item_requirements(_items_of_sku(instance.produto_id))
+
+
+@receiver(post_delete, sender=ItensMaterial)
+@receiver(post_delete, sender=ProdutoInsumo)
+@receiver(post_delete, sender=ProdutoConsumo)
+def ledger_bom_deleted(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, Produto) or getattr(origin, 'model', None) is Produto:
+        # Handled once by ledger_sku_deleted
+        return
+    rebuild_item_requirements(_items_of_sku(instance.produto_id))
+
+
+@receiver(consumos_atualizados)
+def ledger_consumos_rebuilt(sender, produto_ids, **kwargs):
+    rebuild_item_requirements(
+        PedidoItem.objects.filter(produto_id__in=produto_ids).values_list('id', flat=True)
+    )
+
+
+@receiver(pre_delete, sender=Produto)
+def ledger_sku_deleting(sender, instance, **kwargs):
+    # PedidoItem.produto is SET_NULL'ed by the delete, so remember the items now
+    instance._ledger_item_ids = list(_items_of_sku(instance.id))
+
+
+@receiver(post_delete, sender=Produto)
+def ledger_sku_deleted(sender, instance, **kwargs):
+    rebuild_item_requirements(getattr(instance, '_ledger_item_ids', []))
+
+
+# --- Master data ---
+
+@receiver(pre_save, sender=Material)
+def ledger_material_changing(sender, instance, **kwargs):
+    instance._ledger_changed = None
+    if instance.pk is None:
+        return
+    old = Material.objects.filter(pk=instance.pk).values('largura_padrao_mm', 'unidade').first()
+    if old:
+        instance._ledger_changed = {
+            'largura': old['largura_padrao_mm'] != instance.largura_padrao_mm,
+            'unidade': old['unidade'] != instance.unidade,
+        }
+
+
+@receiver(post_save, sender=Material)
+def ledger_material_saved(sender, instance, **kwargs):
+    changed = getattr(instance, '_ledger_changed', None)
+    if not changed or not any(changed.values()):
+        return
+
+    # Fabric width feeds the row-yield of configs using this material
+    item_ids = set(
+        PedidoItem.objects.filter(configuracoes__material=instance).values_list('id', flat=True)
+    )
+
+    # The unit feeds the mm normalization of SKU BOM rows
+    if changed['unidade']:
+        sku_ids = set(ItensMaterial.objects.filter(material=instance).values_list('produto_id', flat=True))
+        sku_ids |= set(ProdutoInsumo.objects.filter(material=instance).values_list('produto_id', flat=True))
+        sku_ids |= set(ProdutoConsumo.objects.filter(material=instance).values_list('produto_id', flat=True))
+        item_ids |= set(PedidoItem.objects.filter(produto_id__in=sku_ids).values_list('id', flat=True))
+
+    rebuild_item_requirements(item_ids)
+
+
+@receiver(post_save, sender=MoldeDetalhe)
+def ledger_piece_saved(sender, instance, created, **kwargs):
+    if created:
+        return
+    # Geometry, qtd_padrao and rotacao_fixa feed the row-yield of configs
+    rebuild_item_requirements(
+        PedidoItem.objects.filter(configuracoes__molde_peca=instance).values_list('id', flat=True)
+    )
+
+
+@receiver(pecas_reimportadas)
+def ledger_pieces_reimported(sender, molde, updated=(), deleted=(), **kwargs):
+    # Diff re-imports write with bulk_update (no post_save). Configs of deleted
+    # pieces cascade away, but their BOM rows are SET_NULL'ed without signals,
+    # so the items of the molde's SKUs are rebuilt too.
+    piece_ids = list(updated) + list(deleted)
+    if not piece_ids:
+        return
+
+    with deferred_rebuild():
+        sku_ids = set(ItensMaterial.objects.filter(molde_detalhe_id__in=piece_ids).values_list('produto_id', flat=True))
+        if deleted:
+            sku_ids |= set(Produto.objects.filter(molde=molde).values_list('id', flat=True))
+        item_ids = set(
+            PedidoItem.objects.filter(configuracoes__molde_peca_id__in=piece_ids).values_list('id', flat=True)
+        )
+        item_ids |= set(PedidoItem.objects.filter(produto_id__in=sku_ids).values_list('id', flat=True))
+        rebuild_item_requirements(item_ids)
@@ -1,3 +1,374 @@
-from django.test import TestCase
+import importlib
+import io
+import json
+import math
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from encaixe.services.molde_importer import process_molde_json
+from inventory.models import Cor, Material
+from molds.models import Molde, MoldeDetalhe
+from products.models import Produto, ItensMaterial, ProdutoInsumo, ProdutoConsumo
+from sales.models import NecessidadeMaterial, Pedido, PedidoItem, PedidoConfig
+from sales.services.marker import nest_order_item
+from sales.services.material_calculator import (
+    get_material_requirements_for_orders,
+    get_material_requirements_for_orders_bulk,
+    iter_requirement_chunks,
+    reduce_requirements,
+    requirements_report,
+    MODE_ACCURATE,
+)
+from sales.services.requirements_ledger import get_material_requirements_from_ledger, rebuild_item_requirements
+from sales.services.row_yield import linear_mm
+from sales.services.width_sweep import width_sweep
+
+
+class MaterialRequirementsBulkTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.preto = Cor.objects.create(nome='Preto', hex_code='#000000')
+        cls.azul = Cor.objects.create(nome='Azul', hex_code='#0000ff')
+        cls.lona = Material.objects.create(nome='Lona', unidade='mt', eh_tecido=True, largura_padrao_mm=1400)
+        cls.nylon = Material.objects.create(nome='Nylon', unidade='mt', eh_tecido=True, largura_padrao_mm=1500)
+        cls.ziper = Material.objects.create(nome='Ziper', unidade='cm')
+        cls.botao = Material.objects.create(nome='Botao', unidade='un')
+
+        molde = Molde.objects.create(nome='Mochila')
+        cls.corpo = MoldeDetalhe.objects.create(
+            molde=molde, nome_original='Corpo', tipo_geom='poly', qtd_padrao=2,
+            geometria_json={'type': 'poly', 'pts': [
+                {'x': 0, 'y': 0}, {'x': 420, 'y': 0}, {'x': 380, 'y': 610}, {'x': 40, 'y': 610},
+            ]},
+        )
+        cls.fundo = MoldeDetalhe.objects.create(
+            molde=molde, nome_original='Fundo', tipo_geom='rect', rotacao_fixa=True,
+            geometria_json={'type': 'rect', 'halfW': 160, 'halfH': 75},
+        )
+
+        ref = Produto.objects.create(nome='Mochila', molde=molde, eh_padrao=True)
+        cls.sku_bom = Produto.objects.create(nome='Mochila', molde=molde, parent=ref, sku='MOC-PT')
+        ItensMaterial.objects.create(produto=cls.sku_bom, molde_detalhe=cls.corpo, material=cls.lona, cor=cls.preto, quantidade=0.85, tipo='tecido_padrao')
+        ItensMaterial.objects.create(produto=cls.sku_bom, molde_detalhe=cls.fundo, material=cls.nylon, cor=cls.preto, quantidade=0.2, tipo='tecido_padrao')
+        ItensMaterial.objects.create(produto=cls.sku_bom, material=cls.ziper, cor=cls.preto, quantidade=45, tipo='insumo')
+        ProdutoInsumo.objects.create(produto=cls.sku_bom, material=cls.botao, quantidade=4)
+
+        cls.sku_cache = Produto.objects.create(nome='Mochila', molde=molde, parent=ref, sku='MOC-AZ')
+        ItensMaterial.objects.create(produto=cls.sku_cache, molde_detalhe=cls.corpo, material=cls.lona, cor=cls.azul, quantidade=0.85, tipo='tecido_padrao')
+        ProdutoConsumo.objects.create(produto=cls.sku_cache, material=cls.lona, cor=cls.azul, consumo_total=0.9)
+        ProdutoInsumo.objects.create(produto=cls.sku_cache, material=cls.ziper, cor=cls.azul, quantidade=45)
+
+    def _create_orders(self, count):
+        orders = []
+        for n in range(count):
+            pedido = Pedido.objects.create(cliente=f'Cliente {n}')
+            PedidoItem.objects.create(pedido=pedido, molde=self.sku_bom.molde, produto=self.sku_bom, quantidade=10 + n)
+            PedidoItem.objects.create(pedido=pedido, molde=self.sku_cache.molde, produto=self.sku_cache, quantidade=3 + n)
+
+            custom = PedidoItem.objects.create(pedido=pedido, molde=self.sku_bom.molde, produto=self.sku_bom, quantidade=7 + n)
+            PedidoConfig.objects.create(pedido_item=custom, molde_peca=self.corpo, material=self.nylon, cor=self.azul)
+            PedidoConfig.objects.create(pedido_item=custom, molde_peca=self.fundo, material=self.lona, cor=self.preto)
+            orders.append(pedido)
+        return orders
+
+    def _as_totals(self, report):
+        return {(m.id, c.id if c else None): data['qtd'] for (m, c), data in report.items()}
+
+    def test_bulk_matches_per_order_walk(self):
+        self._create_orders(4)
+        orders = Pedido.objects.filter(cliente__startswith='Cliente')
+
+        expected = get_material_requirements_for_orders(orders)
+        result = get_material_requirements_for_orders_bulk(orders)
+
+        self.assertEqual(self._as_totals(result), self._as_totals(expected))
+        self.assertEqual(len(result), 7)
+
+    def test_bulk_accepts_order_lists(self):
+        orders = self._create_orders(2)
+        self.assertEqual(
+            self._as_totals(get_material_requirements_for_orders_bulk(orders)),
+            self._as_totals(get_material_requirements_for_orders(orders)),
+        )
+
+    def test_bulk_query_count_is_independent_of_order_count(self):
+        self._create_orders(30)
+
+        # orders ids + items + configs + itens_material + insumos + consumos
+        with self.assertNumQueries(6):
+            get_material_requirements_for_orders_bulk(Pedido.objects.all())
+
+        # A plain list skips the id lookup
+        orders = list(Pedido.objects.all()[:3])
+        with self.assertNumQueries(5):
+            get_material_requirements_for_orders_bulk(orders)
+
+    def test_streaming_chunks_reduce_to_the_bulk_totals(self):
+        self._create_orders(5)
+        orders = Pedido.objects.all()
+
+        # 15 items in chunks of 4 -> 4 partial aggregates keyed by ids
+        partials = list(iter_requirement_chunks(orders, chunk_size=4))
+        self.assertEqual(len(partials), 4)
+        self.assertTrue(all(isinstance(m, int) for partial in partials for m, _ in partial))
+
+        totals = reduce_requirements(partials)
+        expected = self._as_totals(get_material_requirements_for_orders_bulk(orders))
+        self.assertEqual(totals.keys(), expected.keys())
+        for key, qtd in expected.items():
+            self.assertAlmostEqual(totals[key], qtd, places=6)
+
+        self.assertEqual(self._as_totals(requirements_report(totals)), totals)
+
+    def test_width_sweep_matches_row_yield(self):
+        orders = self._create_orders(2)
+        # Fabric counted in units: not a roll length, left out of the sweep
+        feltro = Material.objects.create(nome='Feltro', unidade='un', eh_tecido=True)
+        ItensMaterial.objects.create(produto=self.sku_bom, material=feltro, cor=self.preto, quantidade=2, tipo='tecido_padrao')
+        widths = [900, 1400, 1600]
+        sweep = width_sweep(Pedido.objects.filter(id__in=[o.id for o in orders]), widths)
+        rows = {(r['material'].id, r['cor'].id if r['cor'] else None): r for r in sweep['rows']}
+
+        # Nylon/Azul only comes from the custom configs: same as the calculator at the current width
+        estimate = self._as_totals(get_material_requirements_for_orders_bulk(orders))
+        nylon = rows[(self.nylon.id, self.azul.id)]
+        self.assertAlmostEqual(nylon['current_mm'], estimate[(self.nylon.id, self.azul.id)])
+        # Corpo 420 x 610, 2 per unit, custom items of 7 and 8 units
+        self.assertEqual(nylon['mm'], [
+            sum(linear_mm(420, 610, width, 2 * qty, False) for qty in (7, 8)) for width in widths
+        ])
+
+        # Every roll reports the calculator's figure, SKU rows included
+        # (ProdutoConsumo for MOC-AZ, the BOM quantity for MOC-PT)
+        self.assertEqual(set(rows), {k for k in estimate if k[0] in (self.lona.id, self.nylon.id)})
+        for key, row in rows.items():
+            self.assertAlmostEqual(row['current_mm'], estimate[key], msg=row['material'].nome)
+
+        response = self.client.get(reverse('api_fabric_width_sweep'), {
+            'pedidos': ','.join(str(o.id) for o in orders), 'larguras': '0.9, 1400,1600',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['larguras_mm'], widths)
+
+        response = self.client.post(reverse('purchase_width_sweep'), {'selected_orders': [o.id for o in orders]})
+        self.assertContains(response, 'Simulação de Larguras')
+
+    def _assert_ledger_in_sync(self, orders):
+        ledger = self._as_totals(get_material_requirements_from_ledger(orders))
+        expected = self._as_totals(get_material_requirements_for_orders(orders))
+        self.assertEqual(ledger.keys(), expected.keys())
+        for key, qtd in expected.items():
+            self.assertAlmostEqual(ledger[key], qtd, places=6)
+
+    def test_ledger_follows_order_changes(self):
+        orders = self._create_orders(3)
+        self._assert_ledger_in_sync(orders)
+
+        custom = PedidoConfig.objects.filter(pedido_item__pedido=orders[0]).first()
+        custom.cor = self.preto
+        custom.save()
+        self._assert_ledger_in_sync(orders)
+
+        custom.delete()
+        self._assert_ledger_in_sync(orders)
+
+        item = orders[1].itens.first()
+        item.quantidade = 50
+        item.save()
+        self._assert_ledger_in_sync(orders)
+
+        orders[2].delete()
+        self._assert_ledger_in_sync(orders[:2])
+
+    def test_ledger_follows_sku_and_material_changes(self):
+        orders = self._create_orders(2)
+
+        self.nylon.largura_padrao_mm = 900
+        self.nylon.save()
+        self._assert_ledger_in_sync(orders)
+
+        ProdutoInsumo.objects.create(produto=self.sku_bom, material=self.ziper, cor=self.azul, quantidade=12)
+        self._assert_ledger_in_sync(orders)
+
+        ItensMaterial.objects.filter(produto=self.sku_bom, tipo='insumo').delete()
+        self._assert_ledger_in_sync(orders)
+
+        self.sku_cache.delete()
+        self._assert_ledger_in_sync(orders)
+
+    def test_migration_fills_the_ledger_of_existing_items(self):
+        orders = self._create_orders(2)
+        NecessidadeMaterial.objects.all().delete()
+
+        migration = importlib.import_module('sales.migrations.0004_preencher_necessidades')
+        migration.preencher_necessidades(django_apps, None)
+        self._assert_ledger_in_sync(orders)
+
+    def test_failed_rebuild_keeps_the_previous_rows(self):
+        orders = self._create_orders(1)
+        item = orders[0].itens.first()
+        before = NecessidadeMaterial.objects.filter(pedido_item=item).count()
+        self.assertGreater(before, 0)
+
+        with mock.patch.object(NecessidadeMaterial.objects, 'bulk_create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                rebuild_item_requirements([item.id])
+        self.assertEqual(NecessidadeMaterial.objects.filter(pedido_item=item).count(), before)
+
+    def test_ledger_is_a_single_aggregate_query(self):
+        self._create_orders(10)
+        # aggregate + materials + colours
+        with self.assertNumQueries(3):
+            get_material_requirements_from_ledger(Pedido.objects.all())
+
+    def test_accurate_mode_nests_each_roll(self):
+        orders = self._create_orders(1)
+        estimate = self._as_totals(get_material_requirements_for_orders_bulk(orders))
+        accurate = self._as_totals(get_material_requirements_for_orders_bulk(orders, mode=MODE_ACCURATE))
+
+        # Non-fabric rows are not affected
+        self.assertEqual(accurate[(self.ziper.id, self.preto.id)], estimate[(self.ziper.id, self.preto.id)])
+        self.assertEqual(accurate[(self.botao.id, None)], estimate[(self.botao.id, None)])
+
+        # Custom item: 7 units x 2 Corpo (420 x 610) on Nylon 1500 mm -> 3 per row, 5 rows
+        self.assertEqual(accurate[(self.nylon.id, self.azul.id)], 5 * 610)
+
+        # Standard SKU: the BOM pieces are nested instead of the BOM quantity.
+        # Lona/Preto: 10 units x 2 Corpo on 1400 mm -> 3 per row, 7 rows;
+        # plus the custom item's 7 Fundo (320 x 150) -> 4 per row, 2 rows
+        self.assertEqual(accurate[(self.lona.id, self.preto.id)], 7 * 610 + 2 * 150)
+        # Nylon/Preto: 10 Fundo on 1500 mm -> 4 per row, 3 rows
+        self.assertEqual(accurate[(self.nylon.id, self.preto.id)], 3 * 150)
+
+
+class BenchmarkCalculatorTests(TestCase):
+
+    def test_smoke_run_is_rolled_back(self):
+        out = StringIO()
+        call_command('benchmark_calculator', sizes='10', repeat=1, moldes=2, json=True, stdout=out)
+
+        report = json.loads(out.getvalue())
+        results = report['runs'][0]['results']
+        self.assertEqual(report['runs'][0]['lines'], 10)
+        self.assertEqual(results['calculator_bulk']['queries'], 5)
+        self.assertIn('view_purchase_preview', results)
+        self.assertFalse(Pedido.objects.exists())
+
+
+class GeometryLodTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        # Densely sampled rounded panel (spline export)
+        step = 2 * math.pi / 600
+        pts = [{'x': round(300 + 300 * math.cos(i * step), 3), 'y': round(200 + 200 * math.sin(i * step), 3)} for i in range(600)]
+        molde = Molde.objects.create(nome='Painel')
+        cls.peca = MoldeDetalhe.objects.create(
+            molde=molde, nome_original='Painel', tipo_geom='poly', geometria_json={'type': 'poly', 'pts': pts},
+        )
+        cls.lona = Material.objects.create(nome='Lona', unidade='mt', eh_tecido=True, largura_padrao_mm=1400)
+        produto = Produto.objects.create(nome='Painel', molde=molde, sku='PAI')
+        ItensMaterial.objects.create(produto=produto, molde_detalhe=cls.peca, material=cls.lona, quantidade=1, tipo='tecido_padrao')
+        cls.item = PedidoItem.objects.create(pedido=Pedido.objects.create(cliente='LOD'), molde=molde, produto=produto, quantidade=2)
+
+    def test_levels_are_stored_on_save(self):
+        lods = self.peca.geometria_lod
+        counts = [len(lods[key]['pts']) for key in ('0.1', '0.5', '2')]
+        self.assertTrue(600 > counts[0] > counts[1] > counts[2])
+
+        self.assertEqual(len(self.peca.get_geometria_desenho()['pts']), 600)
+        self.assertEqual(len(self.peca.get_geometria_desenho(0.05)['pts']), 600)
+        self.assertEqual(self.peca.get_geometria_desenho(5), lods['2'])
+        self.assertEqual(self.peca.get_geometria_desenho(1), lods['0.5'])
+
+    def test_save_without_geometry_change_does_not_reindex(self):
+        peca = MoldeDetalhe.objects.get(id=self.peca.id)
+        peca.qtd_padrao = 3
+        with mock.patch('molds.models.index_fields') as index:
+            peca.save()
+            peca.save(update_fields=['geometria_json', 'qtd_padrao'])
+        index.assert_not_called()
+
+        peca.geometria_json = {'type': 'rect', 'halfW': 50, 'halfH': 20}
+        peca.save()
+        peca.refresh_from_db()
+        self.assertEqual((peca.largura_mm, peca.geometria_lod), (100, {}))
+
+    def test_visualize_page_embeds_no_geometry(self):
+        response = self.client.get(reverse('visualize_order', args=[self.item.id]), {'zoom': 0.5})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['zoom'], 0.5)
+        piece = json.loads(response.context['json_data'])['pieces'][0]
+        self.assertEqual((piece['name'], piece['qty']), ('Painel', 1))
+        self.assertNotIn('geom', piece)
+        self.assertNotIn('pts', piece)
+
+    def test_api_simplifies_outlines_but_not_the_nesting(self):
+        url = reverse('api_nest_item', args=[self.item.id])
+        full = self.client.get(url, {'engine': 'true_shape'}).json()
+        drawn = self.client.get(url, {'engine': 'true_shape', 'largura_px': 280}).json()
+
+        self.assertEqual(drawn['length_mm'], full['length_mm'])
+        level = self.peca.geometria_lod['2']['pts']
+        for full_p, drawn_p in zip(full['groups'][0]['placements'], drawn['groups'][0]['placements']):
+            self.assertEqual(len(full_p['pts']), 600)
+            # The stored level, placed like the full outline
+            self.assertEqual(len(drawn_p['pts']), len(level))
+            self.assertEqual((drawn_p['x'], drawn_p['y'], drawn_p['rotation']), (full_p['x'], full_p['y'], full_p['rotation']))
+            self.assertTrue(set(map(tuple, drawn_p['pts'])) <= set(map(tuple, full_p['pts'])))
+
+        self.assertEqual(self.client.get(url, {'zoom': 0}).status_code, 400)
+
+        with mock.patch('encaixe.services.geometry_kernel.simplify') as simplify:
+            self.client.get(url, {'engine': 'true_shape', 'zoom': 0.2})
+        simplify.assert_not_called()
+
+    @override_settings(ENCAIXE_NESTING_MAX_PLACEMENTS=5)
+    def test_api_caps_the_copies(self):
+        url = reverse('api_nest_item', args=[self.item.id])
+        with mock.patch('sales.services.marker.nest_pieces', return_value={}) as nest:
+            self.assertEqual(self.client.get(url, {'quantidade': 5}).status_code, 200)
+            response = self.client.get(url, {'quantidade': 6, 'engine': 'true_shape'})
+            with self.assertRaises(ValueError):
+                nest_order_item(self.item, quantity=1000000)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('max 5', response.json()['error'])
+        self.assertEqual(nest.call_count, 1)
+
+
+class ReimportLedgerTests(TestCase):
+
+    def _import(self, molde, half):
+        data = {'pieces': [{'id': 'p1', 'name': 'Painel', 'geom': {'type': 'rect', 'halfW': half, 'halfH': half}}]}
+        return process_molde_json(molde, file_stream=io.BytesIO(json.dumps(data).encode()))
+
+    def _ledger(self, pedido):
+        return {(m.id, c.id if c else None): d['qtd'] for (m, c), d in get_material_requirements_from_ledger([pedido]).items()}
+
+    def test_changed_geometry_rebuilds_the_ledger(self):
+        lona = Material.objects.create(nome='Lona', unidade='mt', eh_tecido=True, largura_padrao_mm=1400)
+        preto = Cor.objects.create(nome='Preto', hex_code='#000000')
+        molde = Molde.objects.create(nome='Painel')
+        self._import(molde, 100)
+        peca = molde.detalhes.get()
+
+        pedido = Pedido.objects.create(cliente='Reimport')
+        item = PedidoItem.objects.create(pedido=pedido, molde=molde, quantidade=10)
+        PedidoConfig.objects.create(pedido_item=item, molde_peca=peca, material=lona, cor=preto)
+        before = self._ledger(pedido)
+
+        result = self._import(molde, 300)
+
+        self.assertEqual(result['updated'], 1)
+        after = self._ledger(pedido)
+        self.assertNotEqual(after, before)
+        expected = {(m.id, c.id if c else None): d['qtd'] for (m, c), d in get_material_requirements_for_orders_bulk([pedido]).items()}
+        self.assertEqual(after, expected)
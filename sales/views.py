@@ -7,7 +7,9 @@ from inventory.models import Material, Cor
 from .forms import PedidoForm, PedidoItemFormSet
 
 from clients.models import Cliente
-from sales.services.material_calculator import get_material_requirements_for_orders
+from sales.services.material_calculator import get_material_requirements_for_orders_bulk, get_calc_mode
+from sales.services.requirements_ledger import deferred_rebuild
+from sales.services.marker import get_item_pieces, get_item_fabric_width
 
 def order_list(request):
     orders = Pedido.objects.all().order_by('-data').prefetch_related('itens')
@@ -81,20 +83,21 @@ def configure_order_item(request, item_id):
     cores = Cor.objects.all()
 
     if request.method == 'POST':
-        # Save configurations
-        for piece in pieces:
-            tecido_id = request.POST.get(f'tecido_{piece.id}')
-            cor_id = request.POST.get(f'cor_{piece.id}')
-            
-            if tecido_id and cor_id:
-                PedidoConfig.objects.update_or_create(
-                    pedido_item=item,
-                    molde_peca=piece,
-                    defaults={
-                        'material_id': tecido_id,
-                        'cor_id': cor_id
-                    }
-                )
+        # Save configurations (the requirements ledger is rebuilt once at the end)
+        with deferred_rebuild():
+            for piece in pieces:
+                tecido_id = request.POST.get(f'tecido_{piece.id}')
+                cor_id = request.POST.get(f'cor_{piece.id}')
+
+                if tecido_id and cor_id:
+                    PedidoConfig.objects.update_or_create(
+                        pedido_item=item,
+                        molde_peca=piece,
+                        defaults={
+                            'material_id': tecido_id,
+                            'cor_id': cor_id
+                        }
+                    )
         return redirect('visualize_order', item_id=item.id)
 
     # Load existing configs
@@ -119,90 +122,38 @@ def configure_order_item(request, item_id):
     }
     return render(request, 'sales/configure_order.html', context)
 
+VISUALIZE_ZOOM = 0.2  # px per mm (1px = 5mm)
+
+
 def visualize_order(request, item_id):
     item = get_object_or_404(PedidoItem, id=item_id)
-    configs = PedidoConfig.objects.filter(pedido_item=item)
-    
-    # Reconstruct logical "pieces" for the visualization from DB
-    pieces_data = []
 
-    if configs.exists():
-        # SCENARIO A: Custom Configuration (PedidoConfig)
-        for config in configs:
-            peca = config.molde_peca
-            geom = peca.geometria_json
-            
-            # Override name with DB name to be safe
-            geom['name'] = peca.nome_original
-            
-            pieces_data.append({
-                'name': peca.nome_original,
-                'qty': peca.qtd_padrao,
-                'geom': geom,
-                'color': config.cor.hex_code if config.cor else '#cccccc',
-                'color_name': config.cor.nome if config.cor else 'Padrão',
-                'fabric_name': config.material.nome if config.material else 'Indefinido',
-                'fabric_width': config.material.largura_padrao_mm if config.material else 1500
-            })
-            
-    elif item.produto:
-        # SCENARIO B: Standard SKU (Product)
-        sku = item.produto
-        molde = item.molde or sku.molde
-        
-        # 1. Map Piece -> Material/Color from ItensMaterial
-        # We need to find which material applies to which piece.
-        # ItensMaterial has a 'molde_detalhe' FK.
-        sku_materials_map = {}
-        for im in sku.itens_material.all():
-            if im.molde_detalhe:
-                sku_materials_map[im.molde_detalhe.id] = im
-        
-        # 2. Iterate all pieces of the mold
-        for peca in molde.detalhes.all():
-            # Find material for this piece
-            im = sku_materials_map.get(peca.id)
-            
-            material = im.material if im else None
-            cor = im.cor if im else None
-            
-            # If no specific mapping, maybe use a default or skip?
-            # For visualization, better to show it in grey than hide it.
-            
-            geom = peca.geometria_json
-            geom['name'] = peca.nome_original
-            
-            pieces_data.append({
-                'name': peca.nome_original,
-                'qty': peca.qtd_padrao,
-                'geom': geom,
-                'color': cor.hex_code if cor else '#e2e8f0',
-                'color_name': cor.nome if cor else 'Padrão',
-                'fabric_name': material.nome if material else 'Tecido Base',
-                'fabric_width': material.largura_padrao_mm if material and material.largura_padrao_mm else 1500
-            })
+    try:
+        zoom = float(request.GET.get('zoom', VISUALIZE_ZOOM))
+    except ValueError:
+        zoom = VISUALIZE_ZOOM
+    if zoom <= 0:
+        zoom = VISUALIZE_ZOOM
 
-    # Prepare data structure expected by visualize.html (similar to teste.json)
-    json_data = {'pieces': pieces_data}
-    
-    # Use the first configured fabric width as default
-    default_width = 1500
-    if configs.exists():
-        default_width = configs.first().material.largura_padrao_mm
+    # The page only needs names and quantities: the nesting (with the outlines
+    # at the level of detail of the zoom) comes from api_nest_item
+    json_data = {'pieces': get_item_pieces(item, include_geometry=False)}
 
-    fabric_width = int(request.GET.get('width', default_width))
+    fabric_width = int(request.GET.get('width', get_item_fabric_width(item)))
 
     context = {
         'json_data': json.dumps(json_data),
         'quantity': item.quantidade,
         'fabric_width': fabric_width,
+        'zoom': zoom,
         'order_item': item
     }
     return render(request, 'sales/visualize.html', context)
 
 def order_materials(request, order_id):
     order = get_object_or_404(Pedido, id=order_id)
-    report_data = get_material_requirements_for_orders([order])
+    mode = get_calc_mode(request.GET.get('mode'))
+    report_data = get_material_requirements_for_orders_bulk([order], mode=mode)
     
     # Format for template
     report_list = []
@@ -215,7 +166,7 @@ def order_materials(request, order_id):
         })
     
     report_list.sort(key=lambda x: x['material'].nome)
-    return render(request, 'sales/order_materials.html', {'order': order, 'report': report_list})
+    return render(request, 'sales/order_materials.html', {'order': order, 'report': report_list, 'mode': mode})
 
 def order_upsert(request, pk=None):
     if pk:
@@ -235,18 +186,19 @@ def order_upsert(request, pk=None):
             # Formset save commit=False to populate Molde and calculate total
             items = formset.save(commit=False)
             total_pedido = 0
-            for item in items:
-                item.pedido = created_order
-                if item.produto:
-                    # Auto-populate Molde from Product Reference
-                    item.molde = item.produto.parent.molde
-                
-                # Force subtotal calculation
-                if item.preco_unitario and item.quantidade:
-                    item.subtotal = item.preco_unitario * item.quantidade
-                
-                item.save()
-                total_pedido += item.subtotal
+            with deferred_rebuild():
+                for item in items:
+                    item.pedido = created_order
+                    if item.produto:
+                        # Auto-populate Molde from Product Reference
+                        item.molde = item.produto.parent.molde
+
+                    # Force subtotal calculation
+                    if item.preco_unitario and item.quantidade:
+                        item.subtotal = item.preco_unitario * item.quantidade
+
+                    item.save()
+                    total_pedido += item.subtotal
             
             # Save deleted instances and subtract from total if they were already saved
             for obj in formset.deleted_objects: